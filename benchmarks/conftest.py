@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Shared synthetic data and utilities for the gwdatafind benchmarks
+
+The benchmarks run offline, against synthetic O2-like lists of file URLs
+of between 1e3 and 1e6 entries. Each benchmark records the peak memory
+allocated by one call (measured with `tracemalloc`) in the
+``peak_memory`` field of its ``extra_info``, and fails if that exceeds a
+fixed budget of bytes per URL.
+
+Timings are only comparable on the same machine, so no results are
+kept in the repository. To check a change for regressions (requires
+`pytest-benchmark`), first record a baseline from the unchanged code::
+
+    python -m pytest benchmarks/ \\
+        --benchmark-storage=benchmarks/results --benchmark-save=baseline
+
+then run the benchmarks again with the change applied::
+
+    python -m pytest benchmarks/ \\
+        --benchmark-storage=benchmarks/results \\
+        --benchmark-compare --benchmark-compare-fail=mean:25%
+
+to compare against the most recent baseline saved for this machine in
+``benchmarks/results/`` (which is ignored by git).
+"""
+
+import gc
+import tracemalloc
+
+import pytest
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+#: the numbers of URLs to benchmark
+SIZES = (1000, 10000, 100000, 1000000)
+
+#: the number of timed rounds, by number of URLs
+ROUNDS = {1000: 50, 10000: 20, 100000: 5, 1000000: 2}
+
+_URLS = {}
+
+
+def synthetic_urls(nurls, gap=None):
+    """Return an O2-like list of contiguous 4096-second file URLs,
+    24 per directory
+
+    Parameters
+    ----------
+    nurls : `int`
+        the number of URLs to return
+
+    gap : `int`, optional
+        the index of a file to leave out, to make a gap
+    """
+    try:
+        urls = _URLS[nurls]
+    except KeyError:
+        urls = _URLS[nurls] = [
+            'file://localhost/cvmfs/gwosc.osgstorage.org/gwdata/O2/'
+            'strain.4k/frame.v1/L1/{0}/L-L1_GWOSC_O2_4KHZ_R1-{1}-4096.gwf'
+            .format(start // 100000 * 100000, start)
+            for start in range(1000000000, 1000000000 + nurls * 4096, 4096)]
+    if gap is not None:
+        return urls[:gap] + urls[gap+1:]
+    return urls
+
+
+def span(nurls):
+    """Return the GPS ``(start, end)`` covered by `synthetic_urls`
+    """
+    return 1000000000, 1000000000 + nurls * 4096
+
+
+def peak_memory(func, *args, **kwargs):
+    """Return the peak memory (bytes) allocated by a function call
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.fixture(params=SIZES, ids='{0:.0e}'.format)
+def nurls(request):
+    """The number of URLs to benchmark with
+    """
+    return request.param
+
+
+@pytest.fixture
+def measure(benchmark, nurls):
+    """Benchmark a function, and check its peak memory usage
+
+    Call as ``measure(budget, func, *args, **kwargs)``, where ``budget``
+    is the allowed peak memory in bytes per URL.
+    """
+    def _measure(budget, func, *args, **kwargs):
+        peak = peak_memory(func, *args, **kwargs)
+        benchmark.extra_info['peak_memory'] = peak
+        benchmark.extra_info['peak_memory_per_url'] = peak / nurls
+        result = benchmark.pedantic(func, args=args, kwargs=kwargs,
+                                    rounds=ROUNDS[nurls], iterations=1)
+        # allow a fixed overhead (e.g. for buffers) for small inputs
+        assert peak <= budget * nurls + (8 << 20), (
+            "peak memory {0} bytes is over budget ({1} bytes per URL)".format(
+                peak, budget))
+        return result
+    return _measure
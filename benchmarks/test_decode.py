@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for decoding query responses, and checking them for gaps
+
+Run with ``python -m pytest benchmarks/test_decode.py``
+(requires `pytest-benchmark`).
+"""
+
+import json
+import warnings
+import zlib
+from io import BytesIO
+
+import pytest
+
+from gwdatafind.http import (HTTPConnection, _DecodedResponse)
+
+from conftest import (span, synthetic_urls)
+
+pytest.importorskip('pytest_benchmark')
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+#: peak memory budgets (bytes per URL)
+JSON_BUDGET = 450
+URLS_BUDGET = 400
+FIND_URLS_BUDGET = 800
+COMPACT_BUDGET = 100
+
+_BODIES = {}
+
+
+class _Response(object):
+    """A minimal stand-in for `http.client.HTTPResponse`
+    """
+    status = 200
+    reason = 'OK'
+
+    def __init__(self, body, encoding=None):
+        self.fp = BytesIO(body)
+        self.encoding = encoding
+
+    def getheader(self, name, default=None):
+        if name.lower() == 'content-encoding':
+            return self.encoding or default
+        return default
+
+    def read(self, amt=None):
+        return self.fp.read(amt)
+
+
+class _OfflineConnection(HTTPConnection):
+    """A connection that answers every request with the same body
+    """
+    def __init__(self, body, encoding=None):
+        HTTPConnection.__init__(self, host='localhost', port=80)
+        self.body = body
+        self.encoding = encoding
+
+    def _request_response(self, method, url, **kwargs):
+        return _DecodedResponse(_Response(self.body, self.encoding),
+                                connection=self)
+
+
+def _body(urls, encoding=None):
+    key = (len(urls), encoding)
+    try:
+        return _BODIES[key]
+    except KeyError:
+        body = json.dumps(urls).encode('utf-8')
+        if encoding == 'gzip':
+            obj = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = obj.compress(body) + obj.flush()
+        _BODIES[key] = body
+        return body
+
+
+@pytest.mark.parametrize('encoding', (None, 'gzip'))
+def test_get_json(measure, nurls, encoding):
+    urls = synthetic_urls(nurls)
+    connection = _OfflineConnection(_body(urls, encoding), encoding)
+    assert measure(JSON_BUDGET, connection.get_json, 'urls') == urls
+
+
+@pytest.mark.parametrize('encoding', (None, 'gzip'))
+def test_get_urls(measure, nurls, encoding):
+    urls = synthetic_urls(nurls)
+    connection = _OfflineConnection(_body(urls, encoding), encoding)
+    assert measure(URLS_BUDGET, connection.get_urls, 'urls') == urls
+
+
+@pytest.mark.parametrize('on_gaps', ('ignore', 'warn'))
+def test_find_urls(measure, nurls, on_gaps):
+    urls = synthetic_urls(nurls, gap=nurls // 2)
+    connection = _OfflineConnection(_body(urls))
+    start, end = span(nurls)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        result = measure(FIND_URLS_BUDGET, connection.find_urls,
+                         'L', 'L1_GWOSC_O2_4KHZ_R1', start, end,
+                         on_gaps=on_gaps)
+    assert result == urls
+
+
+def test_find_urls_compact(measure, nurls):
+    urls = synthetic_urls(nurls)
+    connection = _OfflineConnection(_body(urls))
+    start, end = span(nurls)
+    result = measure(COMPACT_BUDGET, connection.find_urls,
+                     'L', 'L1_GWOSC_O2_4KHZ_R1', start, end,
+                     on_gaps='error', compact=True)
+    assert len(result) == nurls
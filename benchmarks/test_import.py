@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for the time taken to import gwdatafind
+
+Run with ``python -m pytest benchmarks/test_import.py``
+(requires `pytest-benchmark`).
+For a breakdown by module, run ``python -X importtime -c 'import gwdatafind'``.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+@pytest.mark.parametrize('statement', (
+    'pass',  # baseline interpreter startup
+    'import gwdatafind',
+    'import gwdatafind.__main__',
+))
+def test_import(benchmark, statement):
+    benchmark.pedantic(
+        subprocess.check_call,
+        args=([sys.executable, '-c', statement],),
+        rounds=10,
+    )
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for indexing, and querying, a local tree of frame files
+
+Run with ``python -m pytest benchmarks/test_local.py``
+(requires `pytest-benchmark`).
+"""
+
+import os
+
+import pytest
+
+from gwdatafind import local
+
+from conftest import (span, synthetic_urls)
+
+pytest.importorskip('pytest_benchmark')
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+#: the number of (empty) files in the tree
+NFILES = 10000
+
+
+@pytest.fixture(scope='module')
+def root(tmpdir_factory):
+    tmpdir = tmpdir_factory.mktemp('frames')
+    prefix = 'file://localhost/cvmfs/'
+    for url in synthetic_urls(NFILES):
+        path = str(tmpdir.join(url[len(prefix):]))
+        try:
+            open(path, 'w').close()
+        except IOError:  # new directory
+            os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+    return str(tmpdir)
+
+
+@pytest.mark.parametrize('nthreads', (1, 8))
+def test_index(benchmark, root, nthreads):
+    index = benchmark.pedantic(
+        local._FileIndex, args=(root,), kwargs={'nthreads': nthreads},
+        rounds=5, iterations=1)
+    assert len(index.get('L', 'L1_GWOSC_O2_4KHZ_R1')) == NFILES
+
+
+def test_find_urls(benchmark, root):
+    conn = local.LocalConnection(root)
+    start, end = span(NFILES)
+    urls = benchmark(conn.find_urls, 'L', 'L1_GWOSC_O2_4KHZ_R1',
+                     start, end, on_gaps='error')
+    assert len(urls) == NFILES
+    local._INDEXES.clear()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for parsing LIGO-T050017 file names
+
+Run with ``python -m pytest benchmarks/test_metadata.py``
+(requires `pytest-benchmark`).
+"""
+
+import pytest
+
+from gwdatafind.utils import (
+    _missing_segments,
+    filename_metadata,
+    filename_metadata_array,
+)
+
+from conftest import (span, synthetic_urls)
+
+pytest.importorskip('pytest_benchmark')
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+#: peak memory budgets (bytes per URL)
+METADATA_BUDGET = 400
+METADATA_ARRAY_BUDGET = 600
+GAPS_BUDGET = 120
+
+
+def _parse_all(urls):
+    return [filename_metadata(url) for url in urls]
+
+
+def test_filename_metadata(measure, nurls):
+    urls = synthetic_urls(nurls)
+    assert len(measure(METADATA_BUDGET, _parse_all, urls)) == nurls
+
+
+def test_filename_metadata_array(measure, nurls):
+    urls = synthetic_urls(nurls)
+    starts = measure(METADATA_ARRAY_BUDGET, filename_metadata_array, urls)[3]
+    assert len(starts) == nurls
+
+
+def test_missing_segments(measure, nurls):
+    starts, durations = filename_metadata_array(
+        synthetic_urls(nurls, gap=nurls // 2))[3:]
+    missing = measure(GAPS_BUDGET, _missing_segments, starts, durations,
+                      *span(nurls))
+    assert len(missing) == 1
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for formatting the output of the command-line interface
+
+Run with ``python -m pytest benchmarks/test_output.py``
+(requires `pytest-benchmark`).
+"""
+
+import argparse
+import os
+
+import pytest
+
+from gwdatafind.__main__ import (
+    _CacheEntry,
+    _to_wcache,
+    postprocess_cache,
+)
+
+from conftest import synthetic_urls
+
+pytest.importorskip('pytest_benchmark')
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+#: peak memory budgets (bytes per URL)
+WCACHE_BUDGET = 250
+OUTPUT_BUDGET = {
+    None: 150,
+    'lal_cache': 150,
+    'names_only': 150,
+    'frame_cache': 400,
+}
+
+_CACHES = {}
+
+
+def _cache(nurls):
+    try:
+        return _CACHES[nurls]
+    except KeyError:
+        cache = _CACHES[nurls] = list(map(
+            _CacheEntry.from_url, synthetic_urls(nurls)))
+        return cache
+
+
+def test_to_wcache(measure, nurls):
+    cache = _cache(nurls)
+    # files are contiguous, so there should be one entry per directory
+    ndirs = len(set(entry.url.rsplit('/', 1)[0] for entry in cache))
+    assert len(measure(WCACHE_BUDGET, _to_wcache, cache)) == ndirs
+
+
+@pytest.mark.parametrize('fmt', sorted(OUTPUT_BUDGET, key=str))
+def test_postprocess_cache(measure, nurls, fmt):
+    urls = synthetic_urls(nurls)
+    args = argparse.Namespace(
+        type='L1_GWOSC_O2_4KHZ_R1',
+        lal_cache=False,
+        names_only=False,
+        frame_cache=False,
+        gaps=True,
+        gpsstart=1000000000,
+        gpsend=1000000000 + nurls * 4096,
+    )
+    if fmt:
+        setattr(args, fmt, True)
+    with open(os.devnull, 'w') as out:
+        assert not measure(OUTPUT_BUDGET[fmt], postprocess_cache,
+                           urls, args, out)  # no gaps
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""End-to-end benchmarks against a local stand-in LDR server
+
+These include the cost of the HTTP round trip (over the loopback
+interface), so are slower, and noisier, than the offline benchmarks.
+
+Run with ``python -m pytest benchmarks/test_server.py``
+(requires `pytest-benchmark`).
+"""
+
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+from gwdatafind.pool import ConnectionPool
+from gwdatafind.tests.server import (FrameIndex, LDRServer)
+
+pytest.importorskip('pytest_benchmark')
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+START = 1000000000
+
+#: the number of files in the server's index
+NFILES = 100000
+
+#: the simulated server latency for concurrency benchmarks (seconds)
+LATENCY = .01
+
+
+def _index():
+    return FrameIndex(start=START, end=START + NFILES * 4096, duration=4096)
+
+
+@pytest.fixture(scope='module')
+def server():
+    with LDRServer(_index()) as server_:
+        yield server_
+
+
+@pytest.fixture(scope='module')
+def slow_server():
+    with LDRServer(_index(), latency=LATENCY) as server_:
+        yield server_
+
+
+@pytest.mark.parametrize('nfiles', (1000, 10000, 100000),
+                         ids='{0:.0e}'.format)
+def test_find_urls(benchmark, server, nfiles):
+    conn = server.connection()
+    urls = benchmark.pedantic(
+        conn.find_urls, args=('H', 'H1_R', START, START + nfiles * 4096),
+        kwargs={'on_gaps': 'error'}, rounds=max(100000 // nfiles, 2),
+        iterations=1)
+    assert len(urls) == nfiles
+    conn.close()
+
+
+@pytest.mark.parametrize('keep_alive', (False, True),
+                         ids=('close', 'keep-alive'))
+def test_find_types(benchmark, server, keep_alive):
+    def _find_types(conn):
+        conn.find_types('H')
+        if not keep_alive:
+            conn.close()
+
+    conn = server.connection()
+    server.reset()
+    benchmark.pedantic(_find_types, args=(conn,), rounds=200, iterations=1)
+    conn.close()
+    benchmark.extra_info['connections'] = server.connections
+    assert server.connections == (1 if keep_alive else server.requests)
+
+
+@pytest.mark.parametrize('nthreads', (1, 4, 16))
+def test_find_urls_concurrent(benchmark, slow_server, nthreads):
+    pool = ConnectionPool(lambda host, port: slow_server.connection())
+    queries = [(START + i * 40960, START + (i + 1) * 40960)
+               for i in range(32)]
+
+    def _find_urls(segment):
+        with pool.connection() as conn:
+            return conn.find_urls('H', 'H1_R', *segment)
+
+    def _run():
+        threads = ThreadPool(nthreads)
+        try:
+            return threads.map(_find_urls, queries)
+        finally:
+            threads.close()
+            threads.join()
+
+    results = benchmark.pedantic(_run, rounds=5, iterations=1)
+    assert [len(urls) for urls in results] == [10] * len(queries)
+    pool.clear()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for writing, and querying, memory-mapped snapshots
+
+Run with ``python -m pytest benchmarks/test_snapshot.py``
+(requires `pytest-benchmark`).
+"""
+
+import os
+
+import pytest
+
+from gwdatafind.snapshot import (Snapshot, SnapshotConnection, _SNAPSHOTS,
+                                 write_snapshot)
+
+from conftest import (span, synthetic_urls)
+
+pytest.importorskip('pytest_benchmark')
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+#: peak memory budgets (bytes per URL)
+WRITE_BUDGET = 600
+FIND_URLS_BUDGET = 400
+
+#: the maximum size of a snapshot (bytes per URL)
+SIZE_BUDGET = 28
+
+FRAMETYPE = ('L', 'L1_GWOSC_O2_4KHZ_R1')
+
+
+@pytest.fixture
+def snapfile(tmpdir, nurls):
+    path = str(tmpdir.join('test.gwfsnap'))
+    write_snapshot(path, synthetic_urls(nurls))
+    yield path
+    _SNAPSHOTS.clear()
+
+
+def test_write_snapshot(measure, tmpdir, nurls):
+    path = str(tmpdir.join('test.gwfsnap'))
+    assert measure(WRITE_BUDGET, write_snapshot, path,
+                   synthetic_urls(nurls)) == nurls
+    assert os.path.getsize(path) <= SIZE_BUDGET * nurls + 4096
+
+
+def test_lookup(benchmark, snapfile, nurls):
+    # open the snapshot and find one file, as a job would
+    start = span(nurls)[0] + nurls // 2 * 4096
+
+    def _lookup():
+        with Snapshot(snapfile) as snap:
+            dataset = snap.get(*FRAMETYPE)
+            return [dataset.url(i) for i in dataset.select(start, start + 1)]
+
+    urls = benchmark(_lookup)
+    assert len(urls) == 1
+
+
+def test_find_urls(measure, snapfile, nurls):
+    conn = SnapshotConnection(snapfile)
+    start, end = span(nurls)
+    assert measure(FIND_URLS_BUDGET, conn.find_urls, FRAMETYPE[0],
+                   FRAMETYPE[1], start, end, on_gaps='error') == (
+        synthetic_urls(nurls))
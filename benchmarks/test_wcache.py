@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for the omega (frame) cache conversion
+
+Run with ``python -m pytest benchmarks/test_wcache.py``
+(requires `pytest-benchmark`).
+"""
+
+import os.path
+import random
+from operator import attrgetter
+
+import pytest
+
+from gwdatafind.__main__ import (
+    _CacheEntry,
+    _OmegaCacheEntry,
+    _to_wcache,
+)
+
+pytest.importorskip('pytest_benchmark')
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+NFILES = 100000
+
+
+def _to_wcache_legacy(cache):
+    """The original implementation of `_to_wcache`, for reference
+    """
+    wcache = []
+    wentry = None
+    for entry in sorted(
+            cache, key=attrgetter('obs', 'tag', 'segment')):
+        dir_ = os.path.dirname(entry.url)
+        if wcache and (
+                entry.obs == wentry.obs and
+                entry.tag == wentry.tag and
+                dir_ == wentry.url and
+                abs(entry.segment) == wentry.duration and
+                (entry.segment.connects(wentry.segment) or
+                 entry.segment.intersects(wentry.segment))
+        ):
+            wcache[-1] = wentry = _OmegaCacheEntry(
+                wentry.obs, wentry.tag, wentry.segment | entry.segment,
+                wentry.duration, wentry.url)
+        else:
+            wentry = _OmegaCacheEntry(entry.obs, entry.tag, entry.segment,
+                                      abs(entry.segment), dir_)
+            wcache.append(wentry)
+    return wcache
+
+
+def _cache(nfiles, shuffle=False):
+    """Build an O2-like cache of 4096-second files, 24 per directory
+    """
+    urls = [
+        'file://localhost/cvmfs/gwosc.osgstorage.org/gwdata/O2/strain.4k/'
+        'frame.v1/L1/{0}/L-L1_GWOSC_O2_4KHZ_R1-{1}-4096.gwf'.format(
+            start // 100000 * 100000, start)
+        for start in range(1000000000, 1000000000 + nfiles * 4096, 4096)]
+    if shuffle:
+        random.Random(0).shuffle(urls)
+    return list(map(_CacheEntry.from_url, urls))
+
+
+@pytest.mark.parametrize('shuffle', (False, True))
+@pytest.mark.parametrize('func', (_to_wcache, _to_wcache_legacy))
+def test_to_wcache(benchmark, func, shuffle):
+    cache = _cache(NFILES, shuffle=shuffle)
+    benchmark.group = 'to_wcache (shuffle={0})'.format(shuffle)
+    result = benchmark(func, cache)
+    assert result == _to_wcache_legacy(cache)
@@ -48,6 +48,8 @@ without a persistent question:
     find_url
     find_urls
     find_latest
+    find_urls_many
+    iter_urls
 
 For example:
 
@@ -57,6 +59,13 @@ For example:
 >>> print(urls)
 ['file://localhost/cvmfs/gwosc.osgstorage.org/gwdata/O2/strain.4k/frame.v1/L1/1186988032/L-L1_GWOSC_O2_4KHZ_R1-1187008512-4096.gwf']
 
+These functions share a pool of keep-alive connections (one per server),
+so repeated queries to the same host reuse the same (authenticated)
+connection rather than opening a new one each time.
+The time spent on each stage of their requests (connecting,
+waiting for the server, transferring, and decoding the response) is
+recorded, by endpoint, see :func:`connection_stats`.
+
 Additionally, one can manually open a connection using the
 :func:`connect` function, and then perform multiple queries.
 The :func:`connect` function will automatically select the correct protocol
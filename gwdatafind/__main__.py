@@ -26,14 +26,21 @@ import os.path
 import re
 import sys
 from collections import namedtuple
-from operator import (attrgetter, methodcaller)
+from itertools import islice
+from operator import (itemgetter, methodcaller)
 
 from six.moves.urllib.parse import urlparse
 
-from ligo import segments
-
 from . import (__version__, ui)
-from .utils import (get_default_host, filename_metadata)
+from .cache import ResponseCache
+from .utils import (
+    _int64_array,
+    _missing_segments,
+    filename_metadata,
+    filename_metadata_array,
+    get_default_host,
+    segments,
+)
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
 __credits__ = 'Scott Koranda, The LIGO Scientific Collaboration'
@@ -71,34 +78,115 @@ class _OmegaCacheEntry(namedtuple(
             self.obs, self.tag, self.segment, self.duration, self.url)
 
 
-def _to_wcache(cache):
-    """Convert a list of `_CacheEntry` into a list of `_OmegaCacheEntry`
+def _sort_cache_rows(rows):
+    """Sort ``(obs, tag, start, end, url)`` rows for `_iter_wcache`
+
+    The order is checked in a single pass that stops at the first row
+    that is out of order, rows that are already in order (the usual case
+    for query results) are returned as they are, without being copied.
+    """
+    if not isinstance(rows, list):
+        rows = list(rows)
+    key = itemgetter(0, 1, 2, 3)
+    last = None
+    for row in rows:
+        this = key(row)
+        if last is not None and this < last:
+            return sorted(rows, key=key)
+        last = this
+    return rows
+
+
+def _iter_wcache(rows):
+    """Convert a stream of cache rows into `_OmegaCacheEntry` objects
+
+    Parameters
+    ----------
+    rows : iterable of `tuple`
+        ``(obs, tag, start, end, url)`` tuples for each file, which must be
+        sorted by ``(obs, tag, start, end)``, see `_sort_cache_rows`
+
+    Yields
+    ------
+    entry : `_OmegaCacheEntry`
+        each omega cache entry, as soon as it is complete
     """
-    wcache = []
-    duration = 0
-    for entry in sorted(
-            cache, key=attrgetter('obs', 'tag', 'segment')):
-        dir_ = os.path.dirname(entry.url)
+    run = None
+    lasthead = dir_ = None
+    for obs, tag, start, end, url in rows:
+        # only call dirname when the directory changes
+        head = url[:url.rfind('/') + 1]
+        if head != lasthead:
+            lasthead, dir_ = head, os.path.dirname(url)
         # if this file has the same attributes, goes into the same directory,
         # has the same duration, and overlaps with or is contiguous with
-        # the last file, just add its segment to the last one:
-        if wcache and (
-                entry.obs == wentry.obs and
-                entry.tag == wentry.tag and
-                dir_ == wentry.url and
-                abs(entry.segment) == wentry.duration and
-                (entry.segment.connects(wentry.segment) or
-                 entry.segment.intersects(wentry.segment))
+        # the last file, just extend the current run:
+        if run is not None and (
+                obs == run[0] and
+                tag == run[1] and
+                dir_ == run[5] and
+                end - start == run[4] and
+                start <= run[3]
         ):
-            wcache[-1] = wentry = _OmegaCacheEntry(
-                wentry.obs, wentry.tag, wentry.segment | entry.segment,
-                wentry.duration, wentry.url)
-        # otherwise create a new entry in the omega wcache
-        else:
-            wentry = _OmegaCacheEntry(entry.obs, entry.tag, entry.segment,
-                                      abs(entry.segment), dir_)
-            wcache.append(wentry)
-    return wcache
+            if end > run[3]:
+                run[3] = end
+            continue
+        # otherwise emit the current run and start a new one
+        if run is not None:
+            yield _OmegaCacheEntry(run[0], run[1],
+                                   segments.segment(run[2], run[3]),
+                                   run[4], run[5])
+        run = [obs, tag, start, end, end - start, dir_]
+    if run is not None:
+        yield _OmegaCacheEntry(run[0], run[1],
+                               segments.segment(run[2], run[3]),
+                               run[4], run[5])
+
+
+def _to_wcache(cache):
+    """Convert a list of `_CacheEntry` into a list of `_OmegaCacheEntry`
+    """
+    return list(_iter_wcache(_sort_cache_rows(
+        (e.obs, e.tag, e.segment[0], e.segment[1], e.url) for e in cache)))
+
+
+# -- output -------------------------------------------------------------------
+
+#: number of cache entries to format and write at a time
+_WRITE_BATCH_SIZE = 10000
+
+#: size of the buffer (bytes) used when writing to an output file
+_OUTPUT_BUFFER_SIZE = 1 << 20
+
+
+def _iter_batches(iterable, size):
+    """Yield lists of (at most) ``size`` items from an iterable
+    """
+    iterable = iter(iterable)
+    while True:
+        batch = list(islice(iterable, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _url_path(url):
+    """Return the path of a URL, equivalent to ``urlparse(url).path``
+    """
+    # fast path for simple scheme://netloc/path URLs
+    i = url.find('://')
+    if (i > 0 and url[:i].isalpha() and
+            '?' not in url and '#' not in url and ';' not in url):
+        j = url.find('/', i + 3)
+        return url[j:] if j != -1 else ''
+    return urlparse(url).path
+
+
+def _write_lines(lines, out):
+    """Write a list of lines to a file with a single call
+    """
+    if lines:
+        out.write('\n'.join(lines) + '\n')
 
 
 # -- command line parsing -----------------------------------------------------
@@ -204,6 +292,13 @@ def command_line():
     sargs.add_argument('-P', '--no-proxy', action='store_true',
                        help='attempt to authenticate without a grid proxy '
                             '(default: %(default)s)')
+    sargs.add_argument('--no-cache', action='store_true', default=False,
+                       help='don\'t use the on-disk cache of observatory '
+                            'and type listings (default: %(default)s)')
+    sargs.add_argument('--refresh-cache', action='store_true', default=False,
+                       help='ignore cached observatory and type listings, '
+                            'and refresh the cache with the server response '
+                            '(default: %(default)s)')
 
     oargs = parser.add_argument_group(
         'Output options', 'Parameters for parsing and writing output.')
@@ -237,6 +332,14 @@ def command_line():
 
 # -- actions ------------------------------------------------------------------
 
+def _response_cache(args):
+    """Returns the `ResponseCache` to use for the parsed command-line options
+    """
+    if args.no_cache:
+        return None
+    return ResponseCache(refresh=args.refresh_cache)
+
+
 def ping(args, out):
     """Worker for the --ping option.
 
@@ -273,7 +376,8 @@ def show_observatories(args, out):
     exitcode : `int` or `None`
         the return value of the action or `None` to indicate success.
     """
-    sitelist = ui.find_observatories(host=args.server, match=args.match)
+    sitelist = ui.find_observatories(host=args.server, match=args.match,
+                                     cache=_response_cache(args))
     print("\n".join(sitelist), file=out)
 
 
@@ -294,7 +398,7 @@ def show_types(args, out):
         the return value of the action or `None` to indicate success.
     """
     typelist = ui.find_types(site=args.observatory, match=args.match,
-                             host=args.server)
+                             host=args.server, cache=_response_cache(args))
     print("\n".join(typelist), file=out)
 
 
@@ -384,10 +488,13 @@ def show_urls(args, out):
     exitcode : `int` or `None`
         the return value of the action or `None` to indicate success.
     """
-    cache = ui.find_urls(args.observatory, args.type,
-                         args.gpsstart, args.gpsend,
-                         match=args.match, urltype=args.url_type,
-                         host=args.server, on_gaps='ignore')
+    query = (args.observatory, args.type, args.gpsstart, args.gpsend)
+    kwargs = dict(match=args.match, urltype=args.url_type,
+                  host=args.server, on_gaps='ignore')
+    if args.frame_cache:  # needs all of the URLs before writing anything
+        cache = ui.find_urls(*query, **kwargs)
+    else:  # write the URLs while the results are still arriving
+        cache = ui.iter_urls(*query, **kwargs)
     return postprocess_cache(cache, args, out)
 
 
@@ -396,35 +503,52 @@ def postprocess_cache(urls, args, out):
 
     This function checks for gaps in the file coverage, prints the cache
     in the requested format, then prints gaps to stderr if requested.
+
+    ``urls`` can be any iterable (including a generator that yields URLs
+    as they are received), entries are formatted and written in batches of
+    ``_WRITE_BATCH_SIZE`` as they are consumed, except for the
+    ``--frame-cache`` format, which needs all of the URLs to be sorted.
     """
     # if searching for SFTs replace '.gwf' file suffix with '.sft'
-    if re.search(r'_\d+SFT(\Z|_)', str(args.type)):
-        gwfreg = re.compile(r'\.gwf\Z')
-        for i, url in enumerate(urls):
-            urls[i] = gwfreg.sub('.sft', url)
-
-    cache = list(map(_CacheEntry.from_url, urls))
-
-    # determine output format for a given URL
-    if args.lal_cache:
-        fmt = str
-    elif args.names_only:
-        def fmt(url):
-            return urlparse(url.url).path
-    elif args.frame_cache:
-        cache = _to_wcache(cache)
-        fmt = str
-    else:
-        fmt = attrgetter('url')
+    sft = re.search(r'_\d+SFT(\Z|_)', str(args.type))
+
+    starts = _int64_array()
+    durations = _int64_array()
+    rows = []
+    for batch in _iter_batches(urls, _WRITE_BATCH_SIZE):
+        if sft:
+            batch = [url[:-4] + '.sft' if url.endswith('.gwf') else url
+                     for url in batch]
+        obs, tags, codes, bstarts, bdurations = filename_metadata_array(batch)
+        starts.extend(bstarts)
+        durations.extend(bdurations)
+
+        # format this batch for the requested output
+        if args.frame_cache:  # can't write anything until we have it all
+            rows.extend((obs[i], tags[codes[i]], bstarts[i],
+                         bstarts[i] + bdurations[i], url)
+                        for i, url in enumerate(batch))
+            continue
+        if args.lal_cache:
+            lines = ['{0} {1} {2} {3} {4}'.format(
+                obs[i], tags[codes[i]], bstarts[i], bdurations[i], url)
+                for i, url in enumerate(batch)]
+        elif args.names_only:
+            lines = list(map(_url_path, batch))
+        else:
+            lines = batch
+        _write_lines(lines, out)
 
-    for entry in cache:
-        print(fmt(entry), file=out)
+    if args.frame_cache:
+        entries = (str(entry) for entry in
+                   _iter_wcache(_sort_cache_rows(rows)))
+        for lines in _iter_batches(entries, _WRITE_BATCH_SIZE):
+            _write_lines(lines, out)
 
     # check for gaps
     if args.gaps:
         span = segments.segment(args.gpsstart, args.gpsend)
-        seglist = segments.segmentlist(e.segment for e in cache).coalesce()
-        missing = (segments.segmentlist([span]) - seglist).coalesce()
+        missing = _missing_segments(starts, durations, *span)
         if missing:
             print("Missing segments:\n", file=sys.stderr)
             for seg in missing:
@@ -445,7 +569,7 @@ def main(args=None):
 
     # open output
     if opts.output_file:
-        out = open(opts.output_file, 'w')
+        out = open(opts.output_file, 'w', _OUTPUT_BUFFER_SIZE)
     else:
         out = sys.stdout
 
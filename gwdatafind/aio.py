@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Asynchronous (`asyncio`) connection utilities for the GW datafind service.
+
+This module provides the :class:`AsyncHTTPConnection` and
+:class:`AsyncHTTPSConnection` classes, whose query methods mirror those
+of :class:`gwdatafind.HTTPConnection` but are coroutines, so that many
+queries can be in flight at once without threads:
+
+>>> import asyncio
+>>> from gwdatafind import aio
+>>> async def main():
+...     async with aio.connect("datafind.ligo.org:443") as conn:
+...         return await asyncio.gather(*(
+...             conn.find_urls(ifo, "{}1_GWOSC_O2_4KHZ_R1".format(ifo),
+...                            1187008880, 1187008884)
+...             for ifo in ("H", "L", "V")))
+>>> asyncio.get_event_loop().run_until_complete(main())
+
+Each connection keeps a small number of keep-alive sockets open to its
+server (see the ``limit`` keyword) and distributes concurrent requests
+between them.
+
+This module requires Python >= 3.5.
+"""
+
+import asyncio
+import http.client
+import ssl
+from io import BytesIO
+from json import loads
+from urllib.error import HTTPError
+
+from .http import (
+    _filename_url,
+    _handle_gaps,
+    _latest_url,
+    _match,
+    _observatories_url,
+    _ping_url,
+    _segmentlist,
+    _sieve_urls,
+    _times_url,
+    _types_url,
+    _urls_url,
+)
+from .pool import HOST_HEALTH
+from .ui import _ssl_context
+from .utils import _split_hosts
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__all__ = [
+    'AsyncHTTPConnection',
+    'AsyncHTTPSConnection',
+    'connect',
+    'ping',
+    'find_observatories',
+    'find_types',
+    'find_times',
+    'find_url',
+    'find_urls',
+    'find_latest',
+]
+
+# errors indicating that the server closed a keep-alive connection
+_DROPPED_CONNECTION_ERRORS = (
+    ConnectionError,
+    asyncio.IncompleteReadError,
+    http.client.BadStatusLine,
+)
+
+
+def _select_host(host, port):
+    """Return the ``(host, port)`` of the healthiest of the given replicas
+    """
+    return HOST_HEALTH.rank(_split_hosts(host, port))[0]
+
+
+class _Response(object):
+    """The parsed response to a single HTTP request.
+    """
+    def __init__(self, status, reason, headers, body, will_close):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.will_close = will_close
+
+    def read(self):
+        return self.body
+
+
+async def _read_chunked(reader):
+    """Read a body sent with ``Transfer-Encoding: chunked``
+    """
+    parts = []
+    while True:
+        line = await reader.readline()
+        size = int(line.split(b';', 1)[0].strip(), 16)
+        if not size:
+            break
+        parts.append(await reader.readexactly(size))
+        await reader.readexactly(2)  # CRLF
+    # discard trailers
+    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+        pass
+    return b''.join(parts)
+
+
+class AsyncHTTPConnection(object):
+    """Connect to a GWDataFind host using HTTP, asynchronously.
+
+    Parameters
+    ----------
+    host : `str`, `list` of `str`
+        the name of the server with which to connect, if a list (or
+        comma-separated string) of replicas is given, the healthiest
+        one is used (requests are not failed over to the others).
+
+    port : `int`, optional
+        the port on which to connect.
+
+    timeout : `float`, optional
+        number of seconds to wait for each request to complete.
+
+    limit : `int`, optional
+        the maximum number of simultaneous connections (and so requests)
+        to open to the server.
+    """
+    default_port = 80
+
+    def __init__(self, host=None, port=None, timeout=None, limit=10):
+        """Create a new connection.
+        """
+        host, port = _select_host(host, port)
+        self.host = host
+        self.port = int(port or self.default_port)
+        self.timeout = timeout
+        self.limit = limit
+        self._loop = None
+        self._streams = []
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Close all open connections to the server.
+        """
+        streams, self._streams = self._streams, []
+        if self._loop is None or self._loop.is_closed():
+            return
+        for _, writer in streams:
+            writer.close()
+
+    # -- stream handling ------------------------
+
+    def _open_connection(self):
+        return asyncio.open_connection(self.host, self.port)
+
+    async def _acquire(self):
+        """Get an open stream to the server, waiting for one if needed
+
+        Returns ``(reader, writer, reused)``.
+        """
+        loop = asyncio.get_event_loop()
+        if loop is not self._loop:  # streams are bound to their event loop
+            self.close()
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.limit)
+        await self._semaphore.acquire()
+        while self._streams:
+            reader, writer = self._streams.pop()
+            if not reader.at_eof():
+                return reader, writer, True
+            writer.close()  # server hung up
+        try:
+            reader, writer = await self._open_connection()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return reader, writer, False
+
+    def _release(self, reader, writer, reuse=True):
+        if reuse:
+            self._streams.append((reader, writer))
+        else:
+            writer.close()
+        self._semaphore.release()
+
+    async def _exchange(self, reader, writer, method, url):
+        """Send a single request and read the full response
+        """
+        writer.write((
+            "{method} {url} HTTP/1.1\r\n"
+            "Host: {host}\r\n"
+            "Accept-Encoding: identity\r\n"
+            "\r\n"
+        ).format(
+            method=method,
+            url=url,
+            host=self.host if self.port == self.default_port else
+            "{0.host}:{0.port}".format(self),
+        ).encode('ascii'))
+        await writer.drain()
+
+        # parse status line
+        line = await reader.readline()
+        if not line:
+            raise http.client.RemoteDisconnected(
+                "Remote end closed connection without response")
+        try:
+            version, status, reason = (
+                line.decode('iso-8859-1').rstrip('\r\n').split(' ', 2) +
+                [''])[:3]
+            status = int(status)
+        except ValueError:
+            raise http.client.BadStatusLine(line)
+
+        # parse headers
+        lines = []
+        while True:
+            line = await reader.readline()
+            lines.append(line)
+            if line in (b'\r\n', b'\n', b''):
+                break
+        headers = http.client.parse_headers(BytesIO(b''.join(lines)))
+        will_close = (
+            headers.get('Connection', '').lower() == 'close' or
+            version == 'HTTP/1.0'
+        )
+
+        # read body
+        length = headers.get('Content-Length')
+        if method == 'HEAD' or status in (204, 304) or status < 200:
+            body = b''
+        elif headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = await _read_chunked(reader)
+        elif length is not None:
+            body = await reader.readexactly(int(length))
+        else:  # read until the server closes the connection
+            body = await reader.read()
+            will_close = True
+
+        return _Response(status, reason, headers, body, will_close)
+
+    async def _request_response(self, method, url):
+        """Internal method to perform request and verify reponse.
+
+        Parameters
+        ----------
+        method : `str`
+            name of the method to use (e.g. ``'GET'``).
+
+        url : `str`
+            remote URL to query.
+
+        Returns
+        -------
+        response : `_Response`
+            reponse from server query
+
+        Raises
+        ------
+        urllib.error.HTTPError
+            if query is unsuccessful
+        """
+        reader, writer, reused = await self._acquire()
+        try:
+            try:
+                response = await asyncio.wait_for(
+                    self._exchange(reader, writer, method, url),
+                    self.timeout)
+            except _DROPPED_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                # the server hung up on our keep-alive connection,
+                # so reconnect and try again (once)
+                writer.close()
+                reader, writer = await self._open_connection()
+                response = await asyncio.wait_for(
+                    self._exchange(reader, writer, method, url),
+                    self.timeout)
+        except BaseException:
+            self._release(reader, writer, reuse=False)
+            raise
+        self._release(reader, writer, reuse=not response.will_close)
+        if response.status != 200:
+            raise HTTPError(url, response.status, response.reason,
+                            response.headers, BytesIO(response.body))
+        return response
+
+    async def get_json(self, url):
+        """Perform a 'GET' request and return the decode the result as JSON
+
+        See :meth:`gwdatafind.HTTPConnection.get_json` for details.
+        """
+        response = await self._request_response('GET', url)
+        return loads(response.body.decode('utf-8'))
+
+    async def get_urls(self, url, scheme=None, on_missing='ignore'):
+        """Perform a 'GET' request and return a list of URLs.
+
+        See :meth:`gwdatafind.HTTPConnection.get_urls` for details.
+        """
+        urls = await self.get_json(url)
+        return _sieve_urls(urls, scheme=scheme, on_missing=on_missing)
+
+    # -- supported interactions -----------------
+
+    async def ping(self):
+        """Ping the LDR host to test for life.
+
+        See :meth:`gwdatafind.HTTPConnection.ping` for details.
+        """
+        await self._request_response("HEAD", _ping_url())
+        return 0
+
+    async def find_observatories(self, match=None):
+        """Query the LDR host for observatories.
+
+        See :meth:`gwdatafind.HTTPConnection.find_observatories` for details.
+        """
+        return _match(await self.get_json(_observatories_url()), match)
+
+    async def find_types(self, site=None, match=None):
+        """Query the LDR host for frame types.
+
+        See :meth:`gwdatafind.HTTPConnection.find_types` for details.
+        """
+        return _match(await self.get_json(_types_url(site)), match)
+
+    async def find_times(self, site, frametype, gpsstart=None, gpsend=None):
+        """Query the LDR for times for which files are avaliable.
+
+        See :meth:`gwdatafind.HTTPConnection.find_times` for details.
+        """
+        url = _times_url(site, frametype, gpsstart=gpsstart, gpsend=gpsend)
+        return _segmentlist(await self.get_json(url))
+
+    async def find_url(self, framefile, urltype='file', on_missing="error"):
+        """Query the LDR host for a single filename.
+
+        See :meth:`gwdatafind.HTTPConnection.find_url` for details.
+        """
+        return await self.get_urls(_filename_url(framefile), scheme=urltype,
+                                   on_missing=on_missing)
+
+    async def find_latest(self, site, frametype, urltype='file',
+                          on_missing="error"):
+        """Query for the most recent file of a given type.
+
+        See :meth:`gwdatafind.HTTPConnection.find_latest` for details.
+        """
+        url = _latest_url(site, frametype, urltype=urltype)
+        return await self.get_urls(url, scheme=urltype, on_missing=on_missing)
+
+    async def find_urls(self, site, frametype, gpsstart, gpsend,
+                        match=None, urltype='file', on_gaps="warn"):
+        """Find all files of the given type in the [start, end) GPS interval.
+
+        See :meth:`gwdatafind.HTTPConnection.find_urls` for details.
+        """
+        url = _urls_url(site, frametype, gpsstart, gpsend,
+                        match=match, urltype=urltype)
+        urls = await self.get_urls(url)
+        return _handle_gaps(urls, gpsstart, gpsend, on_gaps=on_gaps)
+
+
+class AsyncHTTPSConnection(AsyncHTTPConnection):
+    """Connect to a GWDataFind host using HTTPS, asynchronously.
+
+    This requires a valid X509 credential registered with the remote host.
+
+    Parameters
+    ----------
+    host : `str`
+        the name of the server with which to connect.
+
+    port : `int`, optional
+        the port on which to connect.
+
+    context : `ssl.SSLContext`, optional
+        the SSL context to use for connections
+
+    **kwargs
+        other keywords are passed directly to `AsyncHTTPConnection`
+    """
+    default_port = 443
+
+    def __init__(self, host=None, port=None, context=None, **kwargs):
+        """Create a new connection.
+        """
+        super(AsyncHTTPSConnection, self).__init__(
+            host=host, port=port, **kwargs)
+        if context is None:
+            context = ssl.create_default_context()
+        self.context = context
+
+    def _open_connection(self):
+        return asyncio.open_connection(self.host, self.port, ssl=self.context,
+                                       server_hostname=self.host)
+
+
+# -- user interface -----------------------------------------------------------
+
+def connect(host=None, port=None, **kwargs):
+    """Open a new asynchronous connection to a Datafind server
+
+    This is the `asyncio` equivalent of :func:`gwdatafind.connect`,
+    see that function for details.
+
+    Parameters
+    ----------
+    host : `str`, `list` of `str`, optional
+        the name of the datafind server to connect to; if not given will be
+        taken from the ``LIGO_DATAFIND_SERVER`` environment variable.
+        If a list (or comma-separated string) of replicas is given, the
+        healthiest one is used.
+
+    port : `int`, optional
+        the port on the server to use, if not given it will be stripped from
+        the ``host`` name.
+
+    **kwargs
+        other keywords are passed directly to `AsyncHTTPConnection`
+
+    Returns
+    -------
+    connection : `AsyncHTTPConnection` or `AsyncHTTPSConnection`
+        a new connection
+    """
+    host, port = _select_host(host, port)
+    if port not in (None, 80):
+        return AsyncHTTPSConnection(host=host, port=port,
+                                    context=_ssl_context(), **kwargs)
+    return AsyncHTTPConnection(host=host, port=port, **kwargs)
+
+
+def _ui_factory(target):
+    async def finder(*args, **kwargs):
+        connection = kwargs.pop('connection', None)
+        if connection:
+            return await getattr(connection, target)(*args, **kwargs)
+        kw = {key: kwargs.pop(key, None) for key in ('host', 'port')}
+        async with connect(**kw) as connection:
+            return await getattr(connection, target)(*args, **kwargs)
+
+    finder.__name__ = target
+    finder.__doc__ = getattr(AsyncHTTPConnection, target).__doc__
+
+    return finder
+
+
+ping = _ui_factory('ping')
+find_observatories = _ui_factory('find_observatories')
+find_types = _ui_factory('find_types')
+find_times = _ui_factory('find_times')
+find_url = _ui_factory('find_url')
+find_urls = _ui_factory('find_urls')
+find_latest = _ui_factory('find_latest')
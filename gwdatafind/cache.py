@@ -0,0 +1,690 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Client-side caching of GW datafind query responses.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import warnings
+from bisect import bisect_left
+from collections import OrderedDict
+
+from .utils import (_LazyModule, file_segment, segments)
+
+sqlite3 = _LazyModule('sqlite3')
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__all__ = [
+    'DEFAULT_MEMORY_TTL',
+    'DEFAULT_TTL',
+    'MemoryCache',
+    'ResponseCache',
+    'SegmentCache',
+    'TLSSessionCache',
+    'endpoint',
+]
+
+#: default time-to-live (seconds) for cached responses, by endpoint,
+#: responses from endpoints not listed here are never cached
+DEFAULT_TTL = {
+    'observatories': 3600,
+    'types': 3600,
+}
+
+#: default time-to-live (seconds) for responses held by a `MemoryCache`,
+#: the short TTL for ``'latest'`` suits polling for new data online
+DEFAULT_MEMORY_TTL = {
+    'observatories': 3600,
+    'types': 3600,
+    'times': 60,
+    'url': 600,
+    'urls': 60,
+    'latest': 1,
+}
+
+# regular expressions to identify each endpoint from its URL
+_ENDPOINTS = [
+    ('observatories', re.compile(r'/gwf\.json\Z')),
+    ('types', re.compile(r'/gwf/[^/]+\.json\Z')),
+    ('times', re.compile(r'/segments(/[^/]+)?\.json\Z')),
+    ('latest', re.compile(r'/latest(/[^/]+)?\.json\Z')),
+    ('urls', re.compile(r'/\d+,\d+(/[^/]+)?\.json(\?.*)?\Z')),
+    ('url', re.compile(r'/gwf/[^/]+/[^/]+/[^/]+\.json\Z')),
+]
+
+
+def endpoint(url):
+    """Return the name of the datafind endpoint queried by a URL
+
+    Parameters
+    ----------
+    url : `str`
+        the URL (path) of a datafind query
+
+    Returns
+    -------
+    endpoint : `str`, `None`
+        one of ``'observatories'``, ``'types'``, ``'times'``, ``'latest'``,
+        ``'urls'``, or ``'url'``, or `None` if the URL isn't recognised
+
+    Examples
+    --------
+    >>> from gwdatafind.cache import endpoint
+    >>> endpoint('/LDR/services/data/v1/gwf/all.json')
+    'types'
+    """
+    for name, regex in _ENDPOINTS:
+        if regex.search(url):
+            return name
+
+
+_endpoint = endpoint  # so that MemoryCache.clear can use 'endpoint'
+
+
+def default_cache_dir():
+    """Returns the default directory for gwdatafind cache files
+
+    This is ``${XDG_CACHE_HOME}/gwdatafind``, with ``XDG_CACHE_HOME``
+    defaulting to ``~/.cache``.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'gwdatafind')
+
+
+class ResponseCache(object):
+    """A persistent on-disk cache of datafind query responses.
+
+    Responses are stored in an SQLite database keyed by host and request
+    URL, and expire after a time-to-live that depends on which endpoint
+    was queried.
+    The database can safely be shared by many processes on the same
+    machine.
+
+    Parameters
+    ----------
+    path : `str`, optional
+        the path of the SQLite database file, defaults to
+        ``responses.sqlite`` in :func:`default_cache_dir`.
+
+    ttl : `dict`, optional
+        ``(endpoint, seconds)`` pairs to override the :data:`DEFAULT_TTL`
+        for each endpoint, use `None` to disable caching of an endpoint
+
+    refresh : `bool`, optional
+        if `True`, ignore existing cache entries, but still store new
+        responses, i.e. refresh the cache
+
+    timeout : `float`, optional
+        the number of seconds to wait for another process to release
+        a lock on the database
+
+    Examples
+    --------
+    >>> from gwdatafind import (connect, ResponseCache)
+    >>> conn = connect(cache=ResponseCache())
+    >>> conn.find_types('L')  # queries the server
+    >>> conn.find_types('L')  # reads from the cache
+    """
+    def __init__(self, path=None, ttl=None, refresh=False, timeout=30.):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'responses.sqlite')
+        self.path = path
+        self.ttl = dict(DEFAULT_TTL)
+        self.ttl.update(ttl or {})
+        self.refresh = refresh
+        self.timeout = timeout
+        self._initialised = False
+        self._broken = False
+
+    def _connect(self):
+        """Open a new connection to the database, creating it if needed
+        """
+        if not self._initialised:
+            dirname = os.path.dirname(self.path)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+        db = sqlite3.connect(self.path, timeout=self.timeout)
+        if not self._initialised:
+            with db:
+                try:  # write-ahead logging lets readers share with a writer
+                    db.execute("PRAGMA journal_mode=WAL")
+                except sqlite3.OperationalError:  # pragma: no-cover
+                    pass
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "host TEXT, url TEXT, created REAL, data TEXT, "
+                    "PRIMARY KEY (host, url))")
+            self._initialised = True
+        return db
+
+    def _execute(self, sql, params=()):
+        """Execute a statement and return all rows, or `None` on error
+
+        Problems with the database are reported once, after which the
+        cache is disabled, so that a broken cache never breaks a query.
+        """
+        if self._broken:
+            return None
+        try:
+            db = self._connect()
+            try:
+                with db:
+                    return db.execute(sql, params).fetchall()
+            finally:
+                db.close()
+        except (OSError, IOError, sqlite3.Error) as exc:
+            self._broken = True
+            warnings.warn("failed to access response cache {0!r}, caching "
+                          "disabled: {1}".format(self.path, exc))
+
+    def get(self, host, url):
+        """Return the cached response for a query
+
+        Parameters
+        ----------
+        host : `str`
+            the ``host:port`` of the server
+
+        url : `str`
+            the URL of the query
+
+        Returns
+        -------
+        data : `object`
+            the decoded JSON response
+
+        Raises
+        ------
+        KeyError
+            if there is no valid (unexpired) response in the cache
+        """
+        ttl = self.ttl.get(endpoint(url))
+        if ttl is None or self.refresh:
+            raise KeyError(url)
+        rows = self._execute(
+            "SELECT data FROM responses "
+            "WHERE host = ? AND url = ? AND created > ?",
+            (host, url, time.time() - ttl))
+        if not rows:
+            raise KeyError(url)
+        return json.loads(rows[0][0])
+
+    def set(self, host, url, data):
+        """Store the response for a query
+
+        Responses for endpoints without a TTL are ignored.
+
+        Parameters
+        ----------
+        host : `str`
+            the ``host:port`` of the server
+
+        url : `str`
+            the URL of the query
+
+        data : `object`
+            the decoded JSON response
+        """
+        if self.ttl.get(endpoint(url)) is None:
+            return
+        self._execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+            (host, url, time.time(), json.dumps(data)))
+
+    def clear(self, host=None):
+        """Remove cached responses
+
+        Parameters
+        ----------
+        host : `str`, optional
+            the ``host:port`` of the server whose responses to remove,
+            default is to remove everything
+        """
+        if host is None:
+            self._execute("DELETE FROM responses")
+        else:
+            self._execute("DELETE FROM responses WHERE host = ?", (host,))
+
+
+class MemoryCache(object):
+    """A bounded in-process cache of datafind query responses.
+
+    Responses are held in memory, keyed by host and request URL, and are
+    evicted when they are older than the time-to-live for their endpoint,
+    or when the cache is full (least-recently-used first).
+
+    Instances are thread-safe, and can be shared between connections.
+
+    Parameters
+    ----------
+    maxsize : `int`, optional
+        the maximum number of responses to hold
+
+    ttl : `dict`, optional
+        ``(endpoint, seconds)`` pairs to override the
+        :data:`DEFAULT_MEMORY_TTL` for each endpoint, use `None` to
+        disable caching of an endpoint
+
+    Attributes
+    ----------
+    hits : `int`
+        the number of queries answered from the cache
+
+    misses : `int`
+        the number of queries that weren't in the cache (or had expired)
+
+    Examples
+    --------
+    >>> from gwdatafind import connect
+    >>> from gwdatafind.cache import MemoryCache
+    >>> conn = connect(cache=MemoryCache(ttl={'latest': 4}))
+    >>> conn.find_latest('L', 'L1_llhoft')  # queries the server
+    >>> conn.find_latest('L', 'L1_llhoft')  # reads from the cache
+    >>> conn.cache.hits, conn.cache.misses
+    (1, 1)
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = dict(DEFAULT_MEMORY_TTL)
+        self.ttl.update(ttl or {})
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, host, url):
+        """Return the cached response for a query
+
+        Parameters
+        ----------
+        host : `str`
+            the ``host:port`` of the server
+
+        url : `str`
+            the URL of the query
+
+        Returns
+        -------
+        data : `object`
+            the decoded JSON response
+
+        Raises
+        ------
+        KeyError
+            if there is no valid (unexpired) response in the cache
+        """
+        key = (host, url)
+        with self._lock:
+            try:
+                expires, data = self._data[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            if expires <= time.time():
+                del self._data[key]
+                self.misses += 1
+                raise KeyError(url)
+            # mark as most-recently used
+            del self._data[key]
+            self._data[key] = (expires, data)
+            self.hits += 1
+        if isinstance(data, list):  # don't let callers modify the cache
+            return list(data)
+        return data
+
+    def set(self, host, url, data):
+        """Store the response for a query
+
+        Responses for endpoints without a TTL are ignored.
+
+        Parameters
+        ----------
+        host : `str`
+            the ``host:port`` of the server
+
+        url : `str`
+            the URL of the query
+
+        data : `object`
+            the decoded JSON response
+        """
+        ttl = self.ttl.get(endpoint(url))
+        if ttl is None or self.maxsize <= 0:
+            return
+        key = (host, url)
+        with self._lock:
+            self._data.pop(key, None)
+            while len(self._data) >= self.maxsize:
+                self._data.popitem(last=False)
+            self._data[key] = (time.time() + ttl, data)
+
+    def clear(self, host=None, endpoint=None):
+        """Invalidate cached responses
+
+        Parameters
+        ----------
+        host : `str`, optional
+            the ``host:port`` of the server whose responses to remove,
+            default is to match all hosts
+
+        endpoint : `str`, optional
+            the name of the endpoint whose responses to remove (see
+            :func:`endpoint`), default is to match all endpoints
+        """
+        with self._lock:
+            if host is None and endpoint is None:
+                self._data.clear()
+                return
+            for key in list(self._data):
+                if ((host is None or key[0] == host) and
+                        (endpoint is None or _endpoint(key[1]) == endpoint)):
+                    del self._data[key]
+
+
+#: the offset (seconds) between Unix and GPS time, including the 18 leap
+#: seconds added up to 2017
+_GPS_OFFSET = 315964800 - 18
+
+
+def _gps_now():
+    """Return the (approximate) current GPS time
+    """
+    return time.time() - _GPS_OFFSET
+
+
+class _SegmentCacheEntry(object):
+    """The cached URLs for a single query key
+    """
+    def __init__(self):
+        self.covered = segments.segmentlist()
+        self.expiring = []
+        self.files = {}
+        self.maxduration = 0
+        self._index = None
+
+    def add(self, seg, urls, expires=None):
+        for url in urls:
+            if url not in self.files:
+                fseg = self.files[url] = file_segment(url)
+                self.maxduration = max(self.maxduration, abs(fseg))
+                self._index = None
+        seg = segments.segment(seg)
+        if expires is None:
+            self.covered |= segments.segmentlist([seg])
+        else:
+            self.expiring.append((expires, seg))
+
+    def missing(self, span, now):
+        if self.expiring:  # forget recent intervals that have expired
+            self.expiring = [(expires, seg) for expires, seg in
+                             self.expiring if expires > now]
+        missing = span - self.covered
+        if self.expiring:
+            missing -= segments.segmentlist(
+                seg for _, seg in self.expiring).coalesce()
+        return missing.coalesce()
+
+    def get(self, start, end):
+        # build a time-ordered index of all files
+        if self._index is None:
+            self._index = sorted(
+                (seg[0], seg[1], url) for url, seg in self.files.items())
+        index = self._index
+        # files that overlap [start, end) must start in [start - max, end)
+        i = bisect_left(index, (start - self.maxduration,))
+        urls = []
+        for fstart, fend, url in index[i:]:
+            if fstart >= end:
+                break
+            if fend > start:
+                urls.append(url)
+        return urls
+
+
+class SegmentCache(object):
+    """An in-memory, incremental cache of `~HTTPConnection.find_urls` results.
+
+    For each ``(host, site, frametype, urltype, match)`` query key the cache
+    records the GPS intervals that have already been resolved, along with
+    the URLs found, so that a new query only needs to ask the server for
+    the parts of its interval that haven't been seen before.
+
+    Intervals that end close to the current GPS time may not yet include
+    all of the data that will eventually be available, so these are only
+    trusted for a short time, after which they are queried again.
+
+    Instances are thread-safe, and can be shared between connections.
+
+    Parameters
+    ----------
+    recent : `float`, optional
+        intervals that end less than this many seconds before the current
+        GPS time (or in the future) are only cached for ``ttl`` seconds,
+        give `None` to cache every interval forever
+
+    ttl : `float`, optional
+        the time-to-live (seconds) of recent intervals, give ``0`` to
+        never cache them
+
+    Examples
+    --------
+    >>> from gwdatafind import connect
+    >>> from gwdatafind.cache import SegmentCache
+    >>> conn = connect(segment_cache=SegmentCache())
+    >>> conn.find_urls("L", "L1_GWOSC_O2_4KHZ_R1", 1187008000, 1187009000)
+    >>> # only queries the server for [1187009000, 1187010000)
+    >>> conn.find_urls("L", "L1_GWOSC_O2_4KHZ_R1", 1187008500, 1187010000)
+    """
+    def __init__(self, recent=3600, ttl=60):
+        self.recent = recent
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def missing(self, key, start, end):
+        """Return the parts of ``[start, end)`` not yet resolved for a key
+
+        Parameters
+        ----------
+        key : `tuple`
+            the query key
+
+        start : `int`
+            the GPS start time of the query
+
+        end : `int`
+            the GPS end time of the query
+
+        Returns
+        -------
+        missing : `ligo.segments.segmentlist`
+            the list of intervals that must be queried from the server
+        """
+        span = segments.segmentlist([segments.segment(start, end)])
+        with self._lock:
+            try:
+                entry = self._entries[key]
+            except KeyError:
+                return span
+            return entry.missing(span, time.time())
+
+    def add(self, key, seg, urls):
+        """Record the URLs found for an interval
+
+        Parameters
+        ----------
+        key : `tuple`
+            the query key
+
+        seg : `tuple`
+            the ``[start, end)`` GPS interval that was queried
+
+        urls : `list` of `str`
+            the URLs returned by the server for that interval
+        """
+        expires = None
+        if self.recent is not None and seg[1] > _gps_now() - self.recent:
+            expires = time.time() + self.ttl
+        with self._lock:
+            try:
+                entry = self._entries[key]
+            except KeyError:
+                entry = self._entries[key] = _SegmentCacheEntry()
+            entry.add(seg, urls, expires=expires)
+
+    def get(self, key, start, end):
+        """Return the cached URLs for files that overlap an interval
+
+        Parameters
+        ----------
+        key : `tuple`
+            the query key
+
+        start : `int`
+            the GPS start time of the query
+
+        end : `int`
+            the GPS end time of the query
+
+        Returns
+        -------
+        urls : `list` of `str`
+            the list of URLs, ordered by GPS start time
+        """
+        with self._lock:
+            try:
+                entry = self._entries[key]
+            except KeyError:
+                return []
+            return entry.get(start, end)
+
+    def clear(self, key=None):
+        """Remove cached results
+
+        Parameters
+        ----------
+        key : `tuple`, optional
+            the query key to remove, default is to remove everything
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+# -- TLS sessions -------------------------------------------------------------
+
+class TLSSessionCache(object):
+    """A thread-safe store of TLS sessions, by host.
+
+    `~gwdatafind.HTTPSConnection` uses this to resume the TLS session of
+    a previous connection to the same server, which avoids repeating the
+    full handshake (including client certificate authentication) for
+    every new connection.
+
+    Attributes
+    ----------
+    full_handshakes : `int`
+        the number of connections that performed a full handshake
+
+    resumed_handshakes : `int`
+        the number of connections that resumed a stored session
+    """
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.full_handshakes = 0
+        self.resumed_handshakes = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, host, context):
+        """Return the stored session for a host, or `None`
+
+        Parameters
+        ----------
+        host : `str`
+            the ``host:port`` of the server
+
+        context : `ssl.SSLContext`
+            the context of the new connection, sessions can only be
+            resumed by the context that created them
+
+        Returns
+        -------
+        session : `ssl.SSLSession`, `None`
+            the session to resume, if any
+        """
+        with self._lock:
+            try:
+                stored, session = self._sessions[host]
+            except KeyError:
+                return None
+        if stored is context:
+            return session
+        return None
+
+    def set(self, host, context, session):
+        """Store the session for a host
+
+        Parameters
+        ----------
+        host : `str`
+            the ``host:port`` of the server
+
+        context : `ssl.SSLContext`
+            the context of the connection
+
+        session : `ssl.SSLSession`
+            the session to store
+        """
+        if session is None:
+            return
+        with self._lock:
+            self._sessions[host] = (context, session)
+
+    def record(self, resumed):
+        """Count a new handshake
+
+        Parameters
+        ----------
+        resumed : `bool`
+            whether the handshake resumed a stored session
+        """
+        with self._lock:
+            if resumed:
+                self.resumed_handshakes += 1
+            else:
+                self.full_handshakes += 1
+
+    def clear(self):
+        """Forget all stored sessions, and reset the counters
+        """
+        with self._lock:
+            self._sessions.clear()
+            self.full_handshakes = self.resumed_handshakes = 0
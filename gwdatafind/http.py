@@ -20,25 +20,481 @@
 
 from __future__ import (absolute_import, division)
 
+import codecs
 import os
 import re
 import socket
+import ssl
+import time
 import warnings
-from json import loads
+import zlib
+from io import BytesIO
+from json import (JSONDecoder, loads)
 
+from six import string_types
 from six.moves import http_client
 from six.moves.urllib.error import HTTPError
 from six.moves.urllib.parse import urlparse
 
-from ligo import segments
-
-from .utils import (get_default_host, file_segment)
+from .cache import (TLSSessionCache, endpoint as _endpoint)
+from .pool import HOST_HEALTH
+from .retry import (CircuitOpenError, _is_transient)
+from .stats import (ConnectionStats, _Stopwatch)
+from .urllist import URLList
+from .utils import (
+    _missing_segments,
+    _split_hosts,
+    file_segment,
+    filename_metadata_array,
+    get_default_host,
+    segments,
+)
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
 __all__ = ['DEFAULT_SERVICE_PREFIX', 'HTTPConnection', 'HTTPSConnection']
 
 DEFAULT_SERVICE_PREFIX = "/LDR/services/data/v1"
 
+# errors indicating that the server closed a keep-alive connection
+try:
+    _DROPPED_CONNECTION_ERRORS = (ConnectionError, http_client.BadStatusLine)
+except NameError:  # python < 3
+    _DROPPED_CONNECTION_ERRORS = (socket.error, http_client.BadStatusLine)
+
+
+# -- response decoding --------------------------------------------------------
+
+#: the content codings that the client asks the server to use
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class _DecodedResponse(object):
+    """Wrap an HTTP response to transparently decompress its body
+
+    The body is decompressed incrementally as it is read, so (like the
+    underlying response) this can be read in chunks.
+    All other attributes are those of the underlying response.
+
+    Parameters
+    ----------
+    response : `http.client.HTTPResponse`
+        the response to wrap
+
+    connection : `HTTPConnection`, optional
+        the connection whose byte counters (and
+        `~HTTPConnection.stats`) should be updated
+
+    endpoint : `str`, optional
+        the name of the endpoint queried, under which to record the
+        `~HTTPConnection.stats`
+    """
+    def __init__(self, response, connection=None, endpoint=None):
+        self.response = response
+        self.connection = connection
+        self.endpoint = endpoint
+        #: number of bytes of body received from the server
+        self.wire_bytes = 0
+        #: number of bytes of body after decompression
+        self.decoded_bytes = 0
+        self._buffer = b''
+        self._eof = False
+        self._head = b''
+        self._transfer = _Stopwatch()
+        self._decoder = None
+        self._coding = coding = (
+            response.getheader('Content-Encoding') or '').strip().lower()
+        if coding in ('gzip', 'x-gzip'):
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif coding not in ('', 'identity', 'deflate'):
+            raise ValueError("Unsupported Content-Encoding {0!r}".format(
+                coding))
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def _decode(self, raw):
+        if self._decoder is None:
+            # servers send both zlib-wrapped and raw 'deflate' streams,
+            # so look for a zlib header before creating the decoder
+            raw = self._head = self._head + raw
+            if len(raw) < 2:
+                return b''
+            cmf, flg = bytearray(raw[:2])
+            if cmf & 0x0f == 8 and (cmf << 8 | flg) % 31 == 0:
+                self._decoder = zlib.decompressobj(zlib.MAX_WBITS)
+            else:
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decoder.decompress(raw)
+
+    def _fill(self, amt=None):
+        while not self._eof and (amt is None or len(self._buffer) < amt):
+            with self._transfer:
+                raw = self.response.read() if amt is None else (
+                    self.response.read(amt))
+                data = self._decode(raw) if raw else b''
+                if amt is None or not raw:  # that's everything
+                    self._eof = True
+                    if self._decoder is not None:
+                        data += self._decoder.flush()
+            self._count(len(raw), len(data))
+            self._buffer += data
+
+    def _count(self, wire, decoded):
+        self.wire_bytes += wire
+        self.decoded_bytes += decoded
+        connection = self.connection
+        if connection is None:
+            return
+        connection.wire_bytes += wire
+        connection.decoded_bytes += decoded
+        stats = connection.stats
+        if wire:
+            stats.count(self.endpoint, 'bytes_received', wire)
+            stats.count(self.endpoint, 'bytes_decoded', decoded)
+        if self._eof:
+            stats.record(self.endpoint, 'transfer', self._transfer.elapsed)
+
+    def read(self, amt=None):
+        """Read (and decompress) the response body
+
+        Parameters
+        ----------
+        amt : `int`, optional
+            the (maximum) number of decompressed bytes to return,
+            default is to read everything
+
+        Returns
+        -------
+        data : `bytes`
+            the decompressed data, an empty string indicates the end
+            of the body
+        """
+        if self._coding in ('', 'identity'):  # nothing to decode
+            if self._eof:
+                return b''
+            with self._transfer:
+                data = self.response.read() if amt is None else (
+                    self.response.read(amt))
+            self._eof = amt is None or not data
+            self._count(len(data), len(data))
+            return data
+        self._fill(amt)
+        if amt is None:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+
+# -- JSON streaming -----------------------------------------------------------
+
+#: number of bytes to read from the server at a time when streaming
+STREAM_CHUNK_SIZE = 65536
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_JSON_ITEM_END = frozenset(' \t\n\r,]')
+
+# parser states for _iter_json_array
+_ARRAY_START, _ITEM_OR_END, _ITEM, _DELIM_OR_END = range(4)
+
+
+def _iter_json_array(fp, chunk_size=STREAM_CHUNK_SIZE, timer=None):
+    """Incrementally decode the items of a JSON array read from a file
+
+    Only one chunk of the input (plus the item being decoded) is held in
+    memory at any time.
+
+    Parameters
+    ----------
+    fp : `file`
+        the (binary) file object to read from, e.g. an HTTP response
+
+    chunk_size : `int`, optional
+        the number of bytes to read at a time
+
+    timer : `gwdatafind.stats._Stopwatch`, optional
+        a timer in which to accumulate the time spent decoding the input,
+        excluding the time spent reading it
+
+    Yields
+    ------
+    item : `object`
+        each item of the array, as decoded by :func:`json.loads`
+
+    Raises
+    ------
+    ValueError
+        if the input isn't a valid JSON array
+    """
+    decode = JSONDecoder().raw_decode
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    if timer is None:
+        timer = _Stopwatch()
+    state = _ARRAY_START
+    buf = ''
+    pos = 0
+    eof = False
+    bulk = False
+    while True:
+        # fast path: decode all of the complete items in the buffer
+        # (up to the last comma) with a single call to `json.loads`,
+        # if that fails (e.g. the comma is inside a string) fall back to
+        # decoding items one at a time until the next read
+        if bulk and state in (_ITEM_OR_END, _ITEM):
+            bulk = False
+            cut = buf.rfind(',', pos)
+            if cut != -1 and buf[pos:cut].strip():
+                try:
+                    with timer:
+                        items = loads('[' + buf[pos:cut] + ']')
+                except ValueError:
+                    pass
+                else:
+                    for item in items:
+                        yield item
+                    pos = cut + 1
+                    state = _ITEM
+                    continue
+
+        pos = _JSON_WHITESPACE.match(buf, pos).end()
+        if pos < len(buf):
+            char = buf[pos]
+            if state == _ARRAY_START:
+                if char != '[':
+                    raise ValueError("Expecting JSON array, got {0!r}".format(
+                        char))
+                pos += 1
+                state = _ITEM_OR_END
+                continue
+            if char == ']' and state != _ITEM:
+                return
+            if state == _DELIM_OR_END:
+                if char != ',':
+                    raise ValueError("Expecting ',' delimiter, got "
+                                     "{0!r}".format(char))
+                pos += 1
+                state = _ITEM
+                continue
+            try:
+                with timer:
+                    item, end = decode(buf, pos)
+            except ValueError:  # incomplete (or invalid) item
+                if eof:
+                    raise
+            else:
+                # an item that isn't followed by a delimiter might be
+                # incomplete (e.g. a number), so check again with more data
+                if eof or (end < len(buf) and buf[end] in _JSON_ITEM_END):
+                    yield item
+                    pos = end
+                    state = _DELIM_OR_END
+                    continue
+        elif eof:
+            raise ValueError("Unexpected end of JSON array")
+
+        # read some more data
+        chunk = fp.read(chunk_size)
+        eof = not chunk
+        with timer:
+            buf = buf[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+        bulk = True
+
+
+# -- query utilities ----------------------------------------------------------
+# these are shared by the synchronous connections defined here and the
+# asynchronous connections in :mod:`gwdatafind.aio`
+
+def _ping_url():
+    return '{prefix}/gwf/H/R/1,2'.format(prefix=DEFAULT_SERVICE_PREFIX)
+
+
+def _observatories_url():
+    return "%s/gwf.json" % DEFAULT_SERVICE_PREFIX
+
+
+def _types_url(site=None):
+    if site:
+        return "%s/gwf/%s.json" % (DEFAULT_SERVICE_PREFIX, site[0])
+    return "%s/gwf/all.json" % DEFAULT_SERVICE_PREFIX
+
+
+def _times_url(site, frametype, gpsstart=None, gpsend=None):
+    if gpsstart is not None and gpsend is not None:
+        return ("{prefix}/gwf/{site}/{type}/segments/"
+                "{start},{end}.json".format(
+                    prefix=DEFAULT_SERVICE_PREFIX, site=site,
+                    type=frametype, start=gpsstart, end=gpsend))
+    if gpsstart is not None or gpsend is not None:
+        raise ValueError("please give both `gpsstart` and `gpsend`")
+    return "{prefix}/gwf/{site}/{type}/segments.json".format(
+        prefix=DEFAULT_SERVICE_PREFIX, site=site, type=frametype)
+
+
+def _filename_url(framefile):
+    framefile = os.path.basename(framefile)
+
+    # parse file name for site, frame type (expects T050017)
+    site, frametype, _, _ = framefile.split("-")
+
+    return "{prefix}/gwf/{site}/{type}/{filename}.json".format(
+        prefix=DEFAULT_SERVICE_PREFIX, site=site, type=frametype,
+        filename=framefile)
+
+
+def _latest_url(site, frametype, urltype='file'):
+    return '{prefix}/gwf/{site}/{type}/latest{urltype}.json'.format(
+        prefix=DEFAULT_SERVICE_PREFIX, site=site, type=frametype,
+        urltype='/{0}'.format(urltype) if urltype else '',
+    )
+
+
+def _urls_url(site, frametype, gpsstart, gpsend, match=None, urltype='file'):
+    url = '{prefix}/gwf/{site}/{type}/{start},{end}{urltype}.json'.format(
+        prefix=DEFAULT_SERVICE_PREFIX, site=site, type=frametype,
+        start=gpsstart, end=gpsend,
+        urltype='/{0}'.format(urltype) if urltype else '',
+    )
+
+    # append a regex if input
+    if match:
+        url += "?match={0}".format(match)
+
+    return url
+
+
+def _match(names, match=None):
+    """Return the unique ``names`` that match the given regular expression
+    """
+    names = set(names)
+    if match:
+        regmatch = re.compile(match)
+        return [name for name in names if regmatch.search(name)]
+    return list(names)
+
+
+def _segmentlist(data):
+    """Convert a JSON list of ``[start, end]`` pairs into a `segmentlist`
+    """
+    return segments.segmentlist(map(segments.segment, data))
+
+
+def _handle_missing(on_missing='ignore'):
+    """Handle an empty list of URLs
+    """
+    err = "no files found"
+    if on_missing == 'warn':
+        warnings.warn(err)
+    elif on_missing != 'ignore':
+        raise RuntimeError(err)
+
+
+def _sieve_urls(urls, scheme=None, on_missing='ignore'):
+    """Filter a list of URLs by scheme, and handle an empty result
+    """
+    # sieve for correct file scheme
+    if scheme:
+        urls = list(filter(lambda e: urlparse(e).scheme == scheme, urls))
+
+    # handle empty result
+    if not urls:
+        _handle_missing(on_missing)
+
+    return urls
+
+
+def _iter_sieve_urls(urls, scheme=None, on_missing='ignore'):
+    """Filter a stream of URLs by scheme, and handle an empty result
+    """
+    found = False
+    for url in urls:
+        if scheme and urlparse(url).scheme != scheme:
+            continue
+        found = True
+        yield url
+    if not found:
+        _handle_missing(on_missing)
+
+
+def _report_gaps(missing, on_gaps="warn"):
+    """Warn or raise an error about missing segments
+    """
+    if not missing or on_gaps == "ignore":  # no gaps
+        return
+    msg = "Missing segments: \n%s" % "\n".join(map(str, missing))
+    if on_gaps == "warn":
+        warnings.warn(msg)
+        return
+    raise RuntimeError(msg)
+
+
+def _handle_gaps(urls, gpsstart, gpsend, on_gaps="warn"):
+    """Check that a list of URLs covers the ``[gpsstart, gpsend)`` interval
+    """
+    # ignore missing data
+    if on_gaps == "ignore":
+        return urls
+
+    # handle missing data
+    if isinstance(urls, URLList):  # use the runs, not every file
+        starts, durations = urls.coverage()
+    else:
+        starts, durations = filename_metadata_array(urls)[3:]
+    missing = _missing_segments(starts, durations, gpsstart, gpsend)
+    _report_gaps(missing, on_gaps=on_gaps)
+    return urls
+
+
+class _StreamingCoverage(object):
+    """Accumulate the GPS coverage of a stream of files
+
+    Files that overlap or abut the current contiguous run (the common case
+    for time-ordered results) just extend it, so memory use scales with
+    the number of gaps, not the number of files.
+    """
+    def __init__(self):
+        self._segments = segments.segmentlist()
+        self._run = None
+        self._ncoalesced = 0
+
+    def add(self, seg):
+        start, end = seg
+        run = self._run
+        if run is not None and run[0] <= start <= run[1]:
+            if end > run[1]:
+                run[1] = end
+            return
+        if run is not None:  # out of order, or a gap, so start a new run
+            self._segments.append(segments.segment(*run))
+            if len(self._segments) > 2 * self._ncoalesced + 1024:
+                self._segments.coalesce()
+                self._ncoalesced = len(self._segments)
+        self._run = [start, end]
+
+    def missing(self, gpsstart, gpsend):
+        """Return the `segmentlist` of gaps in ``[gpsstart, gpsend)``
+        """
+        covered = segments.segmentlist(self._segments)
+        if self._run is not None:
+            covered.append(segments.segment(*self._run))
+        span = segments.segmentlist([segments.segment(gpsstart, gpsend)])
+        return (span - covered.coalesce()).coalesce()
+
+
+def _select_host(host, port, hosts):
+    """Return the ``(host, port, hosts)`` for a new connection
+
+    If ``host`` names more than one replica, the best one is selected
+    """
+    if hosts is None:
+        if host is None:
+            host = get_default_host()
+        if not isinstance(host, string_types) or ',' in host:
+            hosts = _split_hosts(host, port)
+    if hosts and (host is None or len(hosts) > 1):
+        host, port = HOST_HEALTH.rank(hosts)[0]
+    return host, port, hosts
+
 
 class HTTPConnection(http_client.HTTPConnection):
     """Connect to a GWDataFind host using HTTP.
@@ -51,18 +507,83 @@ class HTTPConnection(http_client.HTTPConnection):
     port : `int`, optional
         the port on which to connect.
 
+    cache : `gwdatafind.cache.ResponseCache`, optional
+        a cache in which to look up (and store) query responses, see also
+        `gwdatafind.cache.MemoryCache`.
+
+    segment_cache : `gwdatafind.cache.SegmentCache`, optional
+        a cache of `find_urls` results, used to only query the server for
+        parts of a GPS interval that haven't been queried before.
+
+    retry : `gwdatafind.retry.RetryPolicy`, optional
+        how to retry requests that fail for transient reasons, by default
+        a failed request raises immediately.
+
+    hosts : `list` of `tuple`, optional
+        the ``(host, port)`` of each replica of this server, requests
+        that fail on one replica are sent to the next.
+
     **kwargs
         other keywords are passed directly to `http.client.HTTPConnection`
     """
+    #: the response cache for this connection, if any
+    cache = None
+
+    #: the incremental cache of `find_urls` results, if any
+    segment_cache = None
+
+    #: the policy for retrying failed requests, if any
+    retry = None
+
+    #: the ``(host, port)`` of replicas to fail over to, if any
+    hosts = None
+
+    #: the ``Accept-Encoding`` header to send, set to `None` to disable
+    #: compression of responses
+    accept_encoding = ACCEPT_ENCODING
+
+    #: total number of response body bytes received over this connection
+    wire_bytes = 0
+
+    #: total number of response body bytes after decompression
+    decoded_bytes = 0
+
+    #: the `~gwdatafind.stats.ConnectionStats` of requests made by this
+    #: connection, by endpoint
+    stats = None
+
+    # the endpoint of the current request, and the time spent
+    # (re)connecting during it
+    _request_endpoint = None
+    _connect_time = 0.
+
     def __init__(self, host=None, port=None,
                  timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None,
+                 cache=None, segment_cache=None, retry=None, hosts=None,
                  **kwargs):
         """Create a new connection.
         """
-        if host is None:
-            host = get_default_host()
+        host, port, hosts = _select_host(host, port, hosts)
         http_client.HTTPConnection.__init__(self, host, port, timeout,
                                             source_address, **kwargs)
+        self.cache = cache
+        self.segment_cache = segment_cache
+        self.retry = retry
+        self.hosts = hosts
+        self.stats = ConnectionStats()
+
+    def connect(self):
+        """Connect to the host, recording the time taken
+        """
+        with _Stopwatch() as timer:
+            http_client.HTTPConnection.connect(self)
+        self._record_connect('connect', timer.elapsed)
+
+    def _record_connect(self, name, elapsed):
+        self._connect_time += elapsed
+        if name == 'connect':
+            self.stats.count(self._request_endpoint, 'connections')
+        self.stats.record(self._request_endpoint, name, elapsed)
 
     def _request_response(self, method, url, **kwargs):
         """Internal method to perform request and verify reponse.
@@ -81,20 +602,120 @@ class HTTPConnection(http_client.HTTPConnection):
 
         Returns
         -------
-        response : `str`
-            reponse from server query
+        response : `http.client.HTTPResponse`
+            reponse from server query, whose body is decompressed
+            (as it is read) according to its ``Content-Encoding``
 
         Raises
         ------
         RuntimeError
             if query is unsuccessful
+
+        gwdatafind.retry.CircuitOpenError
+            if this connection has a `~HTTPConnection.retry` policy, and
+            the server has failed too many times recently
+
+        Notes
+        -----
+        If this connection has a `~HTTPConnection.retry` policy, requests
+        that fail for transient reasons (e.g. a ``503`` response, or a
+        connection reset) are retried after a backoff.
+
+        If this connection has more than one of `~HTTPConnection.hosts`,
+        each request is sent to the fastest healthy replica (according to
+        `gwdatafind.pool.HOST_HEALTH`), and is sent to the next replica if
+        it fails for a transient reason.
+
+        The time taken by each stage of the request is recorded in the
+        `~HTTPConnection.stats` of this connection.
+        """
+        self._request_endpoint = _endpoint(url)
+        if self.accept_encoding:
+            headers = dict(kwargs.pop('headers', None) or {})
+            headers.setdefault('Accept-Encoding', self.accept_encoding)
+            kwargs['headers'] = headers
+        if self.hosts and len(self.hosts) > 1:
+            return self._request_response_failover(method, url, **kwargs)
+        return self._request_response_retry(method, url, **kwargs)
+
+    def _request_response_failover(self, method, url, **kwargs):
+        """Perform a request on the best replica, failing over to the
+        others in turn
         """
-        self.request(method, url, **kwargs)
-        response = self.getresponse()
+        error = None
+        for host, port in HOST_HEALTH.rank(self.hosts):
+            if error is not None:
+                self.stats.count(self._request_endpoint, 'failovers')
+            if (host, port or self.default_port) != (self.host, self.port):
+                self.close()
+                self.host, self.port = host, port or self.default_port
+            start = time.time()
+            try:
+                response = self._request_response_retry(method, url, **kwargs)
+            except CircuitOpenError as exc:
+                # this replica is already known to be down (and wasn't
+                # contacted), so just move on to the next one
+                error = exc
+                continue
+            except Exception as exc:
+                if not _is_transient(exc):
+                    raise
+                HOST_HEALTH.failure((host, port))
+                error = exc
+                continue
+            HOST_HEALTH.success((host, port), time.time() - start)
+            return response
+        raise error
+
+    def _request_response_retry(self, method, url, **kwargs):
+        """Perform a request, retrying according to the retry policy
+        """
+        if self.retry is None:
+            return self._request_response_once(method, url, **kwargs)
+        return self.retry.call(
+            self._cache_host, method,
+            lambda: self._request_response_once(method, url, **kwargs),
+            reset=self._reset_retry)
+
+    def _reset_retry(self):
+        """Close the connection before retrying a request
+        """
+        self.stats.count(self._request_endpoint, 'retries')
+        self.close()
+
+    def _request_response_once(self, method, url, **kwargs):
+        """Perform a single request, reconnecting if the server dropped
+        our keep-alive connection
+        """
+        stats = self.stats
+        endpoint = self._request_endpoint
+        reused = self.sock is not None
+        self._connect_time = 0.
+        stats.count(endpoint, 'requests')
+        try:
+            with _Stopwatch() as timer:
+                try:
+                    self.request(method, url, **kwargs)
+                    response = self.getresponse()
+                except _DROPPED_CONNECTION_ERRORS:
+                    if not reused:
+                        raise
+                    # the server hung up on our keep-alive connection,
+                    # so reconnect and try again (once)
+                    self.close()
+                    self.request(method, url, **kwargs)
+                    response = self.getresponse()
+        except Exception:
+            stats.count(endpoint, 'errors')
+            raise
+        stats.record(endpoint, 'ttfb', timer.elapsed - self._connect_time)
         if response.status != 200:
+            stats.count(endpoint, 'errors')
+            # read the error body so that the connection can be reused
+            body = BytesIO(response.read())
             raise HTTPError(url, response.status, response.reason,
-                            response.getheaders(), response.fp)
-        return response
+                            response.getheaders(), body)
+        return _DecodedResponse(response, connection=self, endpoint=endpoint)
 
     def get_json(self, url, **kwargs):
         """Perform a 'GET' request and return the decode the result as JSON
@@ -112,11 +733,112 @@ class HTTPConnection(http_client.HTTPConnection):
         -------
         data : `object`
             JSON decoded using :func:`json.loads`
+
+        Notes
+        -----
+        If this connection has a `~HTTPConnection.cache`, an unexpired
+        cached response will be returned without querying the server.
         """
+        cache = self.cache
+        if cache is not None:
+            try:
+                data = cache.get(self._cache_host, url)
+            except KeyError:
+                pass
+            else:
+                self.stats.count(_endpoint(url), 'cache_hits')
+                return data
         response = self._request_response('GET', url, **kwargs).read()
-        if isinstance(response, bytes):
-            response = response.decode('utf-8')
-        return loads(response)
+        with _Stopwatch() as timer:
+            if isinstance(response, bytes):
+                response = response.decode('utf-8')
+            data = loads(response)
+        self.stats.record(self._request_endpoint, 'decode', timer.elapsed)
+        if cache is not None:
+            cache.set(self._cache_host, url, data)
+        return data
+
+    @property
+    def _cache_host(self):
+        """The ``host:port`` name used to key cached responses
+        """
+        return '{0.host}:{0.port}'.format(self)
+
+    def iter_json(self, url, **kwargs):
+        """Perform a 'GET' request and incrementally decode a JSON array
+
+        The response is read from the server in chunks of
+        `STREAM_CHUNK_SIZE` bytes, and each item of the array is yielded
+        as soon as it has been decoded.
+
+        If the returned generator is closed before it is exhausted, the
+        connection is closed (so that it can be reopened for the next
+        request).
+
+        Parameters
+        ----------
+        url : `str`
+            remote URL to query
+
+        **kwargs
+            other keyword arguments are passed to
+            :meth:`HTTPConnection._request_response`
+
+        Yields
+        ------
+        item : `object`
+            each item of the array, decoded using :func:`json.loads`
+        """
+        response = self._request_response('GET', url, **kwargs)
+        endpoint = self._request_endpoint
+        timer = _Stopwatch()
+        count = 0
+        done = False
+        try:
+            for count, item in enumerate(
+                    _iter_json_array(response, timer=timer), 1):
+                yield item
+            response.read()  # drain, so the socket can be reused
+            done = True
+        finally:
+            self.stats.record(endpoint, 'decode', timer.elapsed)
+            self.stats.count(endpoint, 'urls', count)
+            if not done:  # response is in an unknown state
+                self.close()
+
+    def stream_urls(self, url, scheme=None, on_missing='ignore', **kwargs):
+        """Perform a 'GET' request and yield URLs as they are received.
+
+        This is the streaming equivalent of :meth:`HTTPConnection.get_urls`,
+        the scheme filter is applied to each URL as it is decoded, and
+        ``on_missing`` is handled once the response has been consumed.
+
+        Parameters
+        ----------
+        url : `str`
+            remote URL to query
+
+        scheme : `str`, `None`, optional
+            the URL scheme to match, default: `None`
+
+        on_missing : `str`, optional
+            how to handle an empty (but successful) response, one of
+
+            - ``'ignore'``: do nothing
+            - ``'warn'``: print warning
+            - ``'raise'``: raise `RuntimeError`
+
+        **kwargs
+            other keyword arguments are passed to
+            :meth:`HTTPConnection.iter_json`
+
+        Yields
+        ------
+        url : `str`
+            each file path as returned from the server.
+        """
+        return _iter_sieve_urls(self.iter_json(url, **kwargs), scheme=scheme,
+                                on_missing=on_missing)
 
     def get_urls(self, url, scheme=None, on_missing='ignore', **kwargs):
         """Perform a 'GET' request and return a list of URLs.
@@ -138,28 +860,30 @@ class HTTPConnection(http_client.HTTPConnection):
 
         **kwargs
             other keyword arguments are passed to
-            :meth:`HTTPConnection.get_json`
+            :meth:`HTTPConnection.iter_json`
 
         Returns
         -------
         urls : `list` of `str`
             a list of file paths as returned from the server.
-        """
-        urls = self.get_json(url, **kwargs)
 
-        # sieve for correct file scheme
-        if scheme:
-            urls = list(filter(lambda e: urlparse(e).scheme == scheme, urls))
-
-        # handle empty result
-        if not urls:
-            err = "no files found"
-            if on_missing == 'warn':
-                warnings.warn(err)
-            elif on_missing != 'ignore':
-                raise RuntimeError(err)
-
-        return urls
+        Notes
+        -----
+        If this connection has a `~HTTPConnection.cache`, an unexpired
+        cached response will be used without querying the server.
+        """
+        cache = self.cache
+        if cache is None:
+            return list(self.stream_urls(url, scheme=scheme,
+                                         on_missing=on_missing, **kwargs))
+        try:
+            urls = cache.get(self._cache_host, url)
+        except KeyError:
+            urls = list(self.iter_json(url, **kwargs))
+            cache.set(self._cache_host, url, urls)
+        else:
+            self.stats.count(_endpoint(url), 'cache_hits')
+        return _sieve_urls(list(urls), scheme=scheme, on_missing=on_missing)
 
     # -- supported interactions -----------------
 
@@ -171,8 +895,9 @@ class HTTPConnection(http_client.HTTPConnection):
         RuntimeError
             if the ping fails
         """
-        url = '{prefix}/gwf/H/R/1,2'.format(prefix=DEFAULT_SERVICE_PREFIX)
-        self._request_response("HEAD", url)
+        url = _ping_url()
+        # read the (empty) response so that the connection can be reused
+        self._request_response("HEAD", url).read()
         return 0
 
     def find_observatories(self, match=None):
@@ -199,12 +924,8 @@ class HTTPConnection(http_client.HTTPConnection):
         >>> conn.find_observatories("H")
         ['H', 'HL', 'HLT']
         """
-        url = "%s/gwf.json" % DEFAULT_SERVICE_PREFIX
-        sitelist = set(self.get_json(url))
-        if match:
-            regmatch = re.compile(match)
-            return [site for site in sitelist if regmatch.search(site)]
-        return list(sitelist)
+        url = _observatories_url()
+        return _match(self.get_json(url), match)
 
     def find_types(self, site=None, match=None):
         """Query the LDR host for frame types.
@@ -239,15 +960,8 @@ class HTTPConnection(http_client.HTTPConnection):
          'RDS_R_L3',
          'TESTPEM_RDS_A6']
         """
-        if site:
-            url = "%s/gwf/%s.json" % (DEFAULT_SERVICE_PREFIX, site[0])
-        else:
-            url = "%s/gwf/all.json" % DEFAULT_SERVICE_PREFIX
-        typelist = set(self.get_json(url))
-        if match:
-            regmatch = re.compile(match)
-            return [type_ for type_ in typelist if regmatch.search(type_)]
-        return list(typelist)
+        url = _types_url(site)
+        return _match(self.get_json(url), match)
 
     def find_times(self, site, frametype, gpsstart=None, gpsend=None):
         """Query the LDR for times for which files are avaliable.
@@ -272,19 +986,8 @@ class HTTPConnection(http_client.HTTPConnection):
             the list of `[start, stop)` intervals for which files are
             available.
         """
-        if gpsstart is not None and gpsend is not None:
-            url = ("{prefix}/gwf/{site}/{type}/segments/"
-                   "{start},{end}.json".format(
-                       prefix=DEFAULT_SERVICE_PREFIX, site=site,
-                       type=frametype, start=gpsstart, end=gpsend))
-        elif gpsstart is not None or gpsend is not None:
-            raise ValueError("please give both `gpsstart` and `gpsend`")
-        else:
-            url = "{prefix}/gwf/{site}/{type}/segments.json".format(
-                prefix=DEFAULT_SERVICE_PREFIX, site=site, type=frametype)
-
-        segmentlist = self.get_json(url)
-        return segments.segmentlist(map(segments.segment, segmentlist))
+        url = _times_url(site, frametype, gpsstart=gpsstart, gpsend=gpsend)
+        return _segmentlist(self.get_json(url))
 
     def find_url(self, framefile, urltype='file', on_missing="error"):
         """Query the LDR host for a single filename.
@@ -310,15 +1013,7 @@ class HTTPConnection(http_client.HTTPConnection):
         urls : `list` of `str`
             a list of structured file paths for all instances of ``filename``.
         """
-        framefile = os.path.basename(framefile)
-
-        # parse file name for site, frame type (expects T050017)
-        site, frametype, _, _ = framefile.split("-")
-
-        # query
-        url = "{prefix}/gwf/{site}/{type}/{filename}.json".format(
-            prefix=DEFAULT_SERVICE_PREFIX, site=site, type=frametype,
-            filename=framefile)
+        url = _filename_url(framefile)
         return self.get_urls(url, scheme=urltype, on_missing=on_missing)
 
     def find_frame(self, *args, **kwargs):
@@ -360,14 +1055,11 @@ class HTTPConnection(http_client.HTTPConnection):
         RuntimeError
             if no frames are found
         """
-        url = '{prefix}/gwf/{site}/{type}/latest{urltype}.json'.format(
-            prefix=DEFAULT_SERVICE_PREFIX, site=site, type=frametype,
-            urltype='/{0}'.format(urltype) if urltype else '',
-        )
+        url = _latest_url(site, frametype, urltype=urltype)
         return self.get_urls(url, scheme=urltype, on_missing=on_missing)
 
     def find_urls(self, site, frametype, gpsstart, gpsend,
-                  match=None, urltype='file', on_gaps="warn"):
+                  match=None, urltype='file', on_gaps="warn", compact=False):
         """Find all files of the given type in the [start, end) GPS interval.
 
         site : `str`
@@ -396,41 +1088,110 @@ class HTTPConnection(http_client.HTTPConnection):
             - ``'error'``: raise a `RuntimeError`, or
             - ``'ignore'``: do nothing
 
+        compact : `bool`, optional
+            if `True` return the URLs as a `~gwdatafind.urllist.URLList`,
+            which uses much less memory than a `list` for large results
+
         Returns
         -------
-        cache : `list` of `str`
-            the list of discovered file URLs
+        cache : `list` of `str`, `~gwdatafind.urllist.URLList`
+            the list of discovered file URLs; if this connection has a
+            `~HTTPConnection.segment_cache` the list is sorted by GPS
+            start time
         """
-        url = '{prefix}/gwf/{site}/{type}/{start},{end}{urltype}.json'.format(
-            prefix=DEFAULT_SERVICE_PREFIX, site=site, type=frametype,
-            start=gpsstart, end=gpsend,
-            urltype='/{0}'.format(urltype) if urltype else '',
-        )
+        if self.segment_cache is not None:
+            urls = self._find_urls_incremental(
+                site, frametype, gpsstart, gpsend,
+                match=match, urltype=urltype)
+        else:
+            url = _urls_url(site, frametype, gpsstart, gpsend,
+                            match=match, urltype=urltype)
+            if compact and self.cache is None:  # never build the full list
+                urls = URLList(self.stream_urls(url))
+            else:
+                urls = self.get_urls(url)
+        if compact and not isinstance(urls, URLList):
+            urls = URLList(urls)
+        return _handle_gaps(urls, gpsstart, gpsend, on_gaps=on_gaps)
+
+    def _find_urls_incremental(self, site, frametype, gpsstart, gpsend,
+                               match=None, urltype='file'):
+        """Find URLs using the `segment_cache`, only querying the server
+        for those parts of the interval not already in the cache
+        """
+        cache = self.segment_cache
+        key = (self._cache_host, site, frametype, urltype,
+               getattr(match, 'pattern', match))
+        for start, end in cache.missing(key, gpsstart, gpsend):
+            url = _urls_url(site, frametype, start, end,
+                            match=match, urltype=urltype)
+            cache.add(key, (start, end), self.get_urls(url))
+        return cache.get(key, gpsstart, gpsend)
+
+    def iter_urls(self, site, frametype, gpsstart, gpsend,
+                  match=None, urltype='file', on_gaps="warn"):
+        """Iterate over files of the given type in the [start, end) interval.
+
+        This is the streaming equivalent of :meth:`HTTPConnection.find_urls`,
+        URLs are yielded as they are received from the server, and are
+        never held in memory all at once.
+        Gaps are accumulated as the URLs are yielded, and reported
+        (according to ``on_gaps``) once the query is exhausted.
+
+        Parameters
+        ----------
+        site : `str`
+            single-character name of site to match
+
+        frametype : `str`
+            name of frametype to match
+
+        gpsstart : `int`
+            integer GPS start time of query
+
+        gpsend : `int`
+            integer GPS end time of query
+
+        match : `str`, `re.Pattern`, optional
+            regular expression to match against
+
+        urltype : `str`, optional
+            file scheme to search for, one of 'file', 'gsiftp', or
+            `None`, default: 'file'
+
+        on_gaps : `str`, optional
+            what to do when the requested frame isn't found, one of:
 
-        # append a regex if input
-        if match:
-            url += "?match={0}".format(match)
+            - ``'warn'`` print a warning (default), or
+            - ``'error'``: raise a `RuntimeError`, or
+            - ``'ignore'``: do nothing
 
-        # make query
-        urls = self.get_urls(url)
+        Yields
+        ------
+        url : `str`
+            each discovered file URL
 
-        # ignore missing data
+        Examples
+        --------
+        >>> from gwdatafind import connect
+        >>> conn = connect()
+        >>> with open("cache.txt", "w") as cache:
+        ...     for url in conn.iter_urls("L", "L1_GWOSC_O2_4KHZ_R1",
+        ...                               1187008880, 1187008884):
+        ...         print(url, file=cache)
+        """
+        url = _urls_url(site, frametype, gpsstart, gpsend,
+                        match=match, urltype=urltype)
+        urls = self.stream_urls(url)
         if on_gaps == "ignore":
-            return urls
-
-        # handle missing data
-        span = segments.segment(gpsstart, gpsend)
-        seglist = segments.segmentlist(map(file_segment, urls)).coalesce()
-        missing = (segments.segmentlist([span]) - seglist).coalesce()
-        if not missing:  # no gaps
-            return urls
-
-        # warn or error on missing
-        msg = "Missing segments: \n%s" % "\n".join(map(str, missing))
-        if on_gaps == "warn":
-            warnings.warn(msg)
-            return urls
-        raise RuntimeError(msg)
+            for url in urls:
+                yield url
+            return
+        coverage = _StreamingCoverage()
+        for url in urls:
+            coverage.add(file_segment(url))
+            yield url
+        _report_gaps(coverage.missing(gpsstart, gpsend), on_gaps=on_gaps)
 
     def find_frame_urls(self, *args, **kwargs):
         """DEPRECATED, use :meth:`~HTTPConnection.find_urls` instead.
@@ -453,12 +1214,75 @@ class HTTPSConnection(http_client.HTTPSConnection, HTTPConnection):
     port : `int`, optional
         the port on which to connect.
 
+    cache : `gwdatafind.cache.ResponseCache`, optional
+        a cache in which to look up (and store) query responses, see also
+        `gwdatafind.cache.MemoryCache`.
+
+    segment_cache : `gwdatafind.cache.SegmentCache`, optional
+        a cache of `find_urls` results, used to only query the server for
+        parts of a GPS interval that haven't been queried before.
+
+    retry : `gwdatafind.retry.RetryPolicy`, optional
+        how to retry requests that fail for transient reasons, by default
+        a failed request raises immediately.
+
+    hosts : `list` of `tuple`, optional
+        the ``(host, port)`` of each replica of this server, requests
+        that fail on one replica are sent to the next.
+
     **kwargs
         other keywords are passed directly to `http.client.HTTPSConnection`
+
+    Notes
+    -----
+    The TLS session of each connection is stored in
+    `HTTPSConnection.tls_sessions` when it is closed (or reconnects), and
+    is resumed by the next connection to the same server, which then
+    performs an abbreviated handshake.
     """
-    def __init__(self, host=None, port=None, **kwargs):
+    #: the store of TLS sessions to resume, shared by all connections,
+    #: set to `None` to always perform a full handshake
+    tls_sessions = TLSSessionCache()
+
+    def __init__(self, host=None, port=None, cache=None, segment_cache=None,
+                 retry=None, hosts=None, **kwargs):
         """Create a new connection.
         """
-        if host is None:
-            host = get_default_host()
+        host, port, hosts = _select_host(host, port, hosts)
         http_client.HTTPSConnection.__init__(self, host, port=port, **kwargs)
+        self.cache = cache
+        self.segment_cache = segment_cache
+        self.retry = retry
+        self.hosts = hosts
+        self.stats = ConnectionStats()
+
+    def connect(self):
+        """Connect to the host, resuming a stored TLS session if possible
+        """
+        if not hasattr(ssl, 'SSLSession'):  # py < 3.6
+            return http_client.HTTPSConnection.connect(self)
+        HTTPConnection.connect(self)
+        sessions = self.tls_sessions
+        with _Stopwatch() as timer:
+            self.sock = self._context.wrap_socket(
+                self.sock,
+                server_hostname=self._tunnel_host or self.host,
+                session=None if sessions is None else sessions.get(
+                    self._cache_host, self._context),
+            )
+        self._record_connect('tls', timer.elapsed)
+        if sessions is not None:
+            sessions.record(self.sock.session_reused)
+        self._store_session()
+
+    def close(self):
+        """Close the connection, storing its TLS session for reuse
+        """
+        self._store_session()
+        http_client.HTTPSConnection.close(self)
+
+    def _store_session(self):
+        session = getattr(self.sock, 'session', None)
+        if (self.tls_sessions is not None and
+                isinstance(session, getattr(ssl, 'SSLSession', ()))):
+            self.tls_sessions.set(self._cache_host, self._context, session)
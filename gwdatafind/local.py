@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Answering datafind queries from a local tree of frame files.
+
+This module provides the `LocalConnection`, which has the same query
+methods as `~gwdatafind.HTTPConnection`, but answers them by scanning a
+directory tree (e.g. a CVMFS repository) for files that follow
+LIGO-T050017, rather than by asking a server.
+This is useful on compute nodes that have the data mounted, but no route
+to a datafind server.
+
+A `LocalConnection` is returned by :func:`gwdatafind.connect` (and used
+by all of the convenience functions) when the host is given as a
+``file://`` URL::
+
+    >>> from gwdatafind import find_urls
+    >>> urls = find_urls(
+    ...     "L", "L1_GWOSC_O2_4KHZ_R1", 1187008880, 1187008884,
+    ...     host="file:///cvmfs/gwosc.osgstorage.org/gwdata/O2/strain.4k")
+"""
+
+import os
+import re
+import threading
+from bisect import bisect_left
+
+try:
+    from os import scandir
+except ImportError:  # python < 3.5
+    class _DirEntry(object):
+        def __init__(self, directory, name):
+            self.name = name
+            self.path = os.path.join(directory, name)
+
+        def is_dir(self):
+            return os.path.isdir(self.path)
+
+    def scandir(path):
+        return [_DirEntry(path, name) for name in os.listdir(path)]
+
+from .http import (_match, _report_gaps, _sieve_urls)
+from .urllist import URLList
+from .utils import (
+    _int64_array,
+    _missing_segments,
+    filename_metadata,
+    filename_metadata_array,
+    segments,
+)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__all__ = ['LocalConnection']
+
+
+# -- scanning -----------------------------------------------------------------
+
+def _list_dir(path, extension):
+    """Return the sub-directories of, and matching file names in, a
+    directory
+    """
+    dirs = []
+    files = []
+    try:
+        entries = list(scandir(path))
+    except OSError:  # unreadable (or vanished) directory
+        return dirs, files
+    for entry in entries:
+        if entry.name.endswith(extension) and entry.name.count('-') == 3:
+            files.append(entry.path)
+        else:
+            try:
+                if entry.is_dir():
+                    dirs.append(entry.path)
+            except OSError:
+                pass
+    return dirs, files
+
+
+def _walk(top, extension):
+    """Return the paths of all matching files below a directory
+    """
+    files = []
+    pending = [top]
+    while pending:
+        dirs, dirfiles = _list_dir(pending.pop(), extension)
+        pending.extend(dirs)
+        files.extend(dirfiles)
+    return files
+
+
+def _scan(root, extension='.gwf', nthreads=8):
+    """Return the paths of all matching files below ``root``
+
+    The top of the tree is listed breadth-first until there are enough
+    sub-directories to keep ``nthreads`` threads busy, then each of those
+    is walked in its own thread.
+    """
+    files = []
+    pending = [root]
+    while pending and len(pending) < nthreads:
+        dirs = []
+        for path in pending:
+            subdirs, dirfiles = _list_dir(path, extension)
+            dirs.extend(subdirs)
+            files.extend(dirfiles)
+        pending = dirs
+    if not pending:
+        return files
+    if nthreads <= 1:
+        results = [_walk(path, extension) for path in pending]
+    else:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(nthreads, len(pending)))
+        try:
+            results = pool.map(lambda path: _walk(path, extension), pending)
+        finally:
+            pool.close()
+            pool.join()
+    for dirfiles in results:
+        files.extend(dirfiles)
+    return files
+
+
+def _parse(paths):
+    """Parse LIGO-T050017 metadata for a list of paths
+
+    Returns the ``(obs, tag, start, duration, path)`` of each path, paths
+    that don't follow the convention are skipped.
+    """
+    try:
+        obs, tags, codes, starts, durations = filename_metadata_array(paths)
+    except ValueError:  # at least one bad name, so parse one at a time
+        parsed = []
+        for path in paths:
+            try:
+                ob, tag, seg = filename_metadata(path)
+            except ValueError:
+                continue
+            parsed.append((ob, tag, seg[0], seg[1] - seg[0], path))
+        return parsed
+    return [(obs[i], tags[codes[i]], starts[i], durations[i], paths[i])
+            for i in range(len(paths))]
+
+
+class _Dataset(object):
+    """The files of a single type at a single observatory, sorted by
+    GPS start time
+
+    Subclasses must provide the ``starts`` and ``durations`` sequences,
+    ``max_duration``, ``schemes``, and the :meth:`url` method.
+    """
+    #: the URL schemes of the files in this dataset
+    schemes = ('file',)
+
+    def __init__(self, files):
+        files.sort()
+        self.starts = _int64_array([f[0] for f in files])
+        self.durations = _int64_array([f[1] for f in files])
+        self.paths = [f[2] for f in files]
+        self.max_duration = max(self.durations) if files else 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def url(self, index):
+        """Return the URL of the file at the given index
+        """
+        return 'file://localhost' + self.paths[index]
+
+    def select(self, gpsstart, gpsend):
+        """Return the indices of the files that overlap ``[gpsstart, gpsend)``
+        """
+        starts = self.starts
+        durations = self.durations
+        first = bisect_left(starts, gpsstart - self.max_duration)
+        last = bisect_left(starts, gpsend)
+        return [i for i in range(first, last) if
+                starts[i] + durations[i] > gpsstart]
+
+    def latest(self):
+        """Return the indices of the file(s) with the latest end time
+        """
+        starts = self.starts
+        durations = self.durations
+        latest = []
+        end = None
+        for i in range(len(self) - 1, -1, -1):
+            # stop once no earlier file could end any later
+            if end is not None and starts[i] + self.max_duration < end:
+                break
+            fileend = starts[i] + durations[i]
+            if end is None or fileend > end:
+                end, latest = fileend, [i]
+            elif fileend == end:
+                latest.insert(0, i)
+        return latest
+
+
+class _FileIndex(object):
+    """An index of the frame files below a directory
+    """
+    def __init__(self, root, extension='.gwf', nthreads=8):
+        bytype = {}
+        for obs, tag, start, duration, path in _parse(
+                _scan(root, extension=extension, nthreads=nthreads)):
+            bytype.setdefault((obs, tag), []).append((start, duration, path))
+        self.datasets = dict(
+            (key, _Dataset(files)) for key, files in bytype.items())
+
+    def get(self, site, frametype):
+        return self.datasets.get((site, frametype))
+
+
+_INDEXES = {}
+_INDEX_LOCK = threading.Lock()
+
+
+def _get_index(root, extension='.gwf', nthreads=8, refresh=False):
+    """Return the (shared) index of the frame files below ``root``
+    """
+    key = (root, extension)
+    with _INDEX_LOCK:
+        if refresh or key not in _INDEXES:
+            _INDEXES[key] = _FileIndex(root, extension=extension,
+                                       nthreads=nthreads)
+        return _INDEXES[key]
+
+
+# -- connection ---------------------------------------------------------------
+
+class LocalConnection(object):
+    """Answer datafind queries from a local tree of frame files
+
+    The tree below ``root`` is scanned (in parallel) the first time it is
+    queried, and the resulting index of files is shared by all
+    connections to the same ``root`` in this process.
+    Use :meth:`LocalConnection.refresh` to pick up files added since then.
+
+    The query methods match those of `~gwdatafind.HTTPConnection`, but
+    only ``file://`` URLs are returned.
+
+    Parameters
+    ----------
+    root : `str`
+        the path of the directory containing the frame files, files may
+        be at any depth below this directory
+
+    extension : `str`, optional
+        the file extension of the files to index
+
+    nthreads : `int`, optional
+        the number of threads to use to scan the directory tree
+
+    Examples
+    --------
+    >>> from gwdatafind.local import LocalConnection
+    >>> conn = LocalConnection('/cvmfs/gwosc.osgstorage.org/gwdata/O2')
+    >>> conn.find_urls('L', 'L1_GWOSC_O2_4KHZ_R1', 1187008880, 1187008884)
+    ['file://localhost/cvmfs/gwosc.osgstorage.org/gwdata/O2/strain.4k/frame.v1/L1/1186988032/L-L1_GWOSC_O2_4KHZ_R1-1187008512-4096.gwf']
+    """
+    #: local connections never have an open socket
+    sock = None
+
+    # accepted for compatibility with HTTPConnection, but not used
+    cache = None
+    segment_cache = None
+    retry = None
+
+    def __init__(self, root, extension='.gwf', nthreads=8):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.extension = extension
+        self.nthreads = nthreads
+
+    def __repr__(self):
+        return '<{0}({1!r})>'.format(type(self).__name__, self.root)
+
+    @property
+    def index(self):
+        """The index of files below `LocalConnection.root`
+        """
+        return _get_index(self.root, extension=self.extension,
+                          nthreads=self.nthreads)
+
+    def refresh(self):
+        """Re-scan the directory tree, for all connections to this root
+        """
+        _get_index(self.root, extension=self.extension,
+                   nthreads=self.nthreads, refresh=True)
+
+    def close(self):
+        """Close this connection (does nothing)
+        """
+        pass
+
+    def _urls(self, dataset, indices):
+        return list(map(dataset.url, indices))
+
+    # -- supported interactions -----------------
+
+    def ping(self):
+        """Check that the root directory can be read.
+
+        Raises
+        ------
+        RuntimeError
+            if the directory doesn't exist
+        """
+        if not os.path.isdir(self.root):
+            raise RuntimeError(
+                "{0} is not a readable directory".format(self.root))
+        return 0
+
+    def find_observatories(self, match=None):
+        """Find the observatories for which files exist.
+
+        See :meth:`gwdatafind.HTTPConnection.find_observatories`
+        """
+        return _match([obs for obs, _ in self.index.datasets], match)
+
+    def find_types(self, site=None, match=None):
+        """Find the frame types for which files exist.
+
+        See :meth:`gwdatafind.HTTPConnection.find_types`
+        """
+        return _match([tag for obs, tag in self.index.datasets if
+                       not site or obs == site[0]], match)
+
+    def find_times(self, site, frametype, gpsstart=None, gpsend=None):
+        """Find the times for which files of a given type exist.
+
+        See :meth:`gwdatafind.HTTPConnection.find_times`
+        """
+        if (gpsstart is None) != (gpsend is None):
+            raise ValueError("please give both `gpsstart` and `gpsend`")
+        dataset = self.index.get(site, frametype)
+        if not dataset:
+            return segments.segmentlist()
+        starts, durations = dataset.starts, dataset.durations
+        if gpsstart is None:
+            last = dataset.latest()[0]
+            gpsstart, gpsend = starts[0], starts[last] + durations[last]
+        else:
+            indices = dataset.select(gpsstart, gpsend)
+            starts = [starts[i] for i in indices]
+            durations = [durations[i] for i in indices]
+        span = segments.segmentlist([segments.segment(gpsstart, gpsend)])
+        return span - _missing_segments(starts, durations, gpsstart, gpsend)
+
+    def find_url(self, framefile, urltype='file', on_missing="error"):
+        """Find the URL of a single file.
+
+        See :meth:`gwdatafind.HTTPConnection.find_url`
+        """
+        name = os.path.basename(framefile)
+        site, frametype, seg = filename_metadata(name)
+        dataset = self.index.get(site, frametype)
+        urls = []
+        if dataset:
+            urls = [url for url in self._urls(
+                dataset, dataset.select(seg[0], seg[1])) if
+                url.endswith('/' + name)]
+        return _sieve_urls(urls, scheme=urltype, on_missing=on_missing)
+
+    def find_latest(self, site, frametype, urltype='file', on_missing="error"):
+        """Find the most recent file of a given type.
+
+        See :meth:`gwdatafind.HTTPConnection.find_latest`
+        """
+        dataset = self.index.get(site, frametype)
+        urls = []
+        if dataset:
+            urls = self._urls(dataset, dataset.latest())
+        return _sieve_urls(urls, scheme=urltype, on_missing=on_missing)
+
+    def _find(self, site, frametype, gpsstart, gpsend, match=None,
+              urltype='file'):
+        """Return the dataset and indices of the files matching a query
+        """
+        dataset = self.index.get(site, frametype)
+        if not dataset or (urltype and urltype not in dataset.schemes):
+            return dataset, []
+        indices = dataset.select(gpsstart, gpsend)
+        if urltype and len(dataset.schemes) > 1:
+            prefix = urltype + ':'
+            indices = [i for i in indices if
+                       dataset.url(i).startswith(prefix)]
+        if match:
+            regex = re.compile(match)
+            indices = [i for i in indices if regex.search(dataset.url(i))]
+        return dataset, indices
+
+    def _report_gaps(self, dataset, indices, gpsstart, gpsend, on_gaps):
+        if on_gaps == "ignore":
+            return
+        starts = durations = ()
+        if dataset:
+            starts = [dataset.starts[i] for i in indices]
+            durations = [dataset.durations[i] for i in indices]
+        _report_gaps(_missing_segments(starts, durations, gpsstart, gpsend),
+                     on_gaps=on_gaps)
+
+    def find_urls(self, site, frametype, gpsstart, gpsend,
+                  match=None, urltype='file', on_gaps="warn", compact=False):
+        """Find all files of the given type in the [start, end) GPS interval.
+
+        See :meth:`gwdatafind.HTTPConnection.find_urls`
+        """
+        dataset, indices = self._find(site, frametype, gpsstart, gpsend,
+                                      match=match, urltype=urltype)
+        urls = self._urls(dataset, indices) if indices else []
+        if compact:
+            urls = URLList(urls)
+        self._report_gaps(dataset, indices, gpsstart, gpsend, on_gaps)
+        return urls
+
+    def iter_urls(self, site, frametype, gpsstart, gpsend,
+                  match=None, urltype='file', on_gaps="warn"):
+        """Iterate over files of the given type in the [start, end) interval.
+
+        See :meth:`gwdatafind.HTTPConnection.iter_urls`
+        """
+        dataset, indices = self._find(site, frametype, gpsstart, gpsend,
+                                      match=match, urltype=urltype)
+        for i in indices:
+            yield dataset.url(i)
+        self._report_gaps(dataset, indices, gpsstart, gpsend, on_gaps)
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Keep-alive connection pooling for the GW datafind service.
+"""
+
+import select
+import threading
+import time
+from contextlib import contextmanager
+
+from .stats import ConnectionStats
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__all__ = ['ConnectionPool', 'HostHealth', 'HOST_HEALTH']
+
+
+def _is_dropped(connection):
+    """Returns `True` if the remote end has closed an idle connection.
+
+    An idle keep-alive socket should never be readable, so any pending
+    data (or EOF) means the server has hung up on us.
+    """
+    sock = connection.sock
+    if sock is None:  # not connected, will auto-connect on next request
+        return False
+    try:
+        readable = select.select([sock], [], [], 0)[0]
+    except (OSError, ValueError):  # socket already closed
+        return True
+    return bool(readable)
+
+
+class ConnectionPool(object):
+    """A thread-safe pool of reusable keep-alive connections.
+
+    Idle connections are stored per ``(host, port)`` and handed back
+    out (most-recently-used first) on the next request for that server,
+    so that only the first query to a host pays for a new TCP connection
+    (and TLS handshake).
+
+    Parameters
+    ----------
+    factory : `callable`
+        function to create a new connection, called as
+        ``factory(host=host, port=port)``.
+
+    maxsize : `int`, optional
+        maximum number of idle connections to keep per host; connections
+        released when the pool for their host is full are closed.
+
+    idle_timeout : `float`, optional
+        number of seconds after which an idle connection is discarded
+        rather than reused.
+
+    Attributes
+    ----------
+    stats : `gwdatafind.stats.ConnectionStats`
+        the request statistics of all connections created by this pool
+    """
+    def __init__(self, factory, maxsize=10, idle_timeout=60.):
+        self.factory = factory
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.stats = ConnectionStats()
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host=None, port=None):
+        """Get a connection to the given server from the pool.
+
+        If no usable idle connection is available, a new one is created.
+
+        Parameters
+        ----------
+        host : `str`
+            the name of the server
+
+        port : `int`, optional
+            the port on the server
+
+        Returns
+        -------
+        connection : `gwdatafind.HTTPConnection`
+            a connection, the caller is responsible for giving it back
+            via :meth:`ConnectionPool.release`
+        """
+        key = (host, port)
+        now = time.time()
+        while True:
+            with self._lock:
+                try:
+                    connection, last = self._idle.get(key, []).pop()
+                except IndexError:
+                    break
+            if now - last > self.idle_timeout or _is_dropped(connection):
+                connection.close()
+                continue
+            return connection
+        connection = self.factory(host=host, port=port)
+        stats = getattr(connection, 'stats', None)
+        if stats is not None and stats.parent is None:
+            stats.parent = self.stats
+        return connection
+
+    def release(self, connection, host=None, port=None):
+        """Return a connection to the pool for reuse.
+
+        Parameters
+        ----------
+        connection : `gwdatafind.HTTPConnection`
+            the connection to return
+
+        host : `str`
+            the name of the server, as given to :meth:`ConnectionPool.acquire`
+
+        port : `int`, optional
+            the port on the server, as given to
+            :meth:`ConnectionPool.acquire`
+        """
+        with self._lock:
+            idle = self._idle.setdefault((host, port), [])
+            if len(idle) < self.maxsize:
+                idle.append((connection, time.time()))
+                return
+        connection.close()
+
+    @contextmanager
+    def connection(self, host=None, port=None):
+        """Context manager to borrow a connection from the pool.
+
+        The connection is returned to the pool when the context exits
+        normally, or closed and discarded if an exception was raised.
+        """
+        connection = self.acquire(host=host, port=port)
+        try:
+            yield connection
+        except BaseException:
+            connection.close()
+            raise
+        self.release(connection, host=host, port=port)
+
+    def clear(self):
+        """Close all idle connections and empty the pool.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+
+class HostHealth(object):
+    """Track the latency and error rate of replicated servers.
+
+    Each host's response latency and error rate are tracked as
+    exponentially-weighted moving averages (EWMAs), which are used to
+    rank a set of replicas so that queries go to the fastest healthy
+    server.
+
+    Parameters
+    ----------
+    alpha : `float`, optional
+        the weight given to each new measurement in the moving averages
+
+    threshold : `float`, optional
+        the error rate above which a host is considered unhealthy, and
+        is only tried after all of the healthy hosts
+
+    recovery : `float`, optional
+        number of seconds after its last error after which an unhealthy
+        host is considered healthy again
+    """
+    def __init__(self, alpha=.3, threshold=.5, recovery=60.):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.recovery = recovery
+        self._latency = {}
+        self._errors = {}
+        self._last_error = {}
+        self._lock = threading.Lock()
+
+    def success(self, host, latency):
+        """Record a successful request to a host
+
+        Parameters
+        ----------
+        host : `tuple`
+            the ``(host, port)`` of the server
+
+        latency : `float`
+            the time (seconds) taken for the server to respond
+        """
+        alpha = self.alpha
+        with self._lock:
+            old = self._latency.get(host)
+            self._latency[host] = (
+                latency if old is None else old + alpha * (latency - old))
+            self._errors[host] = (1 - alpha) * self._errors.get(host, 0.)
+
+    def failure(self, host):
+        """Record a failed request to a host
+
+        Parameters
+        ----------
+        host : `tuple`
+            the ``(host, port)`` of the server
+        """
+        with self._lock:
+            errors = self._errors.get(host, 0.)
+            self._errors[host] = errors + self.alpha * (1 - errors)
+            self._last_error[host] = time.time()
+
+    def is_healthy(self, host):
+        """Returns `True` if the given host should be used
+        """
+        return self._is_healthy(host, time.time())
+
+    def _is_healthy(self, host, now):
+        return (self._errors.get(host, 0.) < self.threshold or
+                now - self._last_error.get(host, 0.) > self.recovery)
+
+    def rank(self, hosts):
+        """Sort a list of hosts, best first
+
+        Healthy hosts come first, ordered by their expected time to a
+        successful response (latency divided by success rate).
+        Hosts that have not been queried yet are tried before others,
+        and hosts that have never responded after them; otherwise the
+        input order is preserved.
+
+        Parameters
+        ----------
+        hosts : `list` of `tuple`
+            the ``(host, port)`` of each server
+
+        Returns
+        -------
+        ranked : `list` of `tuple`
+            the same hosts, best first
+        """
+        now = time.time()
+
+        def _key(host):
+            try:
+                errors = self._errors[host]
+            except KeyError:  # never tried
+                return (False, 0.)
+            latency = self._latency.get(host, float('inf'))
+            return (not self._is_healthy(host, now),
+                    latency / (1. - min(errors, .99)))
+
+        with self._lock:
+            return sorted(hosts, key=_key)
+
+
+#: the `HostHealth` record shared by all connections
+HOST_HEALTH = HostHealth()
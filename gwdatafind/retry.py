@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Retrying transient failures when querying a GW datafind server.
+"""
+
+import errno
+import random
+import socket
+import ssl
+import threading
+import time
+from email.utils import (mktime_tz, parsedate_tz)
+
+from six.moves import http_client
+from six.moves.urllib.error import HTTPError
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__all__ = ['CircuitBreaker', 'CircuitOpenError', 'RetryPolicy']
+
+#: HTTP status codes that indicate a transient server problem
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+#: errors that indicate a transient network problem
+try:
+    RETRY_ERRORS = (ConnectionError, socket.timeout,
+                    http_client.HTTPException)
+except NameError:  # python < 3
+    RETRY_ERRORS = (socket.timeout, http_client.HTTPException)
+
+#: `errno` codes of socket errors that indicate a transient network problem
+RETRY_ERRNOS = (
+    errno.ECONNABORTED,
+    errno.ECONNREFUSED,
+    errno.ECONNRESET,
+    errno.EPIPE,
+    errno.ETIMEDOUT,
+)
+
+
+class CircuitOpenError(IOError):
+    """Raised instead of querying a host that is known to be down
+    """
+    pass
+
+
+def _is_transient(exc, statuses=RETRY_STATUSES):
+    """Returns `True` if an error raised by a request is worth retrying
+    """
+    if isinstance(exc, HTTPError):
+        return exc.code in statuses
+    # certificate problems, and open circuits, won't go away by retrying
+    if isinstance(exc, (ssl.SSLError, CircuitOpenError)):
+        return False
+    if isinstance(exc, RETRY_ERRORS):
+        return True
+    return (isinstance(exc, socket.error) and
+            getattr(exc, 'errno', None) in RETRY_ERRNOS)
+
+
+def _retry_after(exc):
+    """Return the number of seconds given in an error's ``Retry-After``
+    header, or `None`
+    """
+    headers = getattr(exc, 'hdrs', None) or ()
+    try:
+        items = headers.items()
+    except AttributeError:  # list of (name, value) pairs
+        items = headers
+    for name, value in items:
+        if name.lower() != 'retry-after':
+            continue
+        try:
+            return max(float(value), 0.)
+        except ValueError:  # HTTP-date
+            date = parsedate_tz(value)
+            if date is not None:
+                return max(mktime_tz(date) - time.time(), 0.)
+    return None
+
+
+class CircuitBreaker(object):
+    """Track failures by host, and fail fast when a host is down.
+
+    After ``threshold`` consecutive transient failures for a host, the
+    circuit 'opens' and every request to that host raises a
+    `CircuitOpenError` without contacting the server, until
+    ``reset_timeout`` seconds have passed.
+    Then a new request is allowed through, if that succeeds the circuit
+    is closed again, otherwise it opens for another ``reset_timeout``.
+
+    Instances are thread-safe, and are normally shared by every
+    connection in a process.
+
+    Parameters
+    ----------
+    threshold : `int`, optional
+        the number of consecutive failures after which to open the circuit
+
+    reset_timeout : `float`, optional
+        the number of seconds to wait before trying an open circuit again
+    """
+    def __init__(self, threshold=5, reset_timeout=30.):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = {}
+        self._opened = {}
+        self._lock = threading.Lock()
+
+    def check(self, host):
+        """Check that requests may be sent to the given host
+
+        Raises
+        ------
+        CircuitOpenError
+            if the circuit for this host is open
+        """
+        with self._lock:
+            opened = self._opened.get(host)
+        if opened is not None and time.time() - opened < self.reset_timeout:
+            raise CircuitOpenError(
+                "{0} is unavailable after {1} consecutive failures, "
+                "not retrying for {2:.0f} seconds".format(
+                    host, self._failures.get(host, 0),
+                    opened + self.reset_timeout - time.time()))
+
+    def success(self, host):
+        """Record a successful request to a host, closing the circuit
+        """
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened.pop(host, None)
+
+    def failure(self, host):
+        """Record a failed request to a host
+        """
+        with self._lock:
+            failures = self._failures[host] = self._failures.get(host, 0) + 1
+            if failures >= self.threshold:
+                self._opened[host] = time.time()
+
+    def is_open(self, host):
+        """Returns `True` if requests to this host will fail fast
+        """
+        try:
+            self.check(host)
+        except CircuitOpenError:
+            return True
+        return False
+
+
+#: the circuit breaker shared by all `RetryPolicy` objects by default
+DEFAULT_BREAKER = CircuitBreaker()
+
+
+class RetryPolicy(object):
+    """How to retry requests that fail for transient reasons.
+
+    Requests are retried if they raise a transient network error (a
+    connection reset, refusal, or timeout), or if the server responds
+    with one of the ``statuses`` (by default 429 and 5xx 'server' errors).
+    Between attempts the client sleeps for a random time between zero and
+    ``backoff * 2 ** attempt`` seconds (capped at ``max_backoff``), or
+    for as long as the server asked in a ``Retry-After`` header.
+
+    Parameters
+    ----------
+    retries : `int`, optional
+        the maximum number of times to retry a request
+
+    backoff : `float`, optional
+        the base backoff interval (seconds)
+
+    max_backoff : `float`, optional
+        the maximum time (seconds) to wait between attempts
+
+    statuses : `tuple` of `int`, optional
+        the HTTP status codes to retry
+
+    methods : `tuple` of `str`, optional
+        the (idempotent) HTTP methods that may be retried
+
+    breaker : `CircuitBreaker`, `None`, optional
+        the circuit breaker to use, defaults to `DEFAULT_BREAKER`,
+        give `None` to disable
+
+    Examples
+    --------
+    >>> from gwdatafind import connect
+    >>> from gwdatafind.retry import RetryPolicy
+    >>> conn = connect(retry=RetryPolicy(retries=5, max_backoff=60))
+    """
+    def __init__(self, retries=3, backoff=.5, max_backoff=30.,
+                 statuses=RETRY_STATUSES, methods=('GET', 'HEAD'),
+                 breaker=DEFAULT_BREAKER):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = tuple(statuses)
+        self.methods = tuple(methods)
+        self.breaker = breaker
+
+    def delay(self, attempt, retry_after=None):
+        """Return the time to wait before the next attempt
+
+        Parameters
+        ----------
+        attempt : `int`
+            the number of attempts that have failed so far, minus one
+
+        retry_after : `float`, optional
+            the time requested by the server
+
+        Returns
+        -------
+        delay : `float`
+            the number of seconds to sleep
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        cap = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return random.uniform(0, cap)
+
+    def call(self, host, method, func, reset=None):
+        """Call a function that performs a request, retrying on failure
+
+        Parameters
+        ----------
+        host : `str`
+            the ``host:port`` of the server, used for the circuit breaker
+
+        method : `str`
+            the HTTP method of the request
+
+        func : `callable`
+            the function that performs the request, taking no arguments
+
+        reset : `callable`, optional
+            a function to call before each retry, e.g. to close the
+            connection
+
+        Returns
+        -------
+        result : `object`
+            the return value of ``func``
+
+        Raises
+        ------
+        CircuitOpenError
+            if the circuit breaker for this host is open
+        """
+        breaker = self.breaker
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.check(host)
+            try:
+                result = func()
+            except Exception as exc:
+                if not _is_transient(exc, self.statuses):
+                    if breaker is not None and isinstance(exc, HTTPError):
+                        breaker.success(host)  # the server is up
+                    raise
+                if breaker is not None:
+                    breaker.failure(host)
+                if (attempt >= self.retries or
+                        method.upper() not in self.methods or
+                        (breaker is not None and breaker.is_open(host))):
+                    raise
+                time.sleep(self.delay(attempt, _retry_after(exc)))
+                attempt += 1
+                if reset is not None:
+                    reset()
+                continue
+            if breaker is not None:
+                breaker.success(host)
+            return result
@@ -0,0 +1,509 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Memory-mapped snapshots of frame file listings.
+
+A snapshot is a compact binary file recording the URLs of a set of
+LIGO-T050017 files, that can be queried without contacting a server,
+and without parsing the listing::
+
+    >>> from gwdatafind import connect
+    >>> from gwdatafind.snapshot import write_snapshot
+    >>> conn = connect()
+    >>> write_snapshot('O2.gwfsnap', conn.find_urls(
+    ...     'L', 'L1_GWOSC_O2_4KHZ_R1', 1164556817, 1187733618))
+
+The snapshot can then be shipped with a job, and queried using the usual
+functions by giving its path as a ``file://`` host::
+
+    >>> from gwdatafind import find_urls
+    >>> find_urls('L', 'L1_GWOSC_O2_4KHZ_R1', 1187008880, 1187008884,
+    ...           host='file:///path/to/O2.gwfsnap')
+
+Snapshots are opened with `mmap`, so opening one is (almost) free, the
+operating system shares the pages between all of the processes on a
+node that open the same file, and each query only reads the few pages
+needed to bisect the sorted GPS start times.
+
+A snapshot file is made up of the following sections, in order.
+All integers are little-endian, and every section starts on an 8-byte
+boundary (padded with zeros).
+
+========== ==============================================================
+Section    Content
+========== ==============================================================
+header     ``8s`` magic (``b'GWDFSNAP'``), ``uint32`` version,
+           ``uint32`` number of datasets, ``uint32`` number of formats,
+           ``uint32`` number of strings, ``uint64`` number of files
+strings    ``uint64`` offset of each string in the text, plus the total
+           length of the text
+datasets   per (observatory, frame type): ``uint32`` observatory,
+           frame type, and (comma-separated) URL schemes (as string
+           indices), 4 bytes padding, ``uint64`` index of the first
+           file, ``uint64`` number of files, ``int64`` maximum file
+           duration
+formats    per directory: ``uint32`` directory URL (ending in ``/``) and
+           file extension (as string indices)
+starts     ``int64`` GPS start time of each file
+durations  ``int64`` duration of each file
+files      ``uint32`` format (directory) index of each file
+text       UTF-8 encoded strings
+========== ==============================================================
+
+The files of each dataset are stored contiguously, sorted by GPS start
+time, and datasets are sorted by observatory and frame type.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+
+from .local import (LocalConnection, _Dataset)
+from .utils import (_int64_array, _split_filename)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__all__ = ['Snapshot', 'SnapshotConnection', 'write_snapshot']
+
+#: the first bytes of every snapshot file
+MAGIC = b'GWDFSNAP'
+
+#: the version of the snapshot format written by this module
+VERSION = 1
+
+_HEADER = struct.Struct('<8sIIIIQ')
+_DATASET = struct.Struct('<IIIxxxxQQq')
+_FORMAT = struct.Struct('<II')
+
+# memoryview.cast gives zero-copy typed access to the mapped file, but
+# only where the native byte order matches the file (and python >= 3.3)
+_CAST = hasattr(memoryview, 'cast') and sys.byteorder == 'little'
+
+
+def _pad(size):
+    """Return the number of bytes needed to pad ``size`` to 8 bytes
+    """
+    return -size % 8
+
+
+def _layout(ndatasets, nformats, nstrings, nfiles):
+    """Return the byte offset of each section of a snapshot
+    """
+    offsets = {}
+    pos = _HEADER.size
+    for name, size in (
+            ('strings', 8 * (nstrings + 1)),
+            ('datasets', _DATASET.size * ndatasets),
+            ('formats', _FORMAT.size * nformats),
+            ('starts', 8 * nfiles),
+            ('durations', 8 * nfiles),
+            ('files', 4 * nfiles),
+    ):
+        offsets[name] = pos
+        pos += size + _pad(size)
+    offsets['data'] = pos
+    return offsets
+
+
+def _tobytes(arr):
+    """Return the little-endian bytes of an `array.array`
+
+    A `list` (from :func:`~gwdatafind.utils._int64_array`) is packed as
+    signed 64-bit integers.
+    """
+    if isinstance(arr, list):
+        return struct.pack('<{0:d}q'.format(len(arr)), *arr)
+    if sys.byteorder != 'little':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    try:
+        return arr.tobytes()
+    except AttributeError:  # python < 3.2
+        return arr.tostring()
+
+
+# -- writing ------------------------------------------------------------------
+
+def write_snapshot(path, urls):
+    """Write a snapshot of a list of file URLs
+
+    Parameters
+    ----------
+    path : `str`
+        the path of the snapshot file to write, an existing file is
+        replaced atomically, so is safe to update while jobs are reading it
+
+    urls : iterable of `str`
+        the URLs to store, e.g. the result of
+        :meth:`~gwdatafind.HTTPConnection.find_urls` (for one or more
+        frame types), or the output of
+        :meth:`~gwdatafind.HTTPConnection.iter_urls`; duplicate URLs are
+        only stored once
+
+    Returns
+    -------
+    nfiles : `int`
+        the number of files written to the snapshot
+
+    Raises
+    ------
+    ValueError
+        if any of the URLs does not follow LIGO-T050017, or has a GPS
+        start time or duration that isn't written as a plain integer
+
+    Examples
+    --------
+    To snapshot every file of a given type:
+
+    >>> from gwdatafind import connect
+    >>> from gwdatafind.snapshot import write_snapshot
+    >>> conn = connect()
+    >>> span = conn.find_times('H', 'H1_HOFT_C00').extent()
+    >>> write_snapshot('H1_HOFT_C00.gwfsnap', conn.iter_urls(
+    ...     'H', 'H1_HOFT_C00', span[0], span[1], on_gaps='ignore'))
+    """
+    strings = []
+    string_index = {}
+    formats = []
+    format_index = {}
+    datasets = {}
+
+    def _intern(string):
+        try:
+            return string_index[string]
+        except KeyError:
+            string_index[string] = len(strings)
+            strings.append(string)
+            return string_index[string]
+
+    for url in urls:
+        prefix, obs, tag, start, duration, ext, exact = _split_filename(url)
+        if not exact:
+            raise ValueError("cannot store {0!r} in a snapshot, the GPS "
+                             "start time and duration must be written as "
+                             "plain integers".format(url))
+        key = (prefix, ext)
+        try:
+            fmt = format_index[key]
+        except KeyError:
+            fmt = format_index[key] = len(formats)
+            formats.append(key)
+        datasets.setdefault((obs, tag), set()).add((start, duration, fmt))
+
+    # sort the formats, so that the output doesn't depend on the order
+    # of the input (and copies of a file are ordered by URL)
+    order = sorted(range(len(formats)), key=formats.__getitem__)
+    renumber = dict((old, new) for new, old in enumerate(order))
+    formats = [formats[i] for i in order]
+
+    # build the dataset table, and the arrays of files
+    starts = _int64_array()
+    durations = _int64_array()
+    files = array('I')
+    dataset_table = []
+    for obs, tag in sorted(datasets):
+        dataset = sorted((start, duration, renumber[fmt]) for
+                         start, duration, fmt in datasets[(obs, tag)])
+        schemes = sorted(set(
+            formats[fmt][0].split(':', 1)[0] for _, _, fmt in dataset))
+        dataset_table.append(_DATASET.pack(
+            _intern(obs), _intern(tag), _intern(','.join(schemes)),
+            len(starts), len(dataset), max(d for _, d, _ in dataset)))
+        starts.extend(s for s, _, _ in dataset)
+        durations.extend(d for _, d, _ in dataset)
+        files.extend(fmt for _, _, fmt in dataset)
+    format_table = [_FORMAT.pack(_intern(directory), _intern(ext)) for
+                    directory, ext in formats]
+
+    # encode the strings
+    data = [string.encode('utf-8') for string in strings]
+    string_offsets = _int64_array([0])
+    for string in data:
+        string_offsets.append(string_offsets[-1] + len(string))
+
+    sections = [
+        _HEADER.pack(MAGIC, VERSION, len(dataset_table), len(formats),
+                     len(strings), len(starts)),
+        _tobytes(string_offsets),
+        b''.join(dataset_table),
+        b''.join(format_table),
+        _tobytes(starts),
+        _tobytes(durations),
+        _tobytes(files),
+        b''.join(data),
+    ]
+
+    # write to a temporary file, then move it into place
+    tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp, 'wb') as snap:
+            for section in sections:
+                snap.write(section)
+                snap.write(b'\0' * _pad(len(section)))
+        os.rename(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return len(starts)
+
+
+# -- reading ------------------------------------------------------------------
+
+class _StructArray(object):
+    """A read-only sequence of little-endian integers in a buffer
+
+    This is used in place of `memoryview.cast` where that isn't
+    available, or the byte order doesn't match.
+    """
+    def __init__(self, buffer, offset, count, typecode):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+        self._struct = struct.Struct('<' + typecode)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("index out of range")
+        return self._struct.unpack_from(
+            self._buffer, self._offset + index * self._struct.size)[0]
+
+
+class _SnapshotDataset(_Dataset):
+    """The files of a single type at a single observatory in a `Snapshot`
+    """
+    def __init__(self, snapshot, obs, tag, schemes, offset, count,
+                 max_duration):
+        self._snapshot = snapshot
+        self.obs = obs
+        self.tag = tag
+        self.schemes = tuple(schemes.split(','))
+        self.max_duration = max_duration
+        self.starts = snapshot._array('starts', offset, count, 'q')
+        self.durations = snapshot._array('durations', offset, count, 'q')
+        self.files = snapshot._array('files', offset, count, 'I')
+
+    def url(self, index):
+        directory, ext = self._snapshot._format(self.files[index])
+        return '{0}{1}-{2}-{3}-{4}{5}'.format(
+            directory, self.obs, self.tag, self.starts[index],
+            self.durations[index], ext)
+
+
+class Snapshot(object):
+    """A read-only, memory-mapped snapshot of frame file URLs
+
+    See :func:`write_snapshot` for how to create a snapshot, and
+    `SnapshotConnection` for how to query one.
+
+    Parameters
+    ----------
+    path : `str`
+        the path of the snapshot file
+
+    Raises
+    ------
+    ValueError
+        if the file is not a snapshot, or was written with an unsupported
+        version of the format
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as snap:
+            self._mmap = mmap.mmap(snap.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []
+        try:
+            self._open()
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self):
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError("{0} is not a snapshot".format(self.path))
+        (magic, version, self._ndatasets, nformats, nstrings,
+         self._nfiles) = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError("{0} is not a snapshot".format(self.path))
+        if version != VERSION:
+            raise ValueError("{0} was written with snapshot format version "
+                             "{1}, which is not supported".format(
+                                 self.path, version))
+        self._offsets = _layout(self._ndatasets, nformats, nstrings,
+                                self._nfiles)
+        self._string_offsets = self._array('strings', 0, nstrings + 1, 'Q')
+        if self._offsets['data'] + self._string_offsets[-1] > len(self._mmap):
+            raise ValueError("{0} is truncated".format(self.path))
+        self._strings = {}
+        self._formats = {}
+        self._datasets = None
+
+    def _array(self, section, offset, count, typecode):
+        """Return a zero-copy view of ``count`` integers in a section
+        """
+        size = struct.calcsize(typecode)
+        start = self._offsets[section] + offset * size
+        if not _CAST:
+            return _StructArray(self._mmap, start, count, typecode)
+        view = memoryview(self._mmap)[start:start + count * size].cast(
+            typecode)
+        self._views.append(view)
+        return view
+
+    def _string(self, index):
+        try:
+            return self._strings[index]
+        except KeyError:
+            start = self._offsets['data'] + self._string_offsets[index]
+            end = self._offsets['data'] + self._string_offsets[index + 1]
+            string = self._strings[index] = self._mmap[start:end].decode(
+                'utf-8')
+            return string
+
+    def _format(self, index):
+        """Return the ``(directory, extension)`` of a file format
+        """
+        try:
+            return self._formats[index]
+        except KeyError:
+            directory, ext = _FORMAT.unpack_from(
+                self._mmap, self._offsets['formats'] + index * _FORMAT.size)
+            fmt = self._formats[index] = (self._string(directory),
+                                          self._string(ext))
+            return fmt
+
+    @property
+    def datasets(self):
+        """`dict` of datasets, keyed by ``(observatory, frametype)``
+        """
+        if self._datasets is None:
+            datasets = {}
+            for i in range(self._ndatasets):
+                (obs, tag, schemes, offset, count,
+                 max_duration) = _DATASET.unpack_from(
+                    self._mmap, self._offsets['datasets'] + i * _DATASET.size)
+                obs, tag = self._string(obs), self._string(tag)
+                datasets[(obs, tag)] = _SnapshotDataset(
+                    self, obs, tag, self._string(schemes), offset, count,
+                    max_duration)
+            self._datasets = datasets
+        return self._datasets
+
+    def get(self, site, frametype):
+        """Return the dataset for a given observatory and frame type,
+        or `None`
+        """
+        return self.datasets.get((site, frametype))
+
+    def __len__(self):
+        return self._nfiles
+
+    def __iter__(self):
+        """Iterate over all of the URLs in this snapshot
+        """
+        for key in sorted(self.datasets):
+            dataset = self.datasets[key]
+            for i in range(len(dataset)):
+                yield dataset.url(i)
+
+    def close(self):
+        """Close this snapshot, any datasets taken from it become unusable
+        """
+        self._datasets = None
+        for view in self._views[::-1]:
+            view.release()
+        del self._views[:]
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_SNAPSHOTS = {}
+_SNAPSHOT_LOCK = threading.Lock()
+
+
+def _get_snapshot(path, refresh=False):
+    """Return the (shared) `Snapshot` for a given path
+    """
+    with _SNAPSHOT_LOCK:
+        if refresh or path not in _SNAPSHOTS:
+            # don't close a replaced snapshot, other threads may be using it
+            _SNAPSHOTS[path] = Snapshot(path)
+        return _SNAPSHOTS[path]
+
+
+class SnapshotConnection(LocalConnection):
+    """Answer datafind queries from a snapshot file
+
+    The query methods match those of `~gwdatafind.HTTPConnection`.
+    The snapshot is opened the first time it is queried, and is shared
+    by all connections to the same file in this process.
+    Use :meth:`SnapshotConnection.refresh` to re-open the file, e.g. after
+    it has been replaced with a newer snapshot.
+
+    Parameters
+    ----------
+    path : `str`
+        the path of the snapshot file, see :func:`write_snapshot`
+
+    Examples
+    --------
+    >>> from gwdatafind.snapshot import SnapshotConnection
+    >>> conn = SnapshotConnection('O2.gwfsnap')
+    >>> conn.find_urls('L', 'L1_GWOSC_O2_4KHZ_R1', 1187008880, 1187008884)
+    ['file://localhost/cvmfs/gwosc.osgstorage.org/gwdata/O2/strain.4k/frame.v1/L1/1186988032/L-L1_GWOSC_O2_4KHZ_R1-1187008512-4096.gwf']
+    """
+    def __init__(self, path):
+        self.root = os.path.abspath(os.path.expanduser(path))
+
+    @property
+    def index(self):
+        """The `Snapshot` being queried
+        """
+        return _get_snapshot(self.root)
+
+    def refresh(self):
+        """Re-open the snapshot file, for all connections to this file
+        """
+        _get_snapshot(self.root, refresh=True)
+
+    def ping(self):
+        """Check that the snapshot can be read.
+
+        Raises
+        ------
+        RuntimeError
+            if the snapshot can't be opened
+        """
+        try:
+            self.index
+        except (IOError, OSError, ValueError) as exc:
+            raise RuntimeError(str(exc))
+        return 0
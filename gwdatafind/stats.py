@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Request statistics for GW datafind connections.
+
+Each `~gwdatafind.HTTPConnection` records counters (requests, retries,
+bytes received, ...) and timing histograms (connect, time-to-first-byte,
+transfer, ...) for each endpoint it queries, in its
+`~gwdatafind.HTTPConnection.stats` attribute.
+The statistics of all connections used by the convenience functions in
+:mod:`gwdatafind.ui` are aggregated, see
+:func:`gwdatafind.ui.connection_stats`.
+
+Examples
+--------
+>>> from gwdatafind import connect
+>>> conn = connect()
+>>> urls = conn.find_urls('L', 'L1_GWOSC_O2_4KHZ_R1', 1187008880, 1187008884)
+>>> conn.stats['urls'].requests
+1
+>>> conn.stats['urls'].ttfb.mean  # seconds
+0.0413...
+>>> print(conn.stats)
+endpoint  requests  errors  retries  cache_hits  urls  bytes  connect  ...
+urls             1       0        0           0     1    142   12.1ms  ...
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__all__ = ['BUCKETS', 'ConnectionStats', 'EndpointStats', 'Histogram']
+
+try:
+    _clock = time.perf_counter
+except AttributeError:  # python < 3.3
+    _clock = time.time
+
+#: the upper bound (seconds) of each histogram bucket, from 1 microsecond
+#: doubling to ~2 minutes, longer times go in a final overflow bucket
+BUCKETS = tuple(1e-6 * 2 ** i for i in range(28))
+
+#: the counters recorded for each endpoint
+COUNTERS = (
+    'requests',
+    'errors',
+    'retries',
+    'failovers',
+    'cache_hits',
+    'connections',
+    'urls',
+    'bytes_received',
+    'bytes_decoded',
+)
+
+#: the timings recorded for each endpoint
+TIMINGS = (
+    'connect',
+    'tls',
+    'ttfb',
+    'transfer',
+    'decode',
+)
+
+#: the name under which requests to unrecognised endpoints are recorded
+OTHER = 'other'
+
+
+class _Stopwatch(object):
+    """Accumulate the time spent inside a ``with`` block
+
+    Attributes
+    ----------
+    elapsed : `float`
+        the total time (seconds) spent inside the block
+    """
+    __slots__ = ('elapsed', '_start')
+
+    def __init__(self):
+        self.elapsed = 0.
+        self._start = None
+
+    def __enter__(self):
+        self._start = _clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed += _clock() - self._start
+
+
+class Histogram(object):
+    """A histogram of times, in logarithmic buckets
+
+    Attributes
+    ----------
+    counts : `list` of `int`
+        the number of times in each of the `BUCKETS`, plus one for
+        times longer than the last bucket
+
+    count : `int`
+        the total number of times recorded
+
+    total : `float`
+        the sum of all times recorded
+
+    min, max : `float`
+        the shortest and longest times recorded, or `None`
+    """
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.
+        self.min = self.max = None
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        if not self.count:
+            return '<Histogram (empty)>'
+        return '<Histogram count={0} mean={1:.3g}s max={2:.3g}s>'.format(
+            self.count, self.mean, self.max)
+
+    def add(self, value):
+        """Record a time
+
+        Parameters
+        ----------
+        value : `float`
+            the time to record (seconds)
+        """
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Add the times recorded by another histogram to this one
+        """
+        if not other.count:
+            return
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    @property
+    def mean(self):
+        """The mean time (seconds), or `None` if nothing was recorded
+        """
+        if self.count:
+            return self.total / self.count
+
+    def quantile(self, q):
+        """Return an (upper bound on the) quantile of the recorded times
+
+        Parameters
+        ----------
+        q : `float`
+            the quantile, between 0 and 1, e.g. ``0.95``
+
+        Returns
+        -------
+        time : `float`
+            the upper edge of the bucket containing the quantile
+            (limited to the longest time recorded), or `None` if nothing
+            was recorded
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return min(bound, self.max)
+        return self.max
+
+
+class EndpointStats(object):
+    """The statistics of requests to a single endpoint
+
+    Attributes
+    ----------
+    requests : `int`
+        the number of requests sent to the server (including retries)
+
+    errors : `int`
+        the number of requests that failed
+
+    retries : `int`
+        the number of requests that were retried
+
+    failovers : `int`
+        the number of requests that were sent to another replica
+
+    cache_hits : `int`
+        the number of queries answered from the response cache
+
+    connections : `int`
+        the number of new connections opened
+
+    urls : `int`
+        the number of URLs received
+
+    bytes_received : `int`
+        the number of response body bytes received from the server
+
+    bytes_decoded : `int`
+        the number of response body bytes after decompression
+
+    connect : `Histogram`
+        the time to open a (TCP) connection
+
+    tls : `Histogram`
+        the time to perform the TLS handshake of an HTTPS connection
+
+    ttfb : `Histogram`
+        the time from sending a request to receiving the response headers
+
+    transfer : `Histogram`
+        the time to read (and decompress) the response body
+
+    decode : `Histogram`
+        the time to decode the JSON response
+    """
+    __slots__ = COUNTERS + TIMINGS
+
+    def __init__(self):
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        for name in TIMINGS:
+            setattr(self, name, Histogram())
+
+    def __repr__(self):
+        return '<EndpointStats requests={0} errors={1} retries={2}>'.format(
+            self.requests, self.errors, self.retries)
+
+    def merge(self, other):
+        """Add the statistics of another `EndpointStats` to this one
+        """
+        for name in COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name in TIMINGS:
+            getattr(self, name).merge(getattr(other, name))
+
+    def as_dict(self):
+        """Return these statistics as a `dict`
+
+        Each timing is summarised as a `dict` with the ``count``, and the
+        ``mean``, ``p50``, ``p95``, and ``max`` times (seconds).
+        """
+        out = dict((name, getattr(self, name)) for name in COUNTERS)
+        for name in TIMINGS:
+            hist = getattr(self, name)
+            out[name] = {
+                'count': hist.count,
+                'mean': hist.mean,
+                'p50': hist.quantile(.5),
+                'p95': hist.quantile(.95),
+                'max': hist.max,
+            }
+        return out
+
+
+def _format_time(seconds):
+    if seconds is None:
+        return '-'
+    if seconds < 1:
+        return '{0:.1f}ms'.format(seconds * 1e3)
+    return '{0:.2f}s'.format(seconds)
+
+
+class ConnectionStats(object):
+    """Thread-safe request statistics, by endpoint
+
+    Parameters
+    ----------
+    parent : `ConnectionStats`, optional
+        another set of statistics to which everything recorded here
+        is also recorded, e.g. to aggregate over a pool of connections
+
+    Examples
+    --------
+    >>> stats = ConnectionStats()
+    >>> stats.count('urls', 'requests')
+    >>> stats.record('urls', 'ttfb', 0.05)
+    >>> stats['urls'].requests, stats['urls'].ttfb.mean
+    (1, 0.05)
+    """
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def _get(self, endpoint):
+        try:
+            return self._endpoints[endpoint]
+        except KeyError:
+            stats = self._endpoints[endpoint] = EndpointStats()
+            return stats
+
+    def count(self, endpoint, name, n=1):
+        """Increment a counter
+
+        Parameters
+        ----------
+        endpoint : `str`, `None`
+            the name of the endpoint, see :func:`gwdatafind.cache.endpoint`
+
+        name : `str`
+            the name of the counter, one of `COUNTERS`
+
+        n : `int`, optional
+            the amount by which to increment the counter
+        """
+        endpoint = endpoint or OTHER
+        with self._lock:
+            stats = self._get(endpoint)
+            setattr(stats, name, getattr(stats, name) + n)
+        if self.parent is not None:
+            self.parent.count(endpoint, name, n)
+
+    def record(self, endpoint, name, seconds):
+        """Record a time
+
+        Parameters
+        ----------
+        endpoint : `str`, `None`
+            the name of the endpoint, see :func:`gwdatafind.cache.endpoint`
+
+        name : `str`
+            the name of the timing, one of `TIMINGS`
+
+        seconds : `float`
+            the time to record
+        """
+        endpoint = endpoint or OTHER
+        with self._lock:
+            getattr(self._get(endpoint), name).add(seconds)
+        if self.parent is not None:
+            self.parent.record(endpoint, name, seconds)
+
+    def __getitem__(self, endpoint):
+        """Return (a copy of) the statistics for an endpoint
+
+        An endpoint that hasn't been queried returns empty statistics.
+        """
+        copy = EndpointStats()
+        with self._lock:
+            try:
+                copy.merge(self._endpoints[endpoint])
+            except KeyError:
+                pass
+        return copy
+
+    def __iter__(self):
+        with self._lock:
+            return iter(sorted(self._endpoints))
+
+    def __len__(self):
+        return len(self._endpoints)
+
+    def __str__(self):
+        return self.summary()
+
+    def total(self):
+        """Return the statistics of all endpoints combined
+
+        Returns
+        -------
+        stats : `EndpointStats`
+            the combined statistics
+        """
+        total = EndpointStats()
+        with self._lock:
+            for stats in self._endpoints.values():
+                total.merge(stats)
+        return total
+
+    def as_dict(self):
+        """Return the statistics of each endpoint as a `dict`
+
+        See `EndpointStats.as_dict` for details.
+        """
+        return dict((endpoint, self[endpoint].as_dict()) for
+                    endpoint in self)
+
+    def reset(self):
+        """Forget all statistics recorded so far
+
+        Statistics already recorded by a ``parent`` are not affected.
+        """
+        with self._lock:
+            self._endpoints.clear()
+
+    def summary(self):
+        """Return a table summarising the statistics of each endpoint
+
+        Times are given as the mean (per request) of each timing.
+
+        Returns
+        -------
+        table : `str`
+            a plain-text table, with one row per endpoint, and a final
+            row for the total
+        """
+        header = ('endpoint', 'requests', 'errors', 'retries', 'cache_hits',
+                  'urls', 'bytes') + TIMINGS
+        rows = [header]
+        endpoints = list(self)
+        if len(endpoints) > 1:
+            endpoints.append(None)
+        for endpoint in endpoints:
+            stats = self.total() if endpoint is None else self[endpoint]
+            rows.append(
+                (endpoint or 'total',) +
+                tuple(str(x) for x in (
+                    stats.requests, stats.errors, stats.retries,
+                    stats.cache_hits, stats.urls, stats.bytes_received)) +
+                tuple(_format_time(getattr(stats, name).mean) for
+                      name in TIMINGS))
+        widths = [max(len(row[i]) for row in rows) for
+                  i in range(len(header))]
+        return '\n'.join(
+            '  '.join([row[0].ljust(widths[0])] +
+                      [cell.rjust(width) for cell, width in
+                       zip(row[1:], widths[1:])]).rstrip()
+            for row in rows)
@@ -19,6 +19,7 @@
 """
 
 import os
+import sys
 import tempfile
 
 from six.moves import http_client
@@ -35,6 +36,12 @@ if pytest.__version__ < '3.0':
 else:
     yield_fixture = pytest.fixture
 
+# gwdatafind.aio (and its tests) use async syntax, which is a SyntaxError
+# before python 3.5
+collect_ignore = []
+if sys.version_info < (3, 5):  # pragma: no-cover
+    collect_ignore.append('test_aio.py')
+
 HTTP_CLIENT = http_client.__name__
 HTTP_CONNECTION = '{0}.HTTPConnection'.format(HTTP_CLIENT)
 
@@ -0,0 +1,620 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A local stand-in for an LDR server, for integration tests and benchmarks
+
+This module provides an `LDRServer` that answers the
+``/LDR/services/data/v1`` queries made by the clients in
+:mod:`gwdatafind`, using a synthetic `FrameIndex` in place of a real
+database of frame files::
+
+    >>> from gwdatafind.tests.server import (FrameIndex, LDRServer)
+    >>> with LDRServer(FrameIndex(gaps=[(1000000100, 1000000200)])) as server:
+    ...     conn = server.connection()
+    ...     conn.find_times('H', 'H1_R')
+    [segment(1000000000, 1000000096), segment(1000000224, 1000086400)]
+
+The server runs in a background thread, and can be configured to add
+latency to, or inject errors into, its responses, and to serve over TLS
+with a throw-away certificate authority.
+"""
+
+import datetime
+import gzip
+import json
+import os
+import random
+import re
+import shutil
+import ssl
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+from six.moves.BaseHTTPServer import (BaseHTTPRequestHandler, HTTPServer)
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import (parse_qs, unquote, urlparse)
+
+from ligo.segments import (segment, segmentlist)
+
+from ..http import (DEFAULT_SERVICE_PREFIX, HTTPConnection, HTTPSConnection)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__all__ = ['FrameIndex', 'LDRServer']
+
+#: the frame types served by a `FrameIndex` by default
+DEFAULT_FRAMETYPES = {
+    'H': ['H1_R', 'H1_HOFT_C00'],
+    'L': ['L1_R', 'L1_HOFT_C00'],
+}
+
+#: regex matching the path of a query for a frame type
+_DATASET = re.compile(r'\A/gwf/(?P<site>[^/]+)/(?P<frametype>[^/]+)/')
+
+
+class FrameIndex(object):
+    """A synthetic index of frame files
+
+    Every frame type is given contiguous files of ``duration`` seconds
+    covering ``[start, end)``, apart from any files that overlap one of
+    the ``gaps``.
+    File names follow LIGO-T050017, and are spread across directories of
+    100000 seconds, like the frame archives at the LIGO sites.
+
+    Files are generated on demand, so an index can describe millions of
+    files without using much memory.
+
+    Parameters
+    ----------
+    frametypes : `dict`, optional
+        a `dict` of frame type `list` keyed by observatory prefix,
+        defaults to `DEFAULT_FRAMETYPES`
+
+    start : `int`, optional
+        the GPS start time of the first file
+
+    end : `int`, optional
+        the GPS end time of the index, the last file ends at or after
+        this time
+
+    duration : `int`, optional
+        the duration of each file
+
+    gaps : `list` of `tuple`, optional
+        ``(start, end)`` GPS intervals for which no files exist
+
+    urltypes : `tuple` of `str`, optional
+        the URL schemes to report for each file
+
+    root : `str`, optional
+        the directory in which to (pretend to) store files
+    """
+    def __init__(self, frametypes=None, start=1000000000, end=1000086400,
+                 duration=32, gaps=(), urltypes=('file', 'gsiftp'),
+                 root='/data'):
+        if frametypes is None:
+            frametypes = DEFAULT_FRAMETYPES
+        self.frametypes = dict((site, list(types)) for
+                               site, types in frametypes.items())
+        self.start = int(start)
+        self.duration = int(duration)
+        nfiles = -(-(int(end) - self.start) // self.duration)
+        self.end = self.start + nfiles * self.duration
+        self.urltypes = tuple(urltypes)
+        self.root = root.rstrip('/')
+
+        # remove every file that overlaps a gap from the coverage
+        missing = segmentlist()
+        for gstart, gend in gaps:
+            first = self._floor(max(gstart, self.start))
+            last = self._floor(min(gend, self.end) - 1) + self.duration
+            if first < last:
+                missing.append(segment(first, last))
+        self.segments = (
+            segmentlist([segment(self.start, self.end)]) -
+            missing.coalesce())
+
+    def _floor(self, gps):
+        """Return the start time of the file containing ``gps``
+        """
+        return self.start + (gps - self.start) // self.duration * self.duration
+
+    # -- metadata -------------------------------
+
+    def observatories(self):
+        """Return the list of observatory prefixes
+        """
+        return sorted(self.frametypes)
+
+    def types(self, site=None):
+        """Return the list of frame types for one, or all, observatories
+        """
+        if site is None:
+            return sorted(set(
+                t for types in self.frametypes.values() for t in types))
+        return list(self.frametypes.get(site, []))
+
+    def has_type(self, site, frametype):
+        """Returns `True` if this index has files for a frame type
+        """
+        return frametype in self.frametypes.get(site, ())
+
+    def times(self, site, frametype, start=None, end=None):
+        """Return the segments covered by files of a frame type
+        """
+        if not self.has_type(site, frametype):
+            return segmentlist()
+        if start is None or end is None:
+            return segmentlist(self.segments)
+        return self.segments & segmentlist([segment(start, end)])
+
+    # -- files ----------------------------------
+
+    def url(self, site, frametype, gps, urltype='file'):
+        """Return the URL for the file of the given type starting at ``gps``
+        """
+        path = '{0}/{1}/{2}/{1}-{2}-{3}/{1}-{2}-{4}-{5}.gwf'.format(
+            self.root, site, frametype, gps // 100000, gps, self.duration)
+        if urltype == 'file':
+            return 'file://localhost' + path
+        return '{0}://{1}.example.com{2}'.format(urltype, urltype, path)
+
+    def _urltypes(self, urltype=None):
+        if urltype:
+            return (urltype,) if urltype in self.urltypes else ()
+        return self.urltypes
+
+    def file_starts(self, site, frametype, start, end):
+        """Yield the GPS start time of each file overlapping a GPS interval
+        """
+        if not self.has_type(site, frametype):
+            return
+        for seg in self.segments:
+            first = self._floor(max(start, seg[0]))
+            for gps in range(first, min(end, seg[1]), self.duration):
+                yield gps
+
+    def urls(self, site, frametype, start, end, urltype=None, match=None):
+        """Yield the URLs of the files overlapping a GPS interval
+        """
+        urltypes = self._urltypes(urltype)
+        regex = re.compile(match) if match else None
+        for gps in self.file_starts(site, frametype, start, end):
+            for scheme in urltypes:
+                url = self.url(site, frametype, gps, scheme)
+                if regex is None or regex.search(url):
+                    yield url
+
+    def latest(self, site, frametype, urltype=None):
+        """Return the URLs of the most recent file
+        """
+        if not self.has_type(site, frametype) or not self.segments:
+            return []
+        gps = self.segments[-1][1] - self.duration
+        return [self.url(site, frametype, gps, scheme) for
+                scheme in self._urltypes(urltype)]
+
+    def find(self, filename):
+        """Return the URLs for a single file name
+        """
+        try:
+            site, frametype, gps, rest = filename.split('-')
+            gps, duration = int(gps), int(rest.split('.', 1)[0])
+        except ValueError:
+            return []
+        if (duration != self.duration or gps != self._floor(gps) or
+                gps not in self.segments or
+                not self.has_type(site, frametype)):
+            return []
+        return [self.url(site, frametype, gps, scheme) for
+                scheme in self.urltypes]
+
+    # -- queries --------------------------------
+
+    def query(self, path, params=None):
+        """Answer a query for a path under the service prefix
+
+        Parameters
+        ----------
+        path : `str`
+            the query path, relative to
+            `~gwdatafind.http.DEFAULT_SERVICE_PREFIX`
+
+        params : `dict`, optional
+            the query string parameters, as returned by
+            :func:`~urllib.parse.parse_qs`
+
+        Returns
+        -------
+        data : `list`
+            the JSON-serialisable response, or `None` if ``path`` is not
+            a valid query
+        """
+        params = params or {}
+        if path.endswith('.json'):
+            path = path[:-5]
+        if path == '/gwf':
+            return self.observatories()
+        if path == '/gwf/all':
+            return self.types()
+        if re.match(r'\A/gwf/[^/]+\Z', path):
+            return self.types(path[5:])
+
+        dataset = _DATASET.match(path)
+        if dataset is None:
+            return None
+        site, frametype = dataset.groups()
+        parts = path[dataset.end():].split('/')
+        query, urltype = parts[0], (parts[1:] or [None])[0]
+        if len(parts) > 2:
+            return None
+
+        if query == 'segments':
+            if urltype is None:
+                return [list(seg) for seg in self.times(site, frametype)]
+            start, end = map(int, urltype.split(','))
+            return [list(seg) for seg in
+                    self.times(site, frametype, start, end)]
+        if query == 'latest':
+            return self.latest(site, frametype, urltype=urltype)
+        if re.match(r'\A\d+,\d+\Z', query):
+            start, end = map(int, query.split(','))
+            match = params.get('match', [None])[0]
+            return list(self.urls(site, frametype, start, end,
+                                  urltype=urltype, match=match))
+        if urltype is None:
+            return self.find(query)
+        return None
+
+
+# -- test certificates --------------------------------------------------------
+
+def _write_test_ca(directory, hostname='localhost'):
+    """Create a certificate authority and a server certificate signed by it
+
+    Requires :mod:`cryptography`.
+
+    Returns
+    -------
+    cafile : `str`
+        the path of the CA certificate, to be trusted by clients
+
+    certfile : `str`
+        the path of the server certificate and private key
+    """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import (hashes, serialization)
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from ipaddress import ip_address
+
+    def _name(common_name):
+        return x509.Name([
+            x509.NameAttribute(x509.NameOID.COMMON_NAME, common_name)])
+
+    def _pem(cert, key=None):
+        pem = cert.public_bytes(serialization.Encoding.PEM)
+        if key is not None:
+            pem += key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.TraditionalOpenSSL,
+                serialization.NoEncryption())
+        return pem
+
+    now = datetime.datetime.utcnow()
+    start, end = now - datetime.timedelta(minutes=5), now + (
+        datetime.timedelta(days=1))
+
+    cakey = ec.generate_private_key(ec.SECP256R1())
+    ca = x509.CertificateBuilder().subject_name(
+        _name(u'GWDataFind Test CA')).issuer_name(
+        _name(u'GWDataFind Test CA')).public_key(
+        cakey.public_key()).serial_number(
+        x509.random_serial_number()).not_valid_before(
+        start).not_valid_after(end).add_extension(
+        x509.BasicConstraints(ca=True, path_length=0),
+        critical=True).sign(cakey, hashes.SHA256())
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    cert = x509.CertificateBuilder().subject_name(
+        _name(hostname)).issuer_name(ca.subject).public_key(
+        key.public_key()).serial_number(
+        x509.random_serial_number()).not_valid_before(
+        start).not_valid_after(end).add_extension(
+        x509.SubjectAlternativeName([
+            x509.DNSName(hostname),
+            x509.IPAddress(ip_address(u'127.0.0.1')),
+        ]), critical=False).sign(cakey, hashes.SHA256())
+
+    cafile = os.path.join(directory, 'ca.pem')
+    certfile = os.path.join(directory, 'server.pem')
+    with open(cafile, 'wb') as pem:
+        pem.write(_pem(ca))
+    with open(certfile, 'wb') as pem:
+        pem.write(_pem(cert, key))
+    return cafile, certfile
+
+
+# -- server -------------------------------------------------------------------
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    context = None
+
+    def get_request(self):
+        sock, addr = self.socket.accept()
+        if self.context is not None:
+            # the handshake is done in the handler thread (see setup())
+            sock = self.context.wrap_socket(
+                sock, server_side=True, do_handshake_on_connect=False)
+        return sock, addr
+
+    def handle_error(self, request, client_address):
+        pass  # clients hanging up are part of the job
+
+
+class _LDRHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, so don't let Nagle's
+    # algorithm hold back the body waiting for a (delayed) ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        ldr = self.server.ldr
+        if self.server.context is not None:
+            self.request.do_handshake()
+        ldr._count('connections')
+        BaseHTTPRequestHandler.setup(self)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._respond(body=True)
+
+    def do_HEAD(self):
+        self._respond(body=False)
+
+    def _respond(self, body=True):
+        ldr = self.server.ldr
+        ldr._count('requests')
+        if ldr.latency:
+            time.sleep(ldr.latency)
+
+        # inject errors
+        status = ldr._next_error()
+        if status is None:  # hang up without responding
+            self.close_connection = True
+            return
+        if status:
+            ldr._count('errors')
+            headers = {}
+            if ldr.retry_after is not None:
+                headers['Retry-After'] = str(ldr.retry_after)
+            return self._send(status, {'error': self.responses.get(
+                status, ('Error',))[0]}, headers=headers, body=body)
+
+        url = urlparse(self.path)
+        path = unquote(url.path)
+        data = None
+        if path.startswith(DEFAULT_SERVICE_PREFIX):
+            data = ldr.index.query(path[len(DEFAULT_SERVICE_PREFIX):],
+                                   parse_qs(url.query))
+        if data is None:
+            return self._send(404, {'error': 'Not Found'}, body=body)
+        return self._send(200, data, body=body)
+
+    def _send(self, status, data, headers=None, body=True):
+        ldr = self.server.ldr
+        content = json.dumps(data).encode('utf-8')
+        headers = dict(headers or {})
+        headers['Content-Type'] = 'application/json'
+        if ldr.compress and 'gzip' in self.headers.get(
+                'Accept-Encoding', ''):
+            buf = BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as gz:
+                gz.write(content)
+            content = buf.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+        if not ldr.keep_alive:
+            headers['Connection'] = 'close'
+            self.close_connection = True
+        headers['Content-Length'] = str(len(content))
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(content)
+
+
+class LDRServer(object):
+    """A local stand-in for an LDR server, run in a background thread
+
+    The server implements the ``/LDR/services/data/v1`` queries used by
+    `~gwdatafind.HTTPConnection`, answering them from a `FrameIndex`.
+    Connections are kept alive (HTTP/1.1) and handled in parallel.
+
+    Parameters
+    ----------
+    index : `FrameIndex`, optional
+        the index of frame files to serve, defaults to ``FrameIndex()``
+
+    latency : `float`, optional
+        the number of seconds to wait before answering each request
+
+    error_rate : `float`, optional
+        the fraction of requests (chosen at random) to answer with
+        an ``error_status``
+
+    error_status : `int`, optional
+        the HTTP status code of injected errors
+
+    retry_after : `int`, optional
+        the value of the ``Retry-After`` header to send with injected
+        errors
+
+    keep_alive : `bool`, optional
+        if `False`, close each connection after one response
+
+    compress : `bool`, optional
+        if `True`, gzip responses for clients that accept it
+
+    tls : `bool`, optional
+        if `True`, serve HTTPS using a certificate signed by a throw-away
+        certificate authority (see `LDRServer.cafile`), this requires
+        :mod:`cryptography`
+
+    seed : `int`, optional
+        the seed for the random number generator used to inject errors
+
+    Examples
+    --------
+    >>> from gwdatafind.retry import RetryPolicy
+    >>> from gwdatafind.tests.server import LDRServer
+    >>> with LDRServer(latency=.01) as server:
+    ...     server.fail(503)  # the next request will fail
+    ...     conn = server.connection(retry=RetryPolicy())
+    ...     sorted(conn.find_types('H'))
+    ['H1_HOFT_C00', 'H1_R']
+    >>> server.requests, server.errors
+    (2, 1)
+    """
+    def __init__(self, index=None, latency=0., error_rate=0.,
+                 error_status=503, retry_after=None, keep_alive=True,
+                 compress=True, tls=False, seed=None):
+        self.index = FrameIndex() if index is None else index
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.keep_alive = keep_alive
+        self.compress = compress
+        self.tls = tls
+        self.cafile = None
+        self._random = random.Random(seed)
+        self._failures = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._tmpdir = None
+        self.reset()
+
+    # -- control --------------------------------
+
+    def start(self):
+        """Start serving in a background thread
+        """
+        server = _ThreadingHTTPServer(('localhost', 0), _LDRHandler)
+        server.ldr = self
+        if self.tls:
+            self._tmpdir = tempfile.mkdtemp(prefix='gwdatafind-')
+            self.cafile, certfile = _write_test_ca(self._tmpdir)
+            server.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            server.context.load_cert_chain(certfile)
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving, and clean up
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = self.cafile = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def host(self):
+        """The host name on which this server is listening
+        """
+        return 'localhost'
+
+    @property
+    def port(self):
+        """The port on which this server is listening
+        """
+        return self._server.server_address[1]
+
+    @property
+    def address(self):
+        """The ``host:port`` address of this server
+        """
+        return '{0}:{1}'.format(self.host, self.port)
+
+    def connection(self, **kwargs):
+        """Open a new connection to this server
+
+        ``**kwargs`` are passed to `~gwdatafind.HTTPConnection`, or
+        `~gwdatafind.HTTPSConnection` if this server uses TLS.
+        """
+        if self.tls:
+            kwargs.setdefault('context', ssl.create_default_context(
+                cafile=self.cafile))
+            return HTTPSConnection(host=self.host, port=self.port, **kwargs)
+        return HTTPConnection(host=self.host, port=self.port, **kwargs)
+
+    # -- error injection ------------------------
+
+    def fail(self, *statuses):
+        """Answer the next requests with the given HTTP error statuses
+
+        A status of `None` makes the server hang up without responding.
+        """
+        with self._lock:
+            self._failures.extend(statuses)
+
+    def _next_error(self):
+        """Return the error status for the next response, or ``0``
+        """
+        with self._lock:
+            if self._failures:
+                return self._failures.pop(0)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self.error_status
+        return 0
+
+    # -- statistics -----------------------------
+
+    def reset(self):
+        """Reset the request, connection, and error counters
+        """
+        with self._lock:
+            #: the number of requests received
+            self.requests = 0
+            #: the number of connections accepted
+            self.connections = 0
+            #: the number of injected error responses
+            self.errors = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
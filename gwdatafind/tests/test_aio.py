@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for :mod:`gwdatafind.aio`
+"""
+
+import asyncio
+import json
+import threading
+from http.server import (BaseHTTPRequestHandler, HTTPServer)
+from socketserver import ThreadingMixIn
+from unittest import mock
+from urllib.error import HTTPError
+
+import pytest
+
+from ligo.segments import (segment, segmentlist)
+
+from .. import (aio, utils)
+from ..http import DEFAULT_SERVICE_PREFIX
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+FILES = [
+    'file:///tmp/X-test-0-10.gwf',
+    'file:///tmp/X-test-10-10.gwf',
+    'file:///tmp/X-test-20-10.gwf',
+    'gsiftp://host/tmp/X-test-20-10.gwf',
+]
+RESPONSES = {
+    '/gwf.json': ['A', 'B', 'C', 'D', 'ABCD'],
+    '/gwf/all.json': ['A', 'B', 'C', 'D', 'ABCD'],
+    '/gwf/X.json': ['A', 'B'],
+    '/gwf/X/test/segments.json': [[0, 1], [1, 2], [3, 4]],
+    '/gwf/X/test/segments/0,10.json': [[0, 1], [1, 2], [3, 4]],
+    '/gwf/X/test/X-test-0-10.gwf.json': FILES[:1],
+    '/gwf/X/test/latest/file.json': FILES[2:3],
+    '/gwf/X/test/0,30/file.json': FILES[:3],
+    '/gwf/X/test/0,40/file.json': FILES[:3],
+    '/gwf/X/test/0,30.json': FILES,
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_HEAD(self):
+        self._respond(head=True)
+
+    def do_GET(self):
+        self._respond()
+
+    def _respond(self, head=False):
+        path = self.path[len(DEFAULT_SERVICE_PREFIX):]
+        if path == '/gwf/H/R/1,2':
+            body = b''
+        else:
+            try:
+                body = json.dumps(RESPONSES[path]).encode('utf-8')
+            except KeyError:
+                self.send_error(404)
+                return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request = HTTPServer.get_request(self)
+        self.nconnections += 1
+        return request
+
+
+@pytest.fixture(scope='module')
+def server():
+    httpd = _Server(('127.0.0.1', 0), _Handler)
+    httpd.nconnections = 0
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield httpd
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+@pytest.fixture
+def connection(server):
+    conn = aio.AsyncHTTPConnection(*server.server_address)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_init():
+    conn = aio.AsyncHTTPConnection('test.gwdatafind.com:123')
+    assert conn.host == 'test.gwdatafind.com'
+    assert conn.port == 123
+    assert aio.AsyncHTTPSConnection('test.gwdatafind.com').port == 443
+
+
+@pytest.mark.parametrize('host, port', [
+    ('test.gwdatafind.com', None),
+    ('test.gwdatafind.com:123', None),
+    ('test.gwdatafind.com', 123),
+    ('[::1]:123', None),
+])
+def test_init_parse_host(host, port):
+    # the async client accepts the same host strings as the sync client
+    conn = aio.AsyncHTTPConnection(host, port)
+    parsed = utils._parse_host(host, port)
+    assert (conn.host, conn.port) == (parsed[0], parsed[1] or 80)
+
+
+def test_init_hosts():
+    # a list of replicas selects the best one
+    with mock.patch('gwdatafind.aio.HOST_HEALTH') as health:
+        health.rank.side_effect = lambda hosts: hosts[::-1]
+        conn = aio.AsyncHTTPConnection('a.example:80,b.example')
+    health.rank.assert_called_once_with(
+        [('a.example', 80), ('b.example', None)])
+    assert (conn.host, conn.port) == ('b.example', 80)
+
+
+def test_ping(connection):
+    assert run(connection.ping()) == 0
+
+
+@pytest.mark.parametrize('match, out', [
+    (None, ['A', 'B', 'C', 'D', 'ABCD']),
+    ('B', ['B', 'ABCD']),
+])
+def test_find_observatories(connection, match, out):
+    assert sorted(run(connection.find_observatories(match=match))) == (
+        sorted(out))
+
+
+@pytest.mark.parametrize('site, match, out', [
+    (None, None, ['A', 'B', 'C', 'D', 'ABCD']),
+    ('X', 'B', ['B']),
+])
+def test_find_types(connection, site, match, out):
+    assert sorted(run(connection.find_types(site=site, match=match))) == (
+        sorted(out))
+
+
+def test_find_times(connection):
+    times = run(connection.find_times('X', 'test'))
+    assert isinstance(times, segmentlist)
+    assert isinstance(times[0], segment)
+    assert times == [(0, 1), (1, 2), (3, 4)]
+    assert run(connection.find_times('X', 'test', 0, 10)) == times
+    with pytest.raises(ValueError):
+        run(connection.find_times('X', 'test', gpsstart=0))
+
+
+def test_find_url(connection):
+    assert run(connection.find_url('X-test-0-10.gwf')) == FILES[:1]
+    with pytest.raises(HTTPError) as exc:
+        run(connection.find_url('X-test-10-10.gwf'))
+    assert exc.value.code == 404
+
+
+def test_find_latest(connection):
+    assert run(connection.find_latest('X', 'test')) == FILES[2:3]
+
+
+def test_find_urls(connection):
+    assert run(connection.find_urls('X', 'test', 0, 30)) == FILES[:3]
+
+    # check scheme sieving
+    assert run(connection.find_urls('X', 'test', 0, 30, urltype=None)) == (
+        FILES)
+
+    # check gaps
+    with pytest.raises(RuntimeError):
+        run(connection.find_urls('X', 'test', 0, 40, on_gaps='error'))
+    with pytest.warns(UserWarning):
+        urls = run(connection.find_urls('X', 'test', 0, 40, on_gaps='warn'))
+    assert urls == FILES[:3]
+
+
+def test_concurrency(server):
+    conn = aio.AsyncHTTPConnection(*server.server_address, limit=4)
+    before = server.nconnections
+
+    async def _query():
+        return await asyncio.gather(*(
+            conn.find_urls('X', 'test', 0, 30) for i in range(50)))
+
+    try:
+        results = run(_query())
+    finally:
+        conn.close()
+    assert results == [FILES[:3]] * 50
+    # all requests were shared between (at most) 4 keep-alive connections
+    assert 0 < server.nconnections - before <= 4
+
+
+@mock.patch('gwdatafind.aio._ssl_context')
+def test_connect(sslctx):
+    conn = aio.connect('test.gwdatafind.com')
+    assert type(conn) is aio.AsyncHTTPConnection
+    assert (conn.host, conn.port) == ('test.gwdatafind.com', 80)
+
+    conn = aio.connect('test.gwdatafind.com:443')
+    assert isinstance(conn, aio.AsyncHTTPSConnection)
+    assert conn.context is sslctx.return_value
+
+    # check that a list of replicas (e.g. from LIGO_DATAFIND_SERVER)
+    # connects to one of them
+    with mock.patch.dict('os.environ', {
+            'LIGO_DATAFIND_SERVER': 'a.example:80,b.example'}):
+        conn = aio.connect()
+    assert type(conn) is aio.AsyncHTTPConnection
+    assert (conn.host, conn.port) == ('a.example', 80)
+
+
+def test_factory_method(connection):
+    assert run(aio.find_urls('X', 'test', 0, 30,
+                             connection=connection)) == FILES[:3]
+    assert aio.find_urls.__doc__ == aio.AsyncHTTPConnection.find_urls.__doc__
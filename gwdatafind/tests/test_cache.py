@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for :mod:`gwdatafind.cache`
+"""
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+try:
+    from unittest import mock
+except ImportError:  # python < 3
+    import mock
+
+from .. import cache
+from ..http import (
+    _filename_url,
+    _latest_url,
+    _observatories_url,
+    _times_url,
+    _types_url,
+    _urls_url,
+)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+@pytest.fixture
+def tmpdir():
+    path = tempfile.mkdtemp()
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path)
+
+
+@pytest.fixture
+def rcache(tmpdir):
+    return cache.ResponseCache(os.path.join(tmpdir, 'test', 'cache.sqlite'))
+
+
+@pytest.mark.parametrize('url, name', [
+    (_observatories_url(), 'observatories'),
+    (_types_url(), 'types'),
+    (_types_url('H'), 'types'),
+    (_times_url('H', 'test'), 'times'),
+    (_times_url('H', 'test', 0, 10), 'times'),
+    (_latest_url('H', 'test'), 'latest'),
+    (_latest_url('H', 'test', None), 'latest'),
+    (_urls_url('H', 'test', 0, 10), 'urls'),
+    (_urls_url('H', 'test', 0, 10, match='a', urltype=None), 'urls'),
+    (_filename_url('H-test-0-10.gwf'), 'url'),
+    ('/something/else', None),
+])
+def test_endpoint(url, name):
+    assert cache.endpoint(url) == name
+
+
+@mock.patch.dict('os.environ', clear=True)
+def test_default_cache_dir():
+    os.environ['HOME'] = '/home/test'
+    assert cache.default_cache_dir() == '/home/test/.cache/gwdatafind'
+    os.environ['XDG_CACHE_HOME'] = '/tmp/cache'
+    assert cache.default_cache_dir() == '/tmp/cache/gwdatafind'
+
+
+def test_response_cache(rcache):
+    url = _types_url('H')
+    with pytest.raises(KeyError):
+        rcache.get('host:80', url)
+    rcache.set('host:80', url, ['A', 'B'])
+    assert rcache.get('host:80', url) == ['A', 'B']
+    assert os.path.isfile(rcache.path)
+
+    # check that responses are keyed by host
+    with pytest.raises(KeyError):
+        rcache.get('host2:80', url)
+
+    # check that a new cache sees the same responses
+    assert cache.ResponseCache(rcache.path).get('host:80', url) == ['A', 'B']
+
+    # check refresh ignores the cached response
+    rcache.refresh = True
+    with pytest.raises(KeyError):
+        rcache.get('host:80', url)
+
+
+def test_response_cache_ttl(rcache):
+    url = _observatories_url()
+    rcache.set('host:80', url, ['A', 'B'])
+    rcache.ttl['observatories'] = -1  # expired
+    with pytest.raises(KeyError):
+        rcache.get('host:80', url)
+
+    # check that endpoints without a TTL are ignored
+    url = _urls_url('H', 'test', 0, 10)
+    rcache.set('host:80', url, ['A', 'B'])
+    with pytest.raises(KeyError):
+        rcache.get('host:80', url)
+    rcache.ttl['urls'] = 100
+    with pytest.raises(KeyError):
+        rcache.get('host:80', url)
+
+
+def test_response_cache_clear(rcache):
+    url = _observatories_url()
+    rcache.set('host:80', url, ['A'])
+    rcache.set('host2:80', url, ['B'])
+    rcache.clear('host:80')
+    with pytest.raises(KeyError):
+        rcache.get('host:80', url)
+    assert rcache.get('host2:80', url) == ['B']
+    rcache.clear()
+    with pytest.raises(KeyError):
+        rcache.get('host2:80', url)
+
+
+def test_response_cache_broken(tmpdir):
+    # a directory can't be opened as a database
+    rcache = cache.ResponseCache(tmpdir)
+    with pytest.warns(UserWarning) as record:
+        rcache.set('host:80', _observatories_url(), ['A'])
+        with pytest.raises(KeyError):
+            rcache.get('host:80', _observatories_url())
+    # only warn once (ignoring unrelated warnings, e.g. ResourceWarning
+    # from the garbage collection of other tests' sockets)
+    assert len([w for w in record if w.category is UserWarning]) == 1
+
+
+def test_segment_cache():
+    scache = cache.SegmentCache()
+    key = ('host:80', 'X', 'test', 'file', None)
+    assert scache.missing(key, 0, 30) == [(0, 30)]
+    assert scache.get(key, 0, 30) == []
+
+    files = [
+        'file:///tmp/X-test-0-10.gwf',
+        'file:///tmp/X-test-10-10.gwf',
+        'file:///tmp/X-test-20-10.gwf',
+    ]
+    scache.add(key, (5, 25), files[1::-1])
+    assert scache.missing(key, 0, 30) == [(0, 5), (25, 30)]
+    assert scache.missing(key, 10, 20) == []
+    assert scache.get(key, 12, 18) == files[1:2]
+    assert scache.get(key, 0, 30) == files[:2]
+
+    # check that new results are spliced in, without duplicates
+    scache.add(key, (20, 30), files[1:])
+    assert scache.missing(key, 0, 30) == [(0, 5)]
+    assert scache.get(key, 0, 30) == files
+    assert scache.get(key, 10, 20) == files[1:2]  # [20, 30) doesn't overlap
+
+    # check that other keys are independent
+    key2 = key[:-1] + ('.*',)
+    assert scache.missing(key2, 0, 30) == [(0, 30)]
+
+    scache.clear(key)
+    assert scache.missing(key, 0, 30) == [(0, 30)]
+    scache.add(key2, (0, 30), files)
+    scache.clear()
+    assert scache.get(key2, 0, 30) == []
+
+
+@mock.patch('gwdatafind.cache.time.time')
+def test_segment_cache_recent(time):
+    time.return_value = cache._GPS_OFFSET + 10000  # GPS 10000
+    scache = cache.SegmentCache(recent=1000, ttl=60)
+    key = ('host:80', 'X', 'test', 'file', None)
+
+    # old intervals are cached forever, recent ones (even if the
+    # server had nothing yet) only until their TTL expires
+    scache.add(key, (0, 100), ['file:///tmp/X-test-0-100.gwf'])
+    scache.add(key, (9500, 10100), [])
+    assert scache.missing(key, 0, 10100) == [(100, 9500)]
+    time.return_value += 60
+    assert scache.missing(key, 0, 10100) == [(100, 10100)]
+    assert scache.get(key, 0, 10100) == ['file:///tmp/X-test-0-100.gwf']
+
+    # unless recent intervals are never cached
+    scache = cache.SegmentCache(ttl=0)
+    scache.add(key, (9500, 10100), [])
+    assert scache.missing(key, 9500, 10100) == [(9500, 10100)]
+
+    # or every interval is cached forever
+    scache = cache.SegmentCache(recent=None)
+    scache.add(key, (9500, 10100), [])
+    time.return_value += 1e6
+    assert scache.missing(key, 9500, 10100) == []
+
+
+def test_memory_cache():
+    mcache = cache.MemoryCache()
+    url = _types_url('H')
+    with pytest.raises(KeyError):
+        mcache.get('host:80', url)
+    mcache.set('host:80', url, ['A', 'B'])
+    assert mcache.get('host:80', url) == ['A', 'B']
+    assert (mcache.hits, mcache.misses) == (1, 1)
+
+    # check that the cached response can't be modified by the caller
+    mcache.get('host:80', url).append('C')
+    assert mcache.get('host:80', url) == ['A', 'B']
+
+    # check that responses are keyed by host
+    with pytest.raises(KeyError):
+        mcache.get('host2:80', url)
+    assert (mcache.hits, mcache.misses) == (3, 2)
+
+
+def test_memory_cache_ttl():
+    mcache = cache.MemoryCache(ttl={'urls': None})
+    url = _latest_url('H', 'test')
+    with mock.patch('time.time', return_value=100.):
+        mcache.set('host:80', url, ['A'])
+    with mock.patch('time.time', return_value=100.5):
+        assert mcache.get('host:80', url) == ['A']
+    with mock.patch('time.time', return_value=101.):  # expired
+        with pytest.raises(KeyError):
+            mcache.get('host:80', url)
+    assert len(mcache) == 0
+
+    # check that endpoints without a TTL are ignored
+    url = _urls_url('H', 'test', 0, 10)
+    mcache.set('host:80', url, ['A'])
+    with pytest.raises(KeyError):
+        mcache.get('host:80', url)
+
+
+def test_memory_cache_lru():
+    mcache = cache.MemoryCache(maxsize=2)
+    urls = [_types_url(site) for site in ('H', 'L', 'V')]
+    mcache.set('host:80', urls[0], ['A'])
+    mcache.set('host:80', urls[1], ['B'])
+    mcache.get('host:80', urls[0])  # now urls[1] is least-recently used
+    mcache.set('host:80', urls[2], ['C'])
+    assert len(mcache) == 2
+    assert mcache.get('host:80', urls[0]) == ['A']
+    with pytest.raises(KeyError):
+        mcache.get('host:80', urls[1])
+
+
+def test_memory_cache_clear():
+    mcache = cache.MemoryCache()
+    mcache.set('host:80', _observatories_url(), ['A'])
+    mcache.set('host:80', _types_url(), ['B'])
+    mcache.set('host2:80', _types_url(), ['C'])
+    mcache.clear(endpoint='types')
+    assert len(mcache) == 1
+    mcache.set('host2:80', _types_url(), ['C'])
+    mcache.clear(host='host:80')
+    assert mcache.get('host2:80', _types_url()) == ['C']
+    mcache.clear()
+    assert len(mcache) == 0
@@ -18,8 +18,12 @@
 """Tests for :mod:`gwdatafind.http`
 """
 
+import errno
 import json
 import os
+import socket
+import ssl
+import zlib
 from io import BytesIO
 from operator import attrgetter
 
@@ -36,10 +40,20 @@ import pytest
 from ligo.segments import (segment, segmentlist)
 
 from .. import utils
+from ..cache import (MemoryCache, SegmentCache, TLSSessionCache)
 from ..http import (
     HTTPConnection,
     HTTPSConnection,
+    _DecodedResponse,
+    _StreamingCoverage,
+    _iter_json_array,
+    _latest_url,
+    _urls_url,
 )
+from ..pool import HostHealth
+from ..retry import (CircuitBreaker, CircuitOpenError, RetryPolicy)
+from ..urllist import URLList
+from .server import LDRServer
 
 LIGO_DATAFIND_SERVER = os.getenv('LIGO_DATAFIND_SERVER')
 
@@ -53,15 +67,127 @@ def teardown_module():
         os.environ['LIGO_DATAFIND_SERVER'] = LIGO_DATAFIND_SERVER
 
 
-def fake_response(output, status=200):
+class _FakeBody(object):
+    """A response body that can be read (in chunks) over and over again
+    """
+    def __init__(self, data):
+        self.data = data
+        self.stream = BytesIO(data)
+
+    def read(self, amt=None):
+        data = self.stream.read(amt)
+        if amt is None or not data:  # rewind for the next request
+            self.stream.seek(0)
+        return data
+
+
+def fake_response(output, status=200, encoding=None, headers=None):
     resp = mock.Mock()
     resp.status = int(status)
     if not isinstance(output, string_types):
         output = json.dumps(output)
-    resp.read.return_value = output.encode('utf-8')
+    body = output.encode('utf-8')
+    headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+    if encoding:
+        body = _compress(body, encoding)
+        headers['Content-Encoding'] = encoding.replace('raw-', '')
+    resp.getheader.side_effect = lambda name, default=None: headers.get(
+        name, default)
+    resp.getheaders.return_value = list(headers.items())
+    resp.read.side_effect = _FakeBody(body).read
     return resp
 
 
+def _compress(data, encoding):
+    if encoding == 'gzip':
+        obj = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':  # zlib-wrapped
+        obj = zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS)
+    elif encoding == 'raw-deflate':  # what some servers call 'deflate'
+        obj = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    else:
+        raise ValueError(encoding)
+    return obj.compress(data) + obj.flush()
+
+
+ENCODINGS = (None, 'gzip', 'deflate', 'raw-deflate')
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+@pytest.mark.parametrize('chunk_size', (1, 7, 1024))
+def test_decoded_response(encoding, chunk_size):
+    data = ['file:///tmp/X-test-{0}-10.gwf'.format(i)
+            for i in range(0, 1000, 10)]
+    raw = json.dumps(data).encode('utf-8')
+    resp = _DecodedResponse(fake_response(data, encoding=encoding))
+
+    # check that the body can be streamed into the JSON parser
+    assert list(_iter_json_array(resp, chunk_size=chunk_size)) == data
+    assert resp.read() == b''
+    assert resp.decoded_bytes == len(raw)
+    if encoding:
+        assert resp.wire_bytes < len(raw) / 5.
+    else:
+        assert resp.wire_bytes == len(raw)
+
+    # check reading everything at once
+    resp = _DecodedResponse(fake_response(data, encoding=encoding))
+    assert resp.read() == raw
+    assert resp.status == 200
+
+
+def test_decoded_response_error():
+    resp = fake_response([], encoding='gzip')
+    resp.getheader.side_effect = lambda name, default=None: 'br'
+    with pytest.raises(ValueError) as exc:
+        _DecodedResponse(resp)
+    assert str(exc.value) == "Unsupported Content-Encoding 'br'"
+
+
+@pytest.mark.parametrize('chunk_size', (1, 3, 7, 1024))
+@pytest.mark.parametrize('data', [
+    [],
+    ['file:///tmp/X-test-0-10.gwf', 'file:///tmp/X-test-10-10.gwf'],
+    [[0, 1], [1, 2.5], [1234567, 1234568]],
+    [u'caf\u00e9', {'a': [1, None, True]}, -1.5e10, u'\u2603 \\"'],
+    ['a,b', 'c,,d', [1, [2, 3]], 'e,'],
+])
+def test_iter_json_array(data, chunk_size):
+    for indent in (None, 2):
+        raw = json.dumps(data, indent=indent).encode('utf-8')
+        assert list(_iter_json_array(BytesIO(raw), chunk_size)) == data
+
+
+@pytest.mark.parametrize('raw', [
+    b'',
+    b'{"a": 1}',
+    b'[1, 2',
+    b'[1 2]',
+    b'[1, ]',
+    b'[, 1]',
+    b'[1,, 2]',
+    b'["abc',
+])
+def test_iter_json_array_error(raw):
+    with pytest.raises(ValueError):
+        list(_iter_json_array(BytesIO(raw), 2))
+
+
+@pytest.mark.parametrize('segs', [
+    [(0, 10), (10, 20), (20, 30)],
+    [(20, 30), (0, 10), (10, 20), (40, 50)],
+    [(0, 10), (5, 12), (14, 20), (2, 3), (30, 40), (12, 14)],
+    [],
+])
+def test_streaming_coverage(segs):
+    coverage = _StreamingCoverage()
+    for seg in segs:
+        coverage.add(segment(*seg))
+    span = segmentlist([segment(0, 50)])
+    expected = (span - segmentlist(map(segment, segs)).coalesce()).coalesce()
+    assert coverage.missing(0, 50) == expected
+
+
 class TestHTTPConnection(object):
     CONNECTION = HTTPConnection
 
@@ -88,6 +214,199 @@ class TestHTTPConnection(object):
         jdata = connection.get_json('something')
         assert jdata['test'] == 1
 
+    def test_request_response_reconnect(self, response, connection):
+        # a dropped keep-alive connection should be retried once
+        connection.sock = mock.MagicMock()
+        reset = socket.error(errno.ECONNRESET, 'Connection reset by peer')
+        response.side_effect = [reset, fake_response('')]
+        with mock.patch.object(connection, 'close') as close:
+            resp = connection._request_response('GET', 'something')
+        assert resp.status == 200
+        close.assert_called_once_with()
+
+        # but not for a fresh connection
+        connection.sock = None
+        response.side_effect = reset
+        with pytest.raises(socket.error):
+            connection._request_response('GET', 'something')
+
+    @mock.patch('gwdatafind.retry.time.sleep')
+    def test_request_response_retry(self, sleep, response, connection):
+        connection.retry = RetryPolicy(retries=2, breaker=CircuitBreaker())
+        connection.sock = None
+
+        # transient errors are retried, honouring Retry-After
+        response.side_effect = [
+            fake_response('', 503),
+            fake_response('', 429, headers={'Retry-After': '7'}),
+            fake_response({'test': 1}),
+        ]
+        with mock.patch.object(connection, 'close') as close:
+            assert connection.get_json('something') == {'test': 1}
+        assert close.call_count == 2
+        assert sleep.call_count == 2
+        assert sleep.call_args_list[1][0][0] == 7
+
+        # until the policy gives up
+        response.side_effect = [fake_response('', 503)] * 3
+        with pytest.raises(HTTPError) as exc:
+            connection.get_json('something')
+        assert exc.value.code == 503
+
+        # other errors are not retried
+        sleep.reset_mock()
+        response.side_effect = [fake_response('', 404)]
+        with pytest.raises(HTTPError):
+            connection.get_json('something')
+        sleep.assert_not_called()
+
+        # and neither are other methods
+        response.side_effect = [fake_response('', 503)]
+        with pytest.raises(HTTPError):
+            connection._request_response('POST', 'something')
+        sleep.assert_not_called()
+
+    @mock.patch('gwdatafind.retry.time.sleep')
+    def test_request_response_circuit_breaker(self, sleep, response,
+                                              connection):
+        breaker = CircuitBreaker(threshold=2)
+        connection.retry = RetryPolicy(retries=5, breaker=breaker)
+        connection.sock = None
+        response.side_effect = socket.error(errno.ECONNREFUSED,
+                                            'Connection refused')
+        with pytest.raises(socket.error):
+            connection.get_json('something')
+        assert response.call_count == 2  # gave up when the circuit opened
+        assert breaker.is_open(connection._cache_host)
+
+        # now requests fail fast
+        response.reset_mock()
+        with pytest.raises(CircuitOpenError):
+            connection.get_json('something')
+        response.assert_not_called()
+
+    def test_init_hosts(self):
+        conn = self.CONNECTION('a.com:1,b.com:2')
+        assert (conn.host, conn.port) == ('a.com', 1)
+        assert conn.hosts == [('a.com', 1), ('b.com', 2)]
+
+    @mock.patch('gwdatafind.http.HOST_HEALTH', new_callable=HostHealth)
+    def test_request_response_failover(self, health, response):
+        connection = self.CONNECTION(hosts=[('a.com', 1), ('b.com', 2)])
+        assert connection.host == 'a.com'
+        hosts = []
+
+        def _getresponse():
+            hosts.append(connection.host)
+            if connection.host == 'a.com':
+                raise socket.error(errno.ECONNREFUSED, 'Connection refused')
+            return fake_response({'test': 1})
+
+        response.side_effect = _getresponse
+        assert connection.get_json('something') == {'test': 1}
+        assert hosts == ['a.com', 'b.com']
+        assert health.rank(connection.hosts)[0] == ('b.com', 2)
+
+        # the next query goes straight to the healthy host
+        del hosts[:]
+        connection.get_json('something')
+        assert hosts == ['b.com']
+
+        # errors that aren't transient are not failed over
+        response.side_effect = [fake_response('', 404)]
+        with pytest.raises(HTTPError):
+            connection.get_json('something')
+        assert response.call_count == 4
+
+    @mock.patch('gwdatafind.http.HOST_HEALTH', new_callable=HostHealth)
+    def test_request_response_failover_circuit_open(self, health, response):
+        connection = self.CONNECTION(hosts=[('a.com', 1), ('b.com', 2)])
+        breaker = CircuitBreaker(threshold=1)
+        breaker.failure('a.com:1')
+        connection.retry = RetryPolicy(retries=0, breaker=breaker)
+        hosts = []
+
+        def _getresponse():
+            hosts.append(connection.host)
+            return fake_response({'test': 1})
+
+        # the open circuit for a.com is skipped without contacting it,
+        # or counting against its health
+        response.side_effect = _getresponse
+        assert connection.get_json('something') == {'test': 1}
+        assert hosts == ['b.com']
+        assert health.is_healthy(('a.com', 1))
+        assert health.rank(connection.hosts) == [('a.com', 1), ('b.com', 2)]
+        assert connection.stats['other'].failovers == 1
+
+        # if every circuit is open, the error is raised
+        breaker.failure('b.com:2')
+        with pytest.raises(CircuitOpenError):
+            connection.get_json('something')
+        assert hosts == ['b.com']
+
+    @pytest.mark.parametrize('encoding', ENCODINGS)
+    def test_get_json_compressed(self, response, connection, encoding):
+        connection.request.reset_mock()
+        data = ['A'] * 1000
+        response.return_value = fake_response(data, encoding=encoding)
+        assert connection.get_json('something') == data
+        assert connection.request.call_args[1]['headers'] == {
+            'Accept-Encoding': 'gzip, deflate'}
+        assert connection.decoded_bytes == len(json.dumps(data))
+        if encoding:
+            assert connection.wire_bytes < connection.decoded_bytes
+
+        # check that compression can be disabled
+        connection.accept_encoding = None
+        connection.get_json('something')
+        assert 'headers' not in connection.request.call_args[1]
+
+    def test_get_json_cache(self, response, connection):
+        connection.cache = cache = mock.MagicMock()
+        cache.get.return_value = ['A']
+        assert connection.get_json('something') == ['A']
+        cache.get.assert_called_once_with('test.gwdatafind.com:123',
+                                          'something')
+        assert not response.called
+
+        # check that a miss queries the server, and stores the response
+        cache.get.side_effect = KeyError
+        response.return_value = fake_response(['B'])
+        assert connection.get_json('something') == ['B']
+        cache.set.assert_called_once_with('test.gwdatafind.com:123',
+                                          'something', ['B'])
+
+    def test_get_urls_cache(self, response, connection):
+        urls = ['file:///tmp/X-test-0-10.gwf', 'gsiftp://tmp/X-test-0-10.gwf']
+        connection.cache = MemoryCache()
+        response.return_value = fake_response(urls)
+        url = _latest_url('X', 'test', None)
+        assert connection.get_urls(url, scheme='file') == urls[:1]
+        assert connection.get_urls(url) == urls
+        assert response.call_count == 1
+        assert (connection.cache.hits, connection.cache.misses) == (1, 1)
+
+    def test_iter_json(self, response, connection):
+        response.return_value = fake_response([1, 2, 3])
+        assert list(connection.iter_json('something')) == [1, 2, 3]
+
+        # check that an abandoned stream closes the connection
+        with mock.patch.object(connection, 'close') as close:
+            stream = connection.iter_json('something')
+            assert next(stream) == 1
+            stream.close()
+        close.assert_called_once_with()
+
+    def test_stream_urls(self, response, connection):
+        urls = ['file:///tmp/X-test-0-10.gwf', 'gsiftp://tmp/X-test-0-10.gwf']
+        response.return_value = fake_response(urls)
+        stream = connection.stream_urls('something', scheme='file')
+        assert not isinstance(stream, list)
+        assert list(stream) == urls[:1]
+        with pytest.raises(RuntimeError):
+            list(connection.stream_urls('something', scheme='srm',
+                                        on_missing='raise'))
 
     def test_ping(self, response, connection):
         response.return_value = fake_response('')
@@ -192,6 +511,77 @@ class TestHTTPConnection(object):
             assert urls == files
         assert not wrngs.list
 
+    def test_find_urls_compact(self, response, connection):
+        files = [
+            'file:///tmp/X-test-0-10.gwf',
+            'file:///tmp/X-test-10-10.gwf',
+            'file:///tmp/X-test-20-10.gwf',
+        ]
+        response.return_value = fake_response(files)
+        urls = connection.find_urls('X', 'test', 0, 30, compact=True)
+        assert isinstance(urls, URLList)
+        assert urls == files
+
+        # check gaps
+        with pytest.raises(RuntimeError) as exc:
+            connection.find_urls('X', 'test', 0, 40, on_gaps='error',
+                                 compact=True)
+        assert str(exc.value) == 'Missing segments: \n[30 ... 40)'
+
+    def test_find_urls_segment_cache(self, response, connection):
+        files = [
+            'file:///tmp/X-test-0-10.gwf',
+            'file:///tmp/X-test-10-10.gwf',
+            'file:///tmp/X-test-20-10.gwf',
+            'file:///tmp/X-test-30-10.gwf',
+        ]
+        connection.segment_cache = SegmentCache()
+        response.return_value = fake_response(files[1:3])
+        assert connection.find_urls('X', 'test', 10, 30) == files[1:3]
+
+        # check that only the uncovered intervals are queried
+        connection.request.reset_mock()
+        response.side_effect = [
+            fake_response(files[:1]),
+            fake_response(files[3:]),
+        ]
+        assert connection.find_urls('X', 'test', 0, 40) == files
+        assert [c[0][1] for c in connection.request.call_args_list] == [
+            _urls_url('X', 'test', 0, 10),
+            _urls_url('X', 'test', 30, 40),
+        ]
+
+        # check that a covered interval doesn't query at all
+        connection.request.reset_mock()
+        assert connection.find_urls('X', 'test', 5, 25) == files[:3]
+        assert not connection.request.called
+
+        # check that gaps are still reported
+        response.side_effect = [fake_response([])]
+        with pytest.raises(RuntimeError):
+            connection.find_urls('X', 'test', 0, 50, on_gaps='error')
+
+    def test_iter_urls(self, response, connection):
+        files = [
+            'file:///tmp/X-test-0-10.gwf',
+            'file:///tmp/X-test-10-10.gwf',
+            'file:///tmp/X-test-20-10.gwf',
+        ]
+        response.return_value = fake_response(files)
+        urls = connection.iter_urls('X', 'test', 0, 30, match='anything')
+        assert not isinstance(urls, list)
+        assert list(urls) == files
+
+        # check gaps are only reported once the stream is exhausted
+        urls = connection.iter_urls('X', 'test', 0, 40, on_gaps='error')
+        assert [next(urls) for i in range(3)] == files
+        with pytest.raises(RuntimeError) as exc:
+            next(urls)
+        assert str(exc.value) == 'Missing segments: \n[30 ... 40)'
+        with pytest.warns(UserWarning):
+            urls = list(connection.iter_urls('X', 'test', 0, 40))
+        assert urls == files
+
     def test_find_frame_urls(self, response, connection):
         files =  [
             'file:///tmp/X-test-0-10.gwf',
@@ -206,3 +596,36 @@ class TestHTTPConnection(object):
 
 class TestHTTPSConnection(TestHTTPConnection):
     CONNECTION = HTTPSConnection
+
+
+@pytest.fixture
+def tls_server():
+    """Run a local HTTPS stand-in LDR server
+    """
+    pytest.importorskip('cryptography')
+    with LDRServer(tls=True) as server:
+        yield server
+
+
+@pytest.mark.skipif(not hasattr(ssl, 'SSLSession'),
+                    reason='TLS session resumption requires python >= 3.6')
+def test_tls_session_resumption(tls_server):
+    host, port, cafile = tls_server.host, tls_server.port, tls_server.cafile
+    context = ssl.create_default_context(cafile=cafile)
+    sessions = TLSSessionCache()
+    for i in range(3):
+        connection = HTTPSConnection(host=host, port=port, context=context)
+        connection.tls_sessions = sessions
+        assert sorted(connection.find_observatories()) == ['H', 'L']
+        connection.close()
+    assert sessions.full_handshakes == 1
+    assert sessions.resumed_handshakes == 2
+
+    # check that sessions aren't resumed with a different context
+    connection = HTTPSConnection(
+        host=host, port=port,
+        context=ssl.create_default_context(cafile=cafile))
+    connection.tls_sessions = sessions
+    connection.find_observatories()
+    connection.close()
+    assert sessions.full_handshakes == 2
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests that importing :mod:`gwdatafind` stays cheap
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+#: modules that should only be imported when they are needed
+DEFERRED = (
+    'OpenSSL',
+    'cryptography',
+    'ligo.segments',
+    'multiprocessing.pool',
+    'sqlite3',
+)
+
+
+def _imported_modules(statement):
+    """Return the names of all modules imported by a python statement
+    """
+    out = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        stderr=subprocess.STDOUT,
+    ).decode('utf-8')
+    return set(line.rsplit('|', 1)[-1].strip() for line in out.splitlines()
+               if line.startswith('import time:'))
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='-X importtime requires python >= 3.7')
+@pytest.mark.parametrize('statement', (
+    'import gwdatafind',
+    'import gwdatafind.__main__',
+))
+def test_deferred_imports(statement):
+    modules = _imported_modules(statement)
+    assert 'gwdatafind' in modules
+    imported = [name for name in DEFERRED if any(
+        mod == name or mod.startswith(name + '.') for mod in modules)]
+    assert not imported, (
+        "{0!r} imported {1}".format(statement, ', '.join(imported)))
+
+
+def test_lazy_module():
+    from ..utils import _LazyModule
+    module = _LazyModule('json')
+    assert module.dumps([1]) == '[1]'
+    assert 'dumps' in vars(module)  # namespace is copied after first use
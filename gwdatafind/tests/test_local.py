@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for :mod:`gwdatafind.local`
+"""
+
+import os
+
+import pytest
+
+from ligo.segments import (segment, segmentlist)
+
+from .. import (local, ui)
+from ..urllist import URLList
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+# files of 4 seconds for [0, 40), with a gap in [12, 20)
+FILES = [
+    'H1/H-H1_R-0/H-H1_R-{0}-4.gwf'.format(t)
+    for t in range(0, 40, 4) if not 12 <= t < 20
+] + [
+    'L1/L-L1_R-0/L-L1_R-{0}-8.gwf'.format(t) for t in range(0, 40, 8)
+] + [
+    'L1/L-L1_HOFT_C00-0/L-L1_HOFT_C00-0-40.gwf',
+    'L1/README.txt',  # not a frame file
+    'L1/L-L1_R-bad-8.gwf',  # not T050017
+]
+
+
+@pytest.fixture
+def root(tmpdir):
+    for name in FILES:
+        path = tmpdir.join(*name.split('/'))
+        path.ensure()
+    local._INDEXES.clear()
+    yield str(tmpdir)
+    local._INDEXES.clear()
+
+
+def _url(root, name):
+    return 'file://localhost' + os.path.join(root, *name.split('/'))
+
+
+@pytest.mark.parametrize('nthreads', (1, 4))
+def test_scan(root, nthreads):
+    files = local._scan(root, nthreads=nthreads)
+    assert sorted(files) == sorted(
+        os.path.join(root, *name.split('/')) for name in FILES if
+        name.endswith('.gwf'))
+
+
+def test_find_observatories(root):
+    conn = local.LocalConnection(root)
+    assert sorted(conn.find_observatories()) == ['H', 'L']
+    assert conn.find_observatories('H') == ['H']
+
+
+def test_find_types(root):
+    conn = local.LocalConnection(root)
+    assert sorted(conn.find_types()) == ['H1_R', 'L1_HOFT_C00', 'L1_R']
+    assert sorted(conn.find_types('L')) == ['L1_HOFT_C00', 'L1_R']
+    assert conn.find_types('L', match='HOFT') == ['L1_HOFT_C00']
+
+
+def test_find_times(root):
+    conn = local.LocalConnection(root)
+    assert conn.find_times('H', 'H1_R') == segmentlist([
+        segment(0, 12), segment(20, 40)])
+    assert conn.find_times('H', 'H1_R', 10, 30) == segmentlist([
+        segment(10, 12), segment(20, 30)])
+    assert conn.find_times('X', 'test') == segmentlist()
+    with pytest.raises(ValueError):
+        conn.find_times('H', 'H1_R', 10)
+
+
+def test_find_urls(root):
+    conn = local.LocalConnection(root)
+    assert conn.find_urls('L', 'L1_R', 7, 17) == [
+        _url(root, 'L1/L-L1_R-0/L-L1_R-{0}-8.gwf'.format(t))
+        for t in (0, 8, 16)]
+    assert conn.find_urls('L', 'L1_R', 0, 40, match='-8-',
+                          on_gaps='ignore') == [
+        _url(root, 'L1/L-L1_R-0/L-L1_R-8-8.gwf')]
+    assert conn.find_urls('L', 'L1_R', 0, 40, urltype='gsiftp',
+                          on_gaps='ignore') == []
+
+    # check gap handling
+    with pytest.warns(UserWarning) as record:
+        urls = conn.find_urls('H', 'H1_R', 0, 24)
+    assert len(urls) == 4
+    assert '[12 ... 20)' in str(record[0].message)
+    with pytest.raises(RuntimeError):
+        conn.find_urls('H', 'H1_R', 0, 24, on_gaps='error')
+
+    urls = conn.find_urls('H', 'H1_R', 0, 40, compact=True, on_gaps='ignore')
+    assert isinstance(urls, URLList)
+    assert urls.nruns == 2
+
+
+def test_iter_urls(root):
+    conn = local.LocalConnection(root)
+    urls = conn.iter_urls('H', 'H1_R', 0, 24, on_gaps='error')
+    assert next(urls) == _url(root, 'H1/H-H1_R-0/H-H1_R-0-4.gwf')
+    with pytest.raises(RuntimeError):
+        list(urls)
+
+
+def test_find_url(root):
+    conn = local.LocalConnection(root)
+    name = 'L1/L-L1_HOFT_C00-0/L-L1_HOFT_C00-0-40.gwf'
+    assert conn.find_url('/any/path/' + name.rsplit('/', 1)[1]) == [
+        _url(root, name)]
+    assert conn.find_url('H-H1_R-12-4.gwf', on_missing='ignore') == []
+    with pytest.raises(RuntimeError):
+        conn.find_url('H-H1_R-12-4.gwf')
+
+
+def test_find_latest(root):
+    conn = local.LocalConnection(root)
+    assert conn.find_latest('H', 'H1_R') == [
+        _url(root, 'H1/H-H1_R-0/H-H1_R-36-4.gwf')]
+    with pytest.raises(RuntimeError):
+        conn.find_latest('X', 'test')
+
+
+def test_ping(root):
+    assert local.LocalConnection(root).ping() == 0
+    with pytest.raises(RuntimeError):
+        local.LocalConnection(os.path.join(root, 'missing')).ping()
+
+
+def test_refresh(root):
+    conn = local.LocalConnection(root)
+    assert conn.find_latest('H', 'H1_R')[0].endswith('-36-4.gwf')
+    open(os.path.join(root, 'H-H1_R-40-4.gwf'), 'w').close()
+
+    # the index is shared, so new files aren't seen until a refresh
+    other = local.LocalConnection(root)
+    assert other.find_latest('H', 'H1_R')[0].endswith('-36-4.gwf')
+    other.refresh()
+    assert conn.find_latest('H', 'H1_R')[0].endswith('-40-4.gwf')
+
+
+def test_ui(root):
+    ui._POOL.clear()
+    try:
+        conn = ui.connect('file://' + root)
+        assert isinstance(conn, local.LocalConnection)
+        assert conn.root == root
+        assert ui.find_urls('L', 'L1_R', 0, 8, host='file://' + root) == [
+            _url(root, 'L1/L-L1_R-0/L-L1_R-0-8.gwf')]
+    finally:
+        ui._POOL.clear()
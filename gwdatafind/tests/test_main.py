@@ -80,6 +80,8 @@ def test_command_line():
     assert parser.get_default('server') == os.getenv('LIGO_DATAFIND_SERVER')
     assert parser.get_default('url_type') is 'file'
     assert parser.get_default('gaps') is False
+    assert parser.get_default('no_cache') is False
+    assert parser.get_default('refresh_cache') is False
 
     # test parsing and types
     args = parser.parse_args([
@@ -138,11 +140,14 @@ def test_show_observatories(mfindobs):
     args = argparse.Namespace(
         server='test.datafind.com:443',
         match='test',
+        no_cache=True,
+        refresh_cache=False,
     )
     out = StringIO()
     main.show_observatories(args, out)
     out.seek(0)
     assert mfindobs.called_with(host=args.server, match=args.match)
+    assert mfindobs.call_args[1]['cache'] is None
     assert list(map(str.rstrip, out.readlines())) == ['A', 'B', 'C']
 
 
@@ -153,12 +158,15 @@ def test_show_types(mfindtypes):
         server='test.datafind.com:443',
         observatory='X',
         match='test',
+        no_cache=False,
+        refresh_cache=True,
     )
     out = StringIO()
     main.show_types(args, out)
     out.seek(0)
     assert mfindtypes.called_with(host=args.server, match=args.match,
                                   site=args.observatory)
+    assert mfindtypes.call_args[1]['cache'].refresh is True
     assert list(map(str.rstrip, out.readlines())) == ['A', 'B', 'C']
 
 
@@ -226,9 +234,12 @@ def test_filename(mfindurl):
     assert out.read().rstrip() == mfindurl.return_value[0]
 
 
+@pytest.mark.parametrize('frame_cache', (False, True))
+@mock.patch('gwdatafind.ui.iter_urls')
 @mock.patch('gwdatafind.ui.find_urls')
-def test_show_urls(mfindurls):
+def test_show_urls(mfindurls, miterurls, frame_cache):
     mfindurls.return_value = URLS
+    miterurls.return_value = iter(URLS)
     args = argparse.Namespace(
         server='test.datafind.com:443',
         observatory='X',
@@ -239,17 +250,23 @@ def test_show_urls(mfindurls):
         match=None,
         lal_cache=False,
         names_only=False,
-        frame_cache=False,
+        frame_cache=frame_cache,
         gaps=None,
     )
     out = StringIO()
     main.show_urls(args, out)
-    assert mfindurls.called_with(args.observatory, args.type, args.gpsstart,
-                                 args.gpsend, match=args.match,
-                                urltype=args.url_type, on_gaps='ignore',
-                                host=args.server)
+
+    # URLs are streamed, unless they all have to be sorted
+    called, uncalled = (mfindurls, miterurls) if frame_cache else (
+        miterurls, mfindurls)
+    called.assert_called_once_with(
+        args.observatory, args.type, args.gpsstart, args.gpsend,
+        match=args.match, urltype=args.url_type, on_gaps='ignore',
+        host=args.server)
+    uncalled.assert_not_called()
     out.seek(0)
-    assert list(map(str.rstrip, out.readlines())) == URLS
+    result = OUTPUT_OMEGA_CACHE if frame_cache else OUTPUT_URLS
+    assert out.read() == result
 
 
 @pytest.mark.parametrize('fmt,result', [
@@ -277,6 +294,87 @@ def test_postprocess_cache_format(fmt, result):
     assert out.read() == result
 
 
+def test_to_wcache():
+    cache = list(map(main._CacheEntry.from_url, [
+        'file:///test2/X-test-7-4.gwf',
+        'file:///test/X-test-1-1.gwf',
+        'file:///test/X-test-0-1.gwf',
+        'file:///test/X-test-0-2.gwf',  # new duration
+        'file:///test/X-test-1-1.gwf',  # duplicate
+        'file:///test/Y-test-2-1.gwf',  # new observatory
+        'file:///test/X-test-2-1.gwf',
+        'file:///test/X-test-4-1.gwf',  # gap
+    ]))
+    assert list(map(str, main._to_wcache(cache))) == [
+        'X test 0 1 1 file:///test',
+        'X test 0 2 2 file:///test',
+        'X test 1 3 1 file:///test',
+        'X test 4 5 1 file:///test',
+        'X test 7 11 4 file:///test2',
+        'Y test 2 3 1 file:///test',
+    ]
+
+    # check that entries are streamed from sorted input
+    rows = iter([
+        ('X', 'test', 0, 1, 'file:///test/X-test-0-1.gwf'),
+        ('X', 'test', 1, 2, 'file:///test/X-test-1-1.gwf'),
+        ('X', 'test', 2, 3, 'file:///test2/X-test-2-1.gwf'),
+    ])
+    entries = main._iter_wcache(rows)
+    assert str(next(entries)) == 'X test 0 2 1 file:///test'
+    assert len(list(rows)) == 0  # all rows consumed
+    assert str(next(entries)) == 'X test 2 3 1 file:///test2'
+
+
+def test_sort_cache_rows():
+    rows = [
+        ('X', 'test', 0, 1, 'file:///test/X-test-0-1.gwf'),
+        ('X', 'test', 1, 2, 'file:///test/X-test-1-1.gwf'),
+        ('Y', 'test', 0, 1, 'file:///test/Y-test-0-1.gwf'),
+    ]
+    assert main._sort_cache_rows(rows) is rows  # not copied
+    assert main._sort_cache_rows(iter(rows)) == rows
+    assert main._sort_cache_rows(rows[::-1]) == rows
+
+
+@pytest.mark.parametrize('fmt,result', [
+    (None, OUTPUT_URLS),
+    ('lal_cache', OUTPUT_LAL_CACHE),
+    ('names_only', OUTPUT_NAMES_ONLY),
+    ('frame_cache', OUTPUT_OMEGA_CACHE),
+])
+@mock.patch('gwdatafind.__main__._WRITE_BATCH_SIZE', 2)
+def test_postprocess_cache_stream(fmt, result):
+    args = argparse.Namespace(
+        type=None,
+        lal_cache=False,
+        names_only=False,
+        frame_cache=False,
+        gaps=None,
+    )
+    if fmt:
+        setattr(args, fmt, True)
+    out = mock.MagicMock()
+    main.postprocess_cache(iter(URLS), args, out)
+    assert ''.join(call[0][0] for call in out.write.call_args_list) == result
+    # output is written in batches
+    assert out.write.call_count == 2
+
+
+@pytest.mark.parametrize('url', [
+    'file:///test/X-test-0-1.gwf',
+    'file://localhost/test/X-test-0-1.gwf',
+    'gsiftp://host:1234/test/X-test-0-1.gwf',
+    'file://localhost',
+    'X-test-0-1.gwf',
+    '/test/a://b/X-test-0-1.gwf',
+    'file:///test/X-test-0-1.gwf;a=b',
+    'git+ssh://host/test/X-test-0-1.gwf',
+])
+def test_url_path(url):
+    assert main._url_path(url) == main.urlparse(url).path
+
+
 def test_postprocess_cache_sft():
     args = argparse.Namespace(
         type='TEST_1800SFT',
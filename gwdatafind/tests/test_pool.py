@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for :mod:`gwdatafind.pool`
+"""
+
+import socket
+
+import pytest
+
+try:
+    from unittest import mock
+except ImportError:  # python < 3
+    import mock
+
+from ..pool import (ConnectionPool, HostHealth)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+def _factory(host=None, port=None):
+    conn = mock.MagicMock()
+    conn.host = host
+    conn.port = port
+    conn.sock = None
+    return conn
+
+
+@pytest.fixture
+def pool():
+    return ConnectionPool(mock.Mock(side_effect=_factory), maxsize=2)
+
+
+def test_acquire_release(pool):
+    conn = pool.acquire('test', 80)
+    assert (conn.host, conn.port) == ('test', 80)
+    pool.release(conn, 'test', 80)
+    assert pool.acquire('test', 80) is conn
+    assert pool.factory.call_count == 1
+
+    # different host gets a different connection
+    assert pool.acquire('test2', 80) is not conn
+    assert pool.factory.call_count == 2
+
+
+def test_release_maxsize(pool):
+    conns = [pool.acquire('test') for i in range(3)]
+    for conn in conns:
+        pool.release(conn, 'test')
+    assert len(pool._idle[('test', None)]) == 2
+    conns[-1].close.assert_called_once_with()
+
+
+def test_idle_timeout(pool):
+    conn = pool.acquire('test')
+    pool.release(conn, 'test')
+    pool.idle_timeout = -1
+    assert pool.acquire('test') is not conn
+    conn.close.assert_called_once_with()
+
+
+def test_dropped_connection(pool):
+    conn = pool.acquire('test')
+    conn.sock, remote = socket.socketpair()
+    try:
+        pool.release(conn, 'test')
+        assert pool.acquire('test') is conn  # still alive
+        pool.release(conn, 'test')
+        remote.close()  # server hangs up
+        assert pool.acquire('test') is not conn
+        conn.close.assert_called_once_with()
+    finally:
+        conn.sock.close()
+
+
+def test_connection(pool):
+    with pool.connection('test') as conn:
+        pass
+    assert pool._idle[('test', None)][0][0] is conn
+
+    # check that errors discard the connection
+    with pytest.raises(ValueError):
+        with pool.connection('test') as conn2:
+            raise ValueError
+    assert conn2 is conn
+    conn.close.assert_called_once_with()
+    assert not pool._idle[('test', None)]
+
+
+def test_clear(pool):
+    conn = pool.acquire('test')
+    pool.release(conn, 'test')
+    pool.clear()
+    conn.close.assert_called_once_with()
+    assert not pool._idle
+
+
+@mock.patch('gwdatafind.pool.time.time', return_value=0)
+def test_host_health(time):
+    health = HostHealth(alpha=.5, threshold=.6, recovery=10)
+    a, b, c = ('a', None), ('b', None), ('c', None)
+    # untried hosts come first, then by latency
+    health.success(a, 2.)
+    health.success(b, 1.)
+    assert health.rank([a, b, c]) == [c, b, a]
+    health.success(c, 3.)
+    assert health.rank([a, b, c]) == [b, a, c]
+
+    # latencies are averaged
+    health.success(b, 9.)
+    assert health.rank([a, b, c]) == [a, c, b]
+
+    # errors count against a host, then make it unhealthy
+    health.failure(a)
+    assert health.is_healthy(a)
+    assert health.rank([a, b, c]) == [c, a, b]
+    health.failure(a)
+    assert health.rank([a, b, c]) == [c, b, a]
+    assert not health.is_healthy(a)
+
+    # until it recovers
+    time.return_value = 11
+    assert health.is_healthy(a)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for :mod:`gwdatafind.retry`
+"""
+
+import errno
+import socket
+import ssl
+from email.utils import formatdate
+
+try:
+    from unittest import mock
+except ImportError:  # python < 3
+    import mock
+
+import pytest
+
+from six.moves.urllib.error import HTTPError
+
+from .. import retry
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+def _error(code, **headers):
+    return HTTPError('something', code, 'error', list(headers.items()), None)
+
+
+def test_retry_after():
+    assert retry._retry_after(_error(503)) is None
+    assert retry._retry_after(_error(503, **{'Retry-After': '12'})) == 12
+    with mock.patch('gwdatafind.retry.time.time', return_value=1000):
+        assert retry._retry_after(_error(503, **{
+            'Retry-After': formatdate(1060, usegmt=True)})) == 60
+
+
+def test_delay():
+    policy = retry.RetryPolicy(backoff=1, max_backoff=10)
+    for attempt, cap in enumerate((1, 2, 4, 8, 10, 10)):
+        for _ in range(10):
+            assert 0 <= policy.delay(attempt) <= cap
+    assert policy.delay(0, retry_after=5) == 5
+    assert policy.delay(0, retry_after=500) == 10
+
+
+@mock.patch('gwdatafind.retry.time.sleep')
+def test_call(sleep):
+    policy = retry.RetryPolicy(retries=3, breaker=None)
+    func = mock.Mock(side_effect=[socket.timeout, _error(502), 'OK'])
+    reset = mock.Mock()
+    assert policy.call('host:80', 'GET', func, reset=reset) == 'OK'
+    assert func.call_count == 3
+    assert reset.call_count == sleep.call_count == 2
+
+    # check that non-transient errors are raised immediately
+    func = mock.Mock(side_effect=[ValueError, 'OK'])
+    with pytest.raises(ValueError):
+        policy.call('host:80', 'GET', func)
+    assert func.call_count == 1
+
+
+@pytest.mark.parametrize('exc, transient', [
+    (socket.timeout(), True),
+    (socket.error(errno.ECONNRESET, 'reset'), True),
+    (socket.error(errno.ECONNREFUSED, 'refused'), True),
+    (retry.http_client.BadStatusLine(''), True),
+    (_error(503), True),
+    (_error(404), False),
+    (socket.error(errno.ENOENT, 'missing'), False),
+    (IOError(errno.ENOENT, 'missing'), False),
+    (ssl.SSLError(1, 'certificate verify failed'), False),
+    (retry.CircuitOpenError('open'), False),
+    (ValueError(), False),
+])
+def test_is_transient(exc, transient):
+    assert retry._is_transient(exc) is transient
+
+
+@mock.patch('gwdatafind.retry.time.sleep')
+def test_call_circuit_open(sleep):
+    # an open circuit (e.g. from a nested policy) fails fast
+    policy = retry.RetryPolicy(retries=3, breaker=None)
+    func = mock.Mock(side_effect=[retry.CircuitOpenError('open'), 'OK'])
+    reset = mock.Mock()
+    with pytest.raises(retry.CircuitOpenError):
+        policy.call('host:80', 'GET', func, reset=reset)
+    assert func.call_count == 1
+    sleep.assert_not_called()
+    reset.assert_not_called()
+
+
+@mock.patch('gwdatafind.retry.time.time')
+def test_circuit_breaker(time):
+    time.return_value = 0
+    breaker = retry.CircuitBreaker(threshold=2, reset_timeout=10)
+    breaker.failure('a')
+    breaker.check('a')
+    breaker.failure('a')
+    with pytest.raises(retry.CircuitOpenError):
+        breaker.check('a')
+    breaker.check('b')  # other hosts are unaffected
+
+    # after the timeout, one failure re-opens the circuit
+    time.return_value = 10
+    breaker.check('a')
+    breaker.failure('a')
+    assert breaker.is_open('a')
+
+    # and a success closes it
+    time.return_value = 20
+    breaker.success('a')
+    breaker.failure('a')
+    assert not breaker.is_open('a')
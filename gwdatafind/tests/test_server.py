@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""End-to-end tests of the clients against a local stand-in LDR server
+"""
+
+import pytest
+
+from six.moves.urllib.error import HTTPError
+
+try:
+    from unittest import mock
+except ImportError:  # python < 3
+    import mock
+
+from ligo.segments import (segment, segmentlist)
+
+from .. import ui
+from ..http import HTTPConnection
+from ..retry import RetryPolicy
+from .server import (FrameIndex, LDRServer)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+GAP = (1000000100, 1000000200)
+
+
+@pytest.fixture(scope='module')
+def server():
+    with LDRServer(FrameIndex(gaps=[GAP])) as server_:
+        yield server_
+
+
+@pytest.fixture
+def connection(server):
+    server.reset()
+    conn = server.connection()
+    yield conn
+    conn.close()
+
+
+def test_frame_index():
+    index = FrameIndex(start=0, end=100, duration=10, gaps=[(25, 31)])
+    assert index.end == 100
+    assert index.segments == segmentlist([segment(0, 20), segment(40, 100)])
+    assert list(index.file_starts('H', 'H1_R', 15, 45)) == [10, 40]
+    assert index.find('H-H1_R-40-10.gwf') == [
+        'file://localhost/data/H/H1_R/H-H1_R-0/H-H1_R-40-10.gwf',
+        'gsiftp://gsiftp.example.com/data/H/H1_R/H-H1_R-0/H-H1_R-40-10.gwf',
+    ]
+    assert index.find('H-H1_R-20-10.gwf') == []  # in the gap
+    assert index.find('H-H1_R-45-10.gwf') == []  # misaligned
+    assert index.query('/gwf/X/test/0,10/file.json') == []
+    assert index.query('/bad.json') is None
+
+
+def test_queries(server, connection):
+    assert connection.ping() == 0
+    assert sorted(connection.find_observatories()) == ['H', 'L']
+    assert sorted(connection.find_types('L')) == ['L1_HOFT_C00', 'L1_R']
+    assert sorted(connection.find_types()) == [
+        'H1_HOFT_C00', 'H1_R', 'L1_HOFT_C00', 'L1_R']
+    assert connection.find_times('H', 'H1_R', 1000000000, 1000000300) == (
+        segmentlist([segment(1000000000, 1000000096),
+                     segment(1000000224, 1000000300)]))
+    assert connection.find_latest('H', 'H1_R') == [
+        'file://localhost/data/H/H1_R/H-H1_R-10000/'
+        'H-H1_R-1000086368-32.gwf']
+    assert connection.find_url('/data/L-L1_R-1000000032-32.gwf') == [
+        'file://localhost/data/L/L1_R/L-L1_R-10000/'
+        'L-L1_R-1000000032-32.gwf']
+
+    # check that everything went over a single connection
+    assert connection.sock is not None
+    assert (server.requests, server.connections) == (7, 1)
+
+
+def test_find_urls(connection):
+    with pytest.warns(UserWarning) as record:
+        urls = connection.find_urls('H', 'H1_R', 1000000000, 1000000300,
+                                    urltype='gsiftp')
+    assert 'Missing segments' in str(record[0].message)
+    assert len(urls) == 6
+    assert all(url.startswith('gsiftp://') for url in urls)
+
+    urls = connection.find_urls('H', 'H1_R', 1000000000, 1000000064,
+                                match='1000000032', on_gaps='ignore')
+    assert urls == [
+        'file://localhost/data/H/H1_R/H-H1_R-10000/'
+        'H-H1_R-1000000032-32.gwf']
+
+
+def test_retry(server, connection):
+    server.fail(503)
+    with pytest.raises(HTTPError):
+        connection.find_types('H')
+    # check that the connection survives an error response
+    assert sorted(connection.find_types('H')) == ['H1_HOFT_C00', 'H1_R']
+    assert (server.requests, server.connections) == (2, 1)
+
+    server.fail(503, None)  # an error, then a dropped connection
+    connection.retry = RetryPolicy(backoff=0, breaker=None)
+    assert sorted(connection.find_types('H')) == ['H1_HOFT_C00', 'H1_R']
+    assert (server.requests, server.connections, server.errors) == (
+        5, 3, 2)
+
+
+def _http_connection(host=None, port=None, context=None):
+    return HTTPConnection(host=host, port=port)
+
+
+# the server doesn't use port 80, so connect() will ask for HTTPS
+@mock.patch('gwdatafind.ui._ssl_context')
+@mock.patch('gwdatafind.ui.HTTPSConnection', _http_connection)
+def test_ui_pool(_, server):
+    ui._POOL.clear()
+    server.reset()
+    queries = [('H', 'H1_R', 1000001000 + i * 1000, 1000002000 + i * 1000)
+               for i in range(8)]
+    try:
+        results, errors = ui.find_urls_many(
+            queries, host=server.address, nthreads=2)
+    finally:
+        ui._POOL.clear()
+    assert not errors
+    assert sorted(len(urls) for urls in results.values()) == [32] * 8
+    assert server.requests == 8
+    assert server.connections <= 2  # connections were reused
+
+
+def test_tls():
+    pytest.importorskip('cryptography')
+    with LDRServer(tls=True, keep_alive=False) as server:
+        for i in range(2):
+            conn = server.connection()
+            assert sorted(conn.find_observatories()) == ['H', 'L']
+            conn.close()
+        assert (server.requests, server.connections) == (2, 2)
+
+
+def test_stats(server, connection):
+    connection.find_urls('L', 'L1_R', 1000000000, 1000000320,
+                         on_gaps='ignore')
+    connection.find_types('L')
+    server.fail(503)
+    connection.retry = RetryPolicy(backoff=0, breaker=None)
+    connection.find_types('L')
+
+    stats = connection.stats
+    assert list(stats) == ['types', 'urls']
+    urls = stats['urls']
+    assert (urls.requests, urls.errors, urls.urls) == (1, 0, 6)
+    assert urls.connections == urls.connect.count == 1
+    assert 0 < urls.bytes_received < urls.bytes_decoded  # gzipped
+    assert urls.ttfb.count == urls.transfer.count == urls.decode.count == 1
+    types = stats['types']
+    assert (types.requests, types.errors, types.retries) == (3, 1, 1)
+    assert types.connections == 1  # reconnected to retry
+    assert types.ttfb.count == 3
+    assert stats.total().requests == 4
+    assert 'urls' in str(stats)
+
+
+def test_stats_tls():
+    pytest.importorskip('cryptography')
+    with LDRServer(tls=True) as server:
+        conn = server.connection()
+        conn.find_observatories()
+        conn.close()
+    stats = conn.stats['observatories']
+    assert stats.connect.count == stats.tls.count == 1
+    assert stats.tls.mean > 0
+
+
+@mock.patch('gwdatafind.ui._ssl_context')
+@mock.patch('gwdatafind.ui.HTTPSConnection', _http_connection)
+def test_ui_stats(_, server):
+    ui._POOL.clear()
+    stats = ui.connection_stats()
+    stats.reset()
+    try:
+        for site in ('H', 'L'):
+            ui.find_types(site, host=server.address)
+        ui.find_urls('H', 'H1_R', 1000001000, 1000001320,
+                     host=server.address)
+    finally:
+        ui._POOL.clear()
+    assert (stats['types'].requests, stats['urls'].urls) == (2, 11)
+    assert stats.total().connections == 1
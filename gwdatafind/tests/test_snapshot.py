@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for :mod:`gwdatafind.snapshot`
+"""
+
+import pytest
+
+try:
+    from unittest import mock
+except ImportError:  # python < 3
+    import mock
+
+from ligo.segments import (segment, segmentlist)
+
+from .. import (snapshot, ui)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+# files of 4 seconds for [0, 40), with a gap in [12, 20), and a second
+# copy of the first two files over gsiftp
+H1_R = ['file://localhost/data/H1/{0}/H-H1_R-{1}-4.gwf'.format(t // 20, t)
+        for t in range(0, 40, 4) if not 12 <= t < 20]
+H1_R_GSIFTP = [url.replace('file://localhost', 'gsiftp://host.org:15000')
+               for url in H1_R[:2]]
+L1_R = ['file://localhost/data/L1/L-L1_R-{0}-8.h5'.format(t)
+        for t in range(0, 40, 8)]
+URLS = L1_R + H1_R_GSIFTP + H1_R
+
+
+@pytest.fixture(params=(True, False), ids=('cast', 'struct'))
+def snapfile(request, tmpdir):
+    path = str(tmpdir.join('test.gwfsnap'))
+    snapshot.write_snapshot(path, URLS + H1_R[:3])  # duplicates are dropped
+    snapshot._SNAPSHOTS.clear()
+    with mock.patch('gwdatafind.snapshot._CAST', request.param and
+                    snapshot._CAST):
+        yield path
+    snapshot._SNAPSHOTS.clear()
+
+
+def test_snapshot(snapfile):
+    with snapshot.Snapshot(snapfile) as snap:
+        assert len(snap) == len(URLS)
+        assert sorted(snap.datasets) == [('H', 'H1_R'), ('L', 'L1_R')]
+        assert sorted(snap) == sorted(URLS)
+        dataset = snap.get('H', 'H1_R')
+        assert dataset.schemes == ('file', 'gsiftp')
+        assert list(dataset.starts[:3]) == [0, 0, 4]
+        assert dataset.select(5, 21) == [2, 3, 4, 5]
+        assert snap.get('X', 'test') is None
+
+
+def test_write_snapshot_no_int64(tmpdir):
+    # without a 64-bit array typecode, the same file is written from lists
+    path = str(tmpdir.join('array.gwfsnap'))
+    snapshot.write_snapshot(path, URLS)
+    path2 = str(tmpdir.join('list.gwfsnap'))
+    with mock.patch('gwdatafind.utils._INT64', None):
+        snapshot.write_snapshot(path2, URLS)
+    with open(path, 'rb') as file1, open(path2, 'rb') as file2:
+        assert file1.read() == file2.read()
+
+
+def test_write_snapshot_errors(tmpdir):
+    path = str(tmpdir.join('test.gwfsnap'))
+    with pytest.raises(ValueError):
+        snapshot.write_snapshot(path, ['file:///data/bad.gwf'])
+    with pytest.raises(ValueError) as exc:
+        snapshot.write_snapshot(path, ['file:///data/X-test-010-10.gwf'])
+    assert 'plain integers' in str(exc.value)
+    assert not tmpdir.listdir()
+
+
+def test_snapshot_errors(tmpdir):
+    path = tmpdir.join('test.gwfsnap')
+    path.write_binary(b'not a snapshot, just some text')
+    with pytest.raises(ValueError) as exc:
+        snapshot.Snapshot(str(path))
+    assert str(exc.value).endswith('is not a snapshot')
+
+    snapshot.write_snapshot(str(path), URLS)
+    data = path.read_binary()
+    path.write_binary(data[:-10])
+    with pytest.raises(ValueError) as exc:
+        snapshot.Snapshot(str(path))
+    assert str(exc.value).endswith('is truncated')
+
+    path.write_binary(data[:8] + b'\x02' + data[9:])
+    with pytest.raises(ValueError) as exc:
+        snapshot.Snapshot(str(path))
+    assert 'version 2' in str(exc.value)
+
+
+def test_find_urls(snapfile):
+    conn = snapshot.SnapshotConnection(snapfile)
+    assert conn.find_urls('L', 'L1_R', 7, 17) == L1_R[:3]
+    assert conn.find_urls('H', 'H1_R', 0, 8, urltype='gsiftp') == (
+        H1_R_GSIFTP)
+    assert conn.find_urls('H', 'H1_R', 0, 8, urltype=None) == [
+        H1_R[0], H1_R_GSIFTP[0], H1_R[1], H1_R_GSIFTP[1]]
+    assert conn.find_urls('H', 'H1_R', 20, 40, match='/1/') == H1_R[3:]
+    with pytest.warns(UserWarning) as record:
+        assert conn.find_urls('H', 'H1_R', 8, 24) == H1_R[2:4]
+    assert '[12 ... 20)' in str(record[0].message)
+    assert list(conn.iter_urls('H', 'H1_R', 20, 28)) == H1_R[3:5]
+
+
+def test_find_metadata(snapfile):
+    conn = snapshot.SnapshotConnection(snapfile)
+    assert conn.ping() == 0
+    assert sorted(conn.find_observatories()) == ['H', 'L']
+    assert conn.find_types('L') == ['L1_R']
+    assert conn.find_times('H', 'H1_R') == segmentlist([
+        segment(0, 12), segment(20, 40)])
+    assert conn.find_latest('L', 'L1_R') == L1_R[-1:]
+    assert conn.find_url('/any/H-H1_R-4-4.gwf', urltype=None) == [
+        H1_R[1], H1_R_GSIFTP[1]]
+    with pytest.raises(RuntimeError):
+        conn.find_url('H-H1_R-12-4.gwf')
+
+
+def test_refresh(snapfile):
+    conn = snapshot.SnapshotConnection(snapfile)
+    assert conn.find_latest('H', 'H1_R') == H1_R[-1:]
+    newurl = 'file://localhost/data/H-H1_R-40-4.gwf'
+    snapshot.write_snapshot(snapfile, URLS + [newurl])
+    assert conn.find_latest('H', 'H1_R') == H1_R[-1:]  # still open
+    conn.refresh()
+    assert conn.find_latest('H', 'H1_R') == [newurl]
+
+
+def test_ui(snapfile):
+    ui._POOL.clear()
+    try:
+        conn = ui.connect('file://' + snapfile)
+        assert isinstance(conn, snapshot.SnapshotConnection)
+        assert ui.find_urls('L', 'L1_R', 0, 8,
+                            host='file://' + snapfile) == L1_R[:1]
+    finally:
+        ui._POOL.clear()
+
+
+def test_ping(tmpdir):
+    with pytest.raises(RuntimeError):
+        snapshot.SnapshotConnection(str(tmpdir.join('missing'))).ping()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for :mod:`gwdatafind.stats`
+"""
+
+import pytest
+
+try:
+    from unittest import mock
+except ImportError:  # python < 3
+    import mock
+
+from .. import stats
+from ..pool import ConnectionPool
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+
+def test_histogram():
+    hist = stats.Histogram()
+    assert len(hist) == 0
+    assert hist.mean is None and hist.quantile(.5) is None
+    for value in (1e-3, 2e-3, 3e-3, 1.):
+        hist.add(value)
+    assert len(hist) == 4
+    assert hist.mean == pytest.approx(.2515)
+    assert (hist.min, hist.max) == (1e-3, 1.)
+    assert 1e-3 <= hist.quantile(.25) < 2e-3
+    assert 2e-3 <= hist.quantile(.5) < 4e-3
+    assert hist.quantile(1) == 1.
+
+    hist.add(1e6)  # overflow
+    assert hist.counts[-1] == 1
+    assert hist.quantile(1) == 1e6
+
+    other = stats.Histogram()
+    other.merge(hist)
+    assert (other.count, other.total, other.min, other.max) == (
+        hist.count, hist.total, hist.min, hist.max)
+    assert other.counts == hist.counts
+
+
+def test_connection_stats():
+    parent = stats.ConnectionStats()
+    conn = stats.ConnectionStats(parent=parent)
+    conn.count('urls', 'requests')
+    conn.count('urls', 'urls', 10)
+    conn.record('urls', 'ttfb', .5)
+    conn.count(None, 'errors')
+    assert list(conn) == ['other', 'urls']
+    assert conn['urls'].requests == 1
+    assert conn['urls'].ttfb.mean == .5
+    assert conn['missing'].requests == 0
+
+    total = conn.total()
+    assert (total.requests, total.errors, total.urls) == (1, 1, 10)
+    assert conn.as_dict()['urls']['ttfb']['mean'] == .5
+
+    # everything is also recorded by the parent
+    conn.reset()
+    assert not len(conn)
+    assert parent.total().urls == 10
+
+
+def test_summary():
+    conn = stats.ConnectionStats()
+    conn.count('types', 'requests', 2)
+    conn.record('types', 'ttfb', .01)
+    conn.count('urls', 'bytes_received', 1234)
+    lines = conn.summary().splitlines()
+    assert lines[0].split()[:2] == ['endpoint', 'requests']
+    assert lines[1].split()[:2] == ['types', '2']
+    assert '10.0ms' in lines[1]
+    assert lines[3].split()[0] == 'total'
+    assert str(conn) == conn.summary()
+
+
+def test_pool_stats():
+    pool = ConnectionPool(mock.Mock(side_effect=lambda **kw: mock.Mock(
+        stats=stats.ConnectionStats())))
+    conn = pool.acquire(host='a.com')
+    assert conn.stats.parent is pool.stats
+    conn.stats.count('urls', 'requests')
+    assert pool.stats['urls'].requests == 1
@@ -17,6 +17,7 @@
 # along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import time
 
 import pytest
 
@@ -26,6 +27,7 @@ except ImportError:  # python < 3
     import mock
 
 from .. import ui
+from ..urllist import URLList
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
 
@@ -44,6 +46,16 @@ def teardown_module():
     ENVMOCK.stop()
 
 
+@pytest.fixture(autouse=True)
+def clear_pool():
+    """Don't let pooled (mock) connections leak between tests
+    """
+    ui._POOL.clear()
+    yield
+    ui._POOL.clear()
+    ui._SSL_CONTEXT = None
+
+
 @mock.patch('gwdatafind.ui.HTTPConnection')
 @pytest.mark.parametrize('serv', (
     None,
@@ -54,6 +66,18 @@ def test_connect_http(conn, serv):
     conn.assert_called_with(host='test.datafind.com', port=None)
 
 
+@mock.patch('gwdatafind.ui.HOST_HEALTH.rank', side_effect=lambda x: x[::-1])
+@mock.patch('gwdatafind.ui.HTTPConnection')
+def test_connect_hosts(conn, _):
+    with mock.patch.dict(os.environ, {
+            'LIGO_DATAFIND_SERVER': 'a.com:80, b.com:80'}):
+        connection = ui.connect()
+    conn.assert_called_with(host='b.com', port=80)
+    assert connection.hosts == [('a.com', 80), ('b.com', 80)]
+    assert ui._pool_key(['a.com', 'b.com:80']) == ('a.com,b.com:80', None)
+    assert ui._pool_key('a.com:80') == ('a.com', 80)
+
+
 @mock.patch('ssl.create_default_context')
 @mock.patch('gwdatafind.ui.find_credential')
 @mock.patch('gwdatafind.ui.HTTPSConnection')
@@ -70,6 +94,62 @@ def test_connect_https(conn, cred, sslctx):
                             context=loadcert)
 
 
+@mock.patch('ssl.create_default_context')
+@mock.patch('gwdatafind.ui.find_credential')
+def test_ssl_context(cred, sslctx, tmpname):
+    cred.return_value = (tmpname, tmpname)
+    context = ui._ssl_context()
+    assert ui._ssl_context() is context  # shared
+    assert sslctx.call_count == 1
+
+    # check that a renewed credential creates a new context
+    with open(tmpname, 'w') as tmp:
+        tmp.write('renewed\n')
+    ui._ssl_context()
+    assert sslctx.call_count == 2
+    assert cred.call_count == 3  # validity is checked every time
+
+
+@mock.patch('ssl.create_default_context')
+@mock.patch('gwdatafind.ui.find_credential')
+def test_ssl_context_threads(cred, sslctx, tmpname):
+    # only one context is created, however many threads ask for it
+    def _create():
+        time.sleep(.01)  # make a race likely
+        return mock.MagicMock()
+
+    cred.return_value = (tmpname, tmpname)
+    sslctx.side_effect = _create
+    contexts = ui._thread_map(lambda _: ui._ssl_context(), range(8), 8)
+    assert sslctx.call_count == 1
+    assert len(set(map(id, contexts))) == 1
+
+
+@mock.patch('gwdatafind.ui._DEFAULT_RESPONSE_CACHE', None)
+@mock.patch('gwdatafind.ui.ResponseCache')
+@mock.patch('gwdatafind.ui.HTTPConnection')
+def test_connect_cache(conn, rcache):
+    assert ui.connect().cache is None
+    assert ui.connect(cache=True).cache is rcache.return_value
+    assert ui.connect(cache=True).cache is rcache.return_value
+    assert rcache.call_count == 1  # default cache is shared
+    assert ui.connect(cache=rcache).cache is rcache
+
+
+@mock.patch('gwdatafind.ui._DEFAULT_RESPONSE_CACHE', None)
+@mock.patch('gwdatafind.ui.ResponseCache')
+def test_response_cache_threads(rcache):
+    # only one default cache is created, however many threads ask for it
+    def _create():
+        time.sleep(.01)  # make a race likely
+        return mock.Mock()
+
+    rcache.side_effect = _create
+    caches = ui._thread_map(ui._response_cache, [True] * 8, 8)
+    assert rcache.call_count == 1
+    assert len(set(map(id, caches))) == 1
+
+
 @mock.patch('gwdatafind.ui.HTTPConnection', return_value=mock.MagicMock())
 @pytest.mark.parametrize('method', (
     'ping',
@@ -85,3 +165,207 @@ def test_factory_method(conn, method):
     assert getattr(conn.return_value, method).call_count == 1
 
 
+@mock.patch('gwdatafind.ui.HTTPConnection')
+def test_factory_method_reuses_connection(conn):
+    conn.return_value.sock = None
+    ui.find_types()
+    ui.find_types()
+    assert conn.call_count == 1
+    assert conn.return_value.find_types.call_count == 2
+
+
+@mock.patch('gwdatafind.ui.HTTPConnection')
+def test_factory_method_cache(conn):
+    conn.return_value.sock = None
+    rcache = mock.MagicMock()
+
+    def _find_types(*args, **kwargs):
+        return conn.return_value.cache
+
+    conn.return_value.find_types.side_effect = _find_types
+    assert ui.find_types(cache=rcache) is rcache
+    assert ui.find_types() is None  # not left on the pooled connection
+
+
+@mock.patch('gwdatafind.ui.HTTPConnection')
+def test_factory_method_segment_cache(conn):
+    conn.return_value.sock = None
+    scache = mock.MagicMock()
+
+    def _find_urls(*args, **kwargs):
+        return conn.return_value.segment_cache
+
+    conn.return_value.find_urls.side_effect = _find_urls
+    assert ui.find_urls(segment_cache=scache) is scache
+    assert ui.find_urls() is None  # not left on the pooled connection
+    assert ui.connect(segment_cache=scache).segment_cache is scache
+
+
+@mock.patch('gwdatafind.ui.HTTPConnection')
+def test_factory_method_retry(conn):
+    conn.return_value.sock = None
+    policy = mock.MagicMock()
+
+    def _find_types(*args, **kwargs):
+        return conn.return_value.retry
+
+    conn.return_value.find_types.side_effect = _find_types
+    assert ui.find_types(retry=policy) is policy
+    assert ui.find_types() is None  # not left on the pooled connection
+    assert ui.connect(retry=policy).retry is policy
+
+
+def test_factory_method_connection_options():
+    conn = mock.MagicMock(cache=None, segment_cache=None, retry=None)
+    scache = mock.MagicMock()
+    policy = mock.MagicMock()
+
+    def _find_types(*args, **kwargs):
+        assert not kwargs  # the options aren't passed to the method
+        return conn.cache, conn.segment_cache, conn.retry
+
+    # options given with a connection are applied for that call only
+    conn.find_types.side_effect = _find_types
+    assert ui.find_types(connection=conn, cache=False, segment_cache=scache,
+                         retry=policy) == (None, scache, policy)
+    assert (conn.cache, conn.segment_cache, conn.retry) == (None, None, None)
+
+    # and options that aren't given keep the connection's own settings
+    conn.retry = policy
+    assert ui.find_types(connection=conn, segment_cache=scache) == (
+        None, scache, policy)
+    assert conn.segment_cache is None
+
+    # check the same for iter_urls
+    conn.iter_urls.side_effect = lambda *args: iter([conn.segment_cache])
+    assert list(ui.iter_urls('X', 'test', 0, 10, connection=conn,
+                             segment_cache=scache)) == [scache]
+    assert conn.segment_cache is None
+
+
+@mock.patch('gwdatafind.ui.HTTPConnection')
+def test_factory_method_discards_connection_on_error(conn):
+    conn.return_value.find_types.side_effect = RuntimeError
+    with pytest.raises(RuntimeError):
+        ui.find_types()
+    conn.return_value.close.assert_called_once_with()
+    assert not ui._POOL._idle
+
+
+@mock.patch('gwdatafind.ui.HTTPConnection')
+def test_find_urls_many(conn):
+    conn.return_value.sock = None
+
+    def _find_urls(site, frametype, start, end, **kwargs):
+        if site == 'Y':
+            raise RuntimeError('bad query')
+        return ['{0}-{1}-{2}-{3}.gwf'.format(site, frametype, start,
+                                             end - start)]
+
+    conn.return_value.find_urls.side_effect = _find_urls
+    queries = [('X', 'test', 0, 10), ('X', 'test', 10, 20),
+               ('Y', 'test', 0, 10)]
+    results, errors = ui.find_urls_many(queries + queries[:1], nthreads=2,
+                                        on_gaps='ignore')
+    assert results == {
+        ('X', 'test', 0, 10): ['X-test-0-10.gwf'],
+        ('X', 'test', 10, 20): ['X-test-10-10.gwf'],
+    }
+    assert list(errors) == [('Y', 'test', 0, 10)]
+    assert isinstance(errors[('Y', 'test', 0, 10)], RuntimeError)
+    assert conn.return_value.find_urls.call_count == 3
+    conn.return_value.find_urls.assert_any_call(
+        'X', 'test', 0, 10, on_gaps='ignore')
+
+
+@mock.patch('gwdatafind.ui._thread_map', side_effect=ui._thread_map)
+def test_find_urls_many_connection(thread_map):
+    # a connection can't be shared between threads, so is used serially
+    conn = mock.MagicMock()
+
+    def _find_urls(site, frametype, start, end, on_gaps='warn'):
+        return [(site, frametype, start, end)]
+
+    conn.find_urls.side_effect = _find_urls
+    queries = [('X', 'test', 0, 10), ('X', 'test', 10, 20)]
+    results, errors = ui.find_urls_many(queries, nthreads=4,
+                                        connection=conn, on_gaps='ignore')
+    assert results == dict((query, [query]) for query in queries)
+    assert not errors
+    assert thread_map.call_args[0][2] == 1
+
+
+def _fake_find_urls(site, frametype, start, end, **kwargs):
+    # files of 7 seconds, with a gap in [70, 84)
+    return ['file:///test/{0}-{1}-{2}-7.gwf'.format(site, frametype, t)
+            for t in range(start - start % 7, end, 7) if not 70 <= t < 84]
+
+
+@mock.patch('gwdatafind.ui._find_urls', side_effect=_fake_find_urls)
+def test_find_urls_chunked(find):
+    with pytest.warns(UserWarning) as record:
+        urls = ui.find_urls('X', 'test', 5, 100, chunk_size=20, nthreads=2)
+    assert len(record) == 1  # gaps are only checked once
+    assert 'Missing segments' in str(record[0].message)
+
+    # check that each chunk was queried without gap checking
+    assert sorted(call[0][2:4] for call in find.call_args_list) == [
+        (5, 20), (20, 40), (40, 60), (60, 80), (80, 100)]
+    for call in find.call_args_list:
+        assert call[1]['on_gaps'] == 'ignore'
+
+    # check that files spanning chunk boundaries are not duplicated
+    assert urls == _fake_find_urls('X', 'test', 5, 100)
+
+    # check that a connection forces a serial query
+    find.reset_mock()
+    conn = mock.MagicMock()
+    ui.find_urls('X', 'test', 0, 40, chunk_size=20, on_gaps='ignore',
+                 connection=conn)
+    assert find.call_args_list[0][1]['connection'] is conn
+
+    # check that a compact result is only built once, at the end
+    find.reset_mock()
+    urls = ui.find_urls('X', 'test', 0, 40, chunk_size=20, on_gaps='ignore',
+                        compact=True)
+    assert isinstance(urls, URLList)
+    assert urls == _fake_find_urls('X', 'test', 0, 40)
+    assert 'compact' not in find.call_args_list[0][1]
+
+
+@mock.patch('gwdatafind.ui.time.time', side_effect=range(0, 1000, 10))
+@mock.patch('gwdatafind.ui._find_urls', side_effect=_fake_find_urls)
+def test_find_urls_chunked_adaptive(find, _):
+    # each query takes 10 seconds, so the chunk size should double each
+    # time, while staying aligned
+    ui.find_urls('X', 'test', 0, 128, chunk_size=16, nthreads=1,
+                 target_latency=100, on_gaps='ignore')
+    assert [call[0][2:4] for call in find.call_args_list] == [
+        (0, 16), (16, 32), (32, 64), (64, 128)]
+
+    # and halve when they take too long
+    find.reset_mock()
+    ui.find_urls('X', 'test', 0, 64, chunk_size=32, nthreads=1,
+                 target_latency=1, on_gaps='ignore')
+    assert [call[0][2:4] for call in find.call_args_list] == [
+        (0, 32), (32, 48), (48, 56), (56, 60), (60, 62), (62, 63), (63, 64)]
+
+
+@mock.patch('gwdatafind.ui.HTTPConnection')
+def test_iter_urls(conn):
+    conn.return_value.sock = None
+    conn.return_value.iter_urls.return_value = iter(['a', 'b'])
+    urls = ui.iter_urls('X', 'test', 0, 10)
+    assert next(urls) == 'a'
+    assert not ui._POOL._idle  # connection is held while streaming
+    assert list(urls) == ['b']
+    conn.return_value.iter_urls.assert_called_once_with('X', 'test', 0, 10)
+    assert ui._POOL._idle[('test.datafind.com', None)][0][0] is (
+        conn.return_value)
+
+    # check that an abandoned stream discards the connection
+    conn.return_value.iter_urls.return_value = iter(['a', 'b'])
+    urls = ui.iter_urls('X', 'test', 0, 10)
+    next(urls)
+    urls.close()
+    conn.return_value.close.assert_called_once_with()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for :mod:`gwdatafind.urllist`
+"""
+
+import pickle
+
+import pytest
+
+from ..urllist import URLList
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+
+URLS = [
+    'file:///data/H1/H-H1_R-0-10.gwf',
+    'file:///data/H1/H-H1_R-10-10.gwf',
+    'file:///data/H1/H-H1_R-20-10.gwf',
+    'file:///data/H1/H-H1_R-40-10.gwf',  # gap
+    'file:///data/H1/H-H1_R-50-5.gwf',  # new duration
+    'file:///other/H1/H-H1_R-55-5.gwf',  # new directory
+    'gsiftp://host/data/H1/H-H1_R-55-5.gwf',  # new scheme
+    'H-H1_R-060-5.gwf',  # no directory, not canonical
+    'H-H1_R-65-5.gwf',
+    'H-H1_R-70-5',  # no extension
+]
+
+
+def test_urllist():
+    urls = URLList(URLS)
+    assert len(urls) == len(URLS)
+    assert urls.nruns == 7
+    assert list(urls) == URLS
+    assert urls == URLS
+    assert not urls != URLS
+    assert urls != URLS[::-1]
+    assert urls == URLList(URLS)
+    for i in range(-len(URLS), len(URLS)):
+        assert urls[i] == URLS[i]
+    assert urls[2:8:2] == URLS[2:8:2]
+    assert URLS[5] in urls
+    assert urls.index(URLS[3]) == 3
+    assert repr(urls) == 'URLList({0!r})'.format(URLS)
+    assert pickle.loads(pickle.dumps(urls)) == URLS
+
+    with pytest.raises(IndexError):
+        urls[len(URLS)]
+    with pytest.raises(TypeError):
+        hash(urls)
+
+
+def test_urllist_coverage():
+    starts, durations = URLList(URLS).coverage()
+    assert list(starts) == [0, 40, 50, 55, 55, 60, 70]
+    assert list(durations) == [30, 10, 5, 5, 5, 10, 5]
+
+
+def test_urllist_append():
+    urls = URLList()
+    assert urls == []
+    for url in URLS:
+        urls.append(url)
+    assert urls == URLS
+    with pytest.raises(ValueError):
+        urls.append('file:///data/H1/H-H1-R-0-10.gwf')
+    with pytest.raises(ValueError):
+        urls.append('file:///data/H1/H-H1_R-0-abc.gwf')
+    assert urls == URLS
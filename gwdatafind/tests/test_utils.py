@@ -20,11 +20,14 @@
 
 import os
 import sys
+from array import array
 
 from OpenSSL import crypto
 
 import pytest
 
+from ligo.segments import (segment, segmentlist)
+
 try:
     from unittest import mock
 except ImportError:  # python < 3
@@ -42,7 +45,23 @@ def test_get_default_host():
     assert utils.get_default_host() == 'test'
 
 
-@mock.patch('gwdatafind.utils.crypto.load_certificate')
+@pytest.mark.parametrize('host, root', [
+    ('file:///cvmfs/data', '/cvmfs/data'),
+    ('file://localhost/cvmfs/data', '/cvmfs/data'),
+    ('file://data/H1', 'data/H1'),
+    ('datafind.ligo.org:443', None),
+    (None, None),
+])
+def test_local_root(host, root):
+    assert utils._local_root(host) == root
+
+
+def test_split_hosts_local():
+    assert utils._split_hosts('file:///cvmfs/data') == [
+        ('file:///cvmfs/data', None)]
+
+
+@mock.patch('OpenSSL.crypto.load_certificate')
 def test_validate_proxy(loader, tmpname):
     # mocks
     cert = mock.MagicMock()
@@ -60,22 +79,51 @@ def test_validate_proxy(loader, tmpname):
     assert loader.called_once_with(crypto.FILETYPE_PEM, 'test\n')
 
     # check non-RFC3820 non-proxy still returns
+    utils._PROXY_EXPIRY.clear()
     ext.get_short_name.return_value = 'test'
     assert utils.validate_proxy(tmpname)
 
     # check expired ticket
+    utils._PROXY_EXPIRY.clear()
     cert.get_notAfter.return_value = '20000101000000Z'
     with pytest.raises(RuntimeError) as exc:
         utils.validate_proxy(tmpname)
     assert str(exc.value) == 'Required proxy credential has expired'
 
     # assert non-RFC3820 non-proxy raises correct error
+    utils._PROXY_EXPIRY.clear()
     subject.CN = 'proxy'
     with pytest.raises(RuntimeError) as exc:
         utils.validate_proxy(tmpname)
     assert str(exc.value) == 'Could not find a valid proxy credential'
 
 
+@mock.patch('OpenSSL.crypto.load_certificate')
+def test_validate_proxy_cache(loader, tmpname):
+    utils._PROXY_EXPIRY.clear()
+    cert = loader.return_value
+    cert.get_extension_count.return_value = 0
+    cert.get_subject.return_value.CN = ''
+    cert.get_notAfter.return_value = '22000101000000Z'
+
+    # check that an unchanged file is only loaded once
+    assert utils.validate_proxy(tmpname)
+    assert utils.validate_proxy(tmpname)
+    assert loader.call_count == 1
+
+    # but expiry is still checked
+    with mock.patch('gwdatafind.utils.time.time', return_value=1e10):
+        with pytest.raises(RuntimeError) as exc:
+            utils.validate_proxy(tmpname)
+    assert str(exc.value) == 'Required proxy credential has expired'
+
+    # and a renewed file is loaded again
+    with open(tmpname, 'w') as tmp:
+        tmp.write('renewed\n')
+    assert utils.validate_proxy(tmpname)
+    assert loader.call_count == 2
+
+
 @mock.patch.dict('os.environ', clear=True)
 @mock.patch('gwdatafind.utils.validate_proxy', return_value=True)
 @mock.patch('os.access', return_value=True)
@@ -119,3 +167,94 @@ def test_find_credential_environment(access, validate):
         'X509_USER_KEY': 'test_key',
     })
     assert utils.find_credential() == ('test_cert', 'test_key')
+
+
+@pytest.mark.parametrize('url, parts', [
+    ('file:///tmp/H-H1_TEST-0-10.gwf',
+     ('file:///tmp/', 'H', 'H1_TEST', 0, 10, '.gwf', True)),
+    ('H-H1_TEST-20-5.gwf.gz',
+     ('', 'H', 'H1_TEST', 20, 5, '.gwf.gz', True)),
+    ('/tmp/H-H1_TEST-030-10',
+     ('/tmp/', 'H', 'H1_TEST', 30, 10, '', False)),
+])
+def test_split_filename(url, parts):
+    assert utils._split_filename(url) == parts
+    if parts[-1]:
+        assert '{0}{1}-{2}-{3}-{4}{5}'.format(*parts[:-1]) == url
+
+
+def test_split_filename_error():
+    with pytest.raises(ValueError) as exc:
+        utils._split_filename('file:///tmp/H-H1-TEST-0-10.gwf')
+    with pytest.raises(ValueError) as exc2:
+        utils.filename_metadata('file:///tmp/H-H1-TEST-0-10.gwf')
+    assert str(exc.value) == str(exc2.value)
+
+
+def test_filename_metadata_array():
+    urls = [
+        'file:///tmp/H-H1_TEST-0-10.gwf',
+        'gsiftp://host/tmp/L-L1_TEST-10-10.gwf',
+        'H-H1_TEST-20-5.gwf.gz',
+        '/tmp/H-H1_OTHER-30-10',
+    ]
+    obs, tags, codes, start, duration = utils.filename_metadata_array(urls)
+    assert obs == ['H', 'L', 'H', 'H']
+    assert tags == ['H1_TEST', 'L1_TEST', 'H1_OTHER']
+    assert list(codes) == [0, 1, 0, 2]
+    assert start.typecode == duration.typecode == utils._INT64
+    assert list(start) == [0, 10, 20, 30]
+    assert list(duration) == [10, 10, 5, 10]
+
+    # check that the results match the single-file parser
+    for i, url in enumerate(urls):
+        assert utils.filename_metadata(url) == (
+            obs[i], tags[codes[i]],
+            (start[i], start[i] + duration[i]))
+
+    # check empty input
+    assert utils.filename_metadata_array([]) == (
+        [], [], array('l'), utils._int64_array(), utils._int64_array())
+
+
+@mock.patch.object(utils, '_INT64', None)
+def test_filename_metadata_array_no_int64():
+    # without a 64-bit array typecode, the times are returned as lists
+    obs, tags, codes, start, duration = utils.filename_metadata_array([
+        'H-H1_TEST-0-10.gwf',
+        'H-H1_TEST-10000000000-10.gwf',
+    ])
+    assert start == [0, 10000000000]
+    assert duration == [10, 10]
+
+
+@pytest.mark.parametrize('url', [
+    'file:///tmp/H-H1-TEST-0-10.gwf',
+    'file:///tmp/H-0-10.gwf',
+    'file:///tmp/H-H1_TEST-0-abc.gwf',
+])
+def test_filename_metadata_array_error(url):
+    with pytest.raises(ValueError):
+        utils.filename_metadata_array(['file:///tmp/H-H1_TEST-0-10.gwf', url])
+
+
+@pytest.mark.parametrize('files, span', [
+    ([], (0, 10)),
+    ([(0, 10)], (0, 10)),
+    ([(0, 10)], (10, 0)),
+    ([(0, 10)], (5, 5)),
+    ([(0, 4), (6, 4)], (0, 10)),
+    ([(6, 4), (0, 4)], (0, 10)),  # unsorted
+    ([(0, 4), (4, 0), (4, 6)], (0, 10)),  # zero-length file
+    ([(0, 4), (5, 0), (8, 2)], (-2, 12)),
+    ([(0, 10), (2, 3), (4, 1), (12, 4)], (0, 20)),
+    ([(-10, 5), (20, 5)], (0, 10)),
+])
+def test_missing_segments(files, span):
+    starts = [f[0] for f in files]
+    durations = [f[1] for f in files]
+    # check the result matches what ligo.segments would give
+    covered = segmentlist(
+        segment(start, start + duration) for start, duration in files)
+    expected = (segmentlist([segment(*span)]) - covered.coalesce()).coalesce()
+    assert utils._missing_segments(starts, durations, *span) == expected
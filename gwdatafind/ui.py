@@ -16,59 +16,202 @@
 # You should have received a copy of the GNU General Public License
 # along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import ssl
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
 
-from .utils import (find_credential, get_default_host)
-from .http import (HTTPConnection, HTTPSConnection)
+from .cache import ResponseCache
+from .utils import (_local_root, _split_hosts,
+                    filename_metadata_array, find_credential)
+from .http import (HTTPConnection, HTTPSConnection, _handle_gaps)
+from .pool import (ConnectionPool, HOST_HEALTH)
+from .urllist import URLList
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
 
 
-def connect(host=None, port=None):
+def _pool_key(host=None, port=None):
+    """Return the ``(host, port)`` key for a connection in the pool
+    """
+    hosts = _split_hosts(host, port)
+    if len(hosts) == 1:
+        return hosts[0]
+    return ','.join('{0}:{1}'.format(*h) if h[1] else h[0]
+                    for h in hosts), None
+
+
+_SSL_CONTEXT = None
+_SSL_CONTEXT_LOCK = threading.Lock()
+
+
+def _file_version(path):
+    """Return the modification time and size of a file, or `None`
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+def _ssl_context():
+    """Return an `ssl.SSLContext` loaded with the user's X509 credential
+
+    The context is shared by all connections, and is only rebuilt when
+    the credential files change.
+    """
+    global _SSL_CONTEXT
+    cert, key = find_credential()
+    version = (cert, key, _file_version(cert), _file_version(key))
+    with _SSL_CONTEXT_LOCK:
+        if _SSL_CONTEXT is None or _SSL_CONTEXT[0] != version:
+            context = ssl.create_default_context()
+            context.load_cert_chain(cert, key)
+            _SSL_CONTEXT = (version, context)
+        return _SSL_CONTEXT[1]
+
+
+_DEFAULT_RESPONSE_CACHE = None
+_DEFAULT_RESPONSE_CACHE_LOCK = threading.Lock()
+
+
+def _response_cache(cache):
+    """Resolve the ``cache`` keyword given to `connect` or a ui function
+    """
+    global _DEFAULT_RESPONSE_CACHE
+    if cache is True:  # use (and share) the default on-disk cache
+        with _DEFAULT_RESPONSE_CACHE_LOCK:
+            if _DEFAULT_RESPONSE_CACHE is None:
+                _DEFAULT_RESPONSE_CACHE = ResponseCache()
+            return _DEFAULT_RESPONSE_CACHE
+    return cache or None
+
+
+def connect(host=None, port=None, cache=None, segment_cache=None,
+            retry=None):
     """Open a new connection to a Datafind server
 
     This method will auto-select between HTTP and HTTPS based on port,
     and (for HTTPS) will automatically load the necessary X509 credentials
     using :func:`gwdatafind.utils.find_credential`.
+    If ``host`` is a ``file://`` URL, queries are answered from the
+    frame files found below that directory, without a server
+    (see `gwdatafind.local.LocalConnection`), or from that file if it
+    is a snapshot (see `gwdatafind.snapshot.SnapshotConnection`).
 
     Parameters
     ----------
-    host : `str`, optional
+    host : `str`, `list` of `str`, optional
         the name of the datafind server to connect to; if not given will be
         taken from the ``LIGO_DATAFIND_SERVER`` environment variable.
+        Give a list (or comma-separated string) of names to connect to
+        the fastest healthy one of a set of replicated servers, and fail
+        over to the others if it stops responding; all replicas must use
+        the same protocol (HTTP or HTTPS).
+        Give a ``file://`` URL (e.g. ``'file:///cvmfs/gwosc.osgstorage.org'``)
+        to search a local directory tree instead.
 
     port : `int`, optional
         the port on the server to use, if not given it will be stripped from
         the ``host`` name.
 
+    cache : `bool`, `gwdatafind.cache.ResponseCache`, optional
+        the cache of query responses to use (e.g. an in-memory
+        `~gwdatafind.cache.MemoryCache`), or `True` to use the
+        default on-disk `~gwdatafind.cache.ResponseCache`, default is to
+        not use a cache
+
+    segment_cache : `gwdatafind.cache.SegmentCache`, optional
+        the cache of `~HTTPConnection.find_urls` results to use, so that
+        repeated or overlapping queries only ask the server for the parts
+        of each GPS interval that haven't been queried before
+
+    retry : `gwdatafind.retry.RetryPolicy`, optional
+        how to retry requests that fail for transient reasons (e.g. server
+        errors or dropped connections), default is to not retry
+
     Returns
     -------
     connection : `gwdatafind.HTTPConnection` or `gwdatafind.HTTPSConnection`
-        a newly opened connection
+        a newly opened connection, or a `~gwdatafind.local.LocalConnection`
+        (or `~gwdatafind.snapshot.SnapshotConnection`) for a ``file://``
+        host
     """
-    if host is None:
-        host = get_default_host()
-    if port is None:
-        try:
-            host, port = host.rsplit(':', 1)
-        except ValueError:
-            pass
-        else:
-            port = int(port)
-    if port not in (None, 80):
-        cert, key = find_credential()
-        context = ssl.create_default_context()
-        context.load_cert_chain(cert, key)
-        return HTTPSConnection(host=host, port=port, context=context)
-    return HTTPConnection(host=host, port=port)
+    hosts = _split_hosts(host, port)
+    host, port = HOST_HEALTH.rank(hosts)[0]
+    root = _local_root(host)
+    if root is not None and os.path.isfile(root):
+        from .snapshot import SnapshotConnection
+        connection = SnapshotConnection(root)
+    elif root is not None:
+        from .local import LocalConnection
+        connection = LocalConnection(root)
+    elif port not in (None, 80):
+        connection = HTTPSConnection(host=host, port=port,
+                                     context=_ssl_context())
+    else:
+        connection = HTTPConnection(host=host, port=port)
+    connection.cache = _response_cache(cache)
+    connection.segment_cache = segment_cache
+    connection.retry = retry
+    if len(hosts) > 1:
+        connection.hosts = hosts
+    return connection
+
+
+# pool of keep-alive connections shared by all of the convenience functions
+_POOL = ConnectionPool(connect)
+
+
+def _pop_options(kwargs):
+    """Pop the ``cache``, ``segment_cache``, and ``retry`` keywords for a
+    ui function
+    """
+    return (_response_cache(kwargs.pop('cache', None)),
+            kwargs.pop('segment_cache', None),
+            kwargs.pop('retry', None))
+
+
+@contextmanager
+def _given_options(connection, kwargs):
+    """Apply the ``cache``, ``segment_cache``, and ``retry`` keywords
+    given to a ui function to the user's own connection
+
+    Only the options that were given are applied, and the connection's
+    own settings are restored afterwards.
+    """
+    given = dict((key, kwargs.pop(key)) for key in
+                 ('cache', 'segment_cache', 'retry') if key in kwargs)
+    if 'cache' in given:
+        given['cache'] = _response_cache(given['cache'])
+    old = dict((key, getattr(connection, key)) for key in given)
+    for key, value in given.items():
+        setattr(connection, key, value)
+    try:
+        yield connection
+    finally:
+        for key, value in old.items():
+            setattr(connection, key, value)
 
 
 def _with_connection(func):
+    @wraps(func)
     def wrapper(*args, **kwargs):
-        if not kwargs.get('connection'):
-            kw = {key: kwargs.pop(key, None) for key in ('host', 'port')}
-            kwargs['connection'] = connect(**kw)
-        return func(*args, **kwargs)
+        connection = kwargs.get('connection')
+        if connection:
+            with _given_options(connection, kwargs):
+                return func(*args, **kwargs)
+        host, port = _pool_key(kwargs.pop('host', None),
+                               kwargs.pop('port', None))
+        options = _pop_options(kwargs)
+        with _POOL.connection(host=host, port=port) as connection:
+            (connection.cache, connection.segment_cache,
+             connection.retry) = options
+            kwargs['connection'] = connection
+            return func(*args, **kwargs)
     return wrapper
 
 
@@ -88,5 +231,262 @@ find_observatories = _ui_factory('find_observatories')
 find_types = _ui_factory('find_types')
 find_times = _ui_factory('find_times')
 find_url = _ui_factory('find_url')
-find_urls = _ui_factory('find_urls')
+_find_urls = _ui_factory('find_urls')
 find_latest = _ui_factory('find_latest')
+
+
+def iter_urls(*args, **kwargs):
+    # the connection has to be held for as long as the generator is
+    # being consumed, so we can't use _with_connection
+    connection = kwargs.pop('connection', None)
+    if connection:
+        with _given_options(connection, kwargs):
+            for url in connection.iter_urls(*args, **kwargs):
+                yield url
+        return
+    host, port = _pool_key(kwargs.pop('host', None),
+                           kwargs.pop('port', None))
+    options = _pop_options(kwargs)
+    with _POOL.connection(host=host, port=port) as connection:
+        (connection.cache, connection.segment_cache,
+         connection.retry) = options
+        for url in connection.iter_urls(*args, **kwargs):
+            yield url
+
+
+iter_urls.__doc__ = HTTPConnection.iter_urls.__doc__
+
+
+def connection_stats():
+    """Return the request statistics of the convenience functions
+
+    The statistics of every connection in the shared pool are aggregated,
+    by endpoint, including those of connections that have since been
+    closed.
+
+    Returns
+    -------
+    stats : `gwdatafind.stats.ConnectionStats`
+        the (live) statistics, use
+        :meth:`~gwdatafind.stats.ConnectionStats.reset` to start again
+
+    Examples
+    --------
+    >>> from gwdatafind import (connection_stats, find_urls)
+    >>> urls = find_urls('L', 'L1_GWOSC_O2_4KHZ_R1', 1187008880, 1187008884)
+    >>> print(connection_stats())
+    """
+    return _POOL.stats
+
+
+# -- bulk queries -------------------------------------------------------------
+
+def _thread_map(func, iterable, nthreads):
+    """Map a function over an iterable using a pool of threads
+    """
+    if nthreads <= 1:
+        return list(map(func, iterable))
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(nthreads)
+    try:
+        return pool.map(func, iterable)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def find_urls(*args, **kwargs):
+    """Find all files of the given type in the [start, end) GPS interval.
+
+    Parameters
+    ----------
+    site : `str`
+        single-character name of site to match
+
+    frametype : `str`
+        name of frametype to match
+
+    gpsstart : `int`
+        integer GPS start time of query
+
+    gpsend : `int`
+        integer GPS end time of query
+
+    match : `str`, `re.Pattern`, optional
+        regular expression to match against
+
+    urltype : `str`, optional
+        file scheme to search for, one of 'file', 'gsiftp', or
+        `None`, default: 'file'
+
+    on_gaps : `str`, optional
+        what to do when the requested frame isn't found, one of:
+
+        - ``'warn'`` print a warning (default), or
+        - ``'error'``: raise a `RuntimeError`, or
+        - ``'ignore'``: do nothing
+
+    chunk_size : `int`, optional
+        if given, split the ``[gpsstart, gpsend)`` interval into chunks of
+        (at most) this many seconds, aligned to integer multiples of
+        ``chunk_size``, and query for each chunk in parallel
+
+    nthreads : `int`, optional
+        the maximum number of chunks to query at the same time
+
+    target_latency : `float`, optional
+        if given (with ``chunk_size``), adapt the chunk size between
+        batches of ``nthreads`` chunks, halving it when the slowest query
+        takes more than twice this many seconds, and doubling it when the
+        slowest query takes less than half this long
+
+    host : `str`, optional
+        the name of the datafind server to connect to
+
+    port : `int`, optional
+        the port on the server to use
+
+    segment_cache : `gwdatafind.cache.SegmentCache`, optional
+        the cache of results to use, so that only the parts of the interval
+        that haven't been queried before are requested from the server
+
+    retry : `gwdatafind.retry.RetryPolicy`, optional
+        how to retry requests that fail for transient reasons
+
+    compact : `bool`, optional
+        if `True` return the URLs as a `~gwdatafind.urllist.URLList`,
+        which uses much less memory than a `list` for large results
+
+    connection : `HTTPConnection`, optional
+        the connection to use, in which case chunks are queried serially
+
+    Returns
+    -------
+    cache : `list` of `str`, `~gwdatafind.urllist.URLList`
+        the list of discovered file URLs; when querying in chunks, files
+        that span chunk boundaries are only returned once, and the list is
+        sorted by GPS start time
+    """
+    chunk_size = kwargs.pop('chunk_size', None)
+    nthreads = kwargs.pop('nthreads', 8)
+    target_latency = kwargs.pop('target_latency', None)
+    if not chunk_size:
+        return _find_urls(*args, **kwargs)
+    return _find_urls_chunked(*args, chunk_size=chunk_size, nthreads=nthreads,
+                              target_latency=target_latency, **kwargs)
+
+
+def _find_urls_chunked(site, frametype, gpsstart, gpsend, chunk_size,
+                       nthreads=8, target_latency=None, on_gaps="warn",
+                       compact=False, **kwargs):
+    """Find URLs for a long interval by querying in aligned chunks
+    """
+    if kwargs.get('connection'):  # can't share one connection between threads
+        nthreads = 1
+
+    def _find(chunk):
+        start = time.time()
+        urls = _find_urls(site, frametype, chunk[0], chunk[1],
+                          on_gaps='ignore', **kwargs)
+        return urls, time.time() - start
+
+    urls = set()
+    size = int(chunk_size)
+    cursor = gpsstart
+    while cursor < gpsend:
+        # build the next batch of chunks, if the chunk size is adaptive
+        # we only take one chunk per thread so that we can respond to the
+        # latency of that batch
+        chunks = []
+        while cursor < gpsend and not (target_latency and
+                                       len(chunks) >= nthreads):
+            end = min(gpsend, (cursor // size + 1) * size)
+            chunks.append((cursor, end))
+            cursor = end
+
+        results = _thread_map(_find, chunks, nthreads)
+        for chunkurls, _ in results:
+            urls.update(chunkurls)
+
+        # adapt chunk size to the response times of the latest batch
+        if target_latency:
+            latency = max(latency for _, latency in results)
+            if latency > 2 * target_latency:
+                size = max(size // 2, 1)
+            elif latency < target_latency / 2.:
+                size *= 2
+
+    urls = list(urls)
+    starts = filename_metadata_array(urls)[3]
+    urls = [url for _, url in sorted(zip(starts, urls))]
+    if compact:
+        urls = URLList(urls)
+    return _handle_gaps(urls, gpsstart, gpsend, on_gaps=on_gaps)
+
+
+def find_urls_many(queries, nthreads=8, host=None, port=None, **kwargs):
+    """Find the URLs for many ``find_urls`` queries at once.
+
+    The queries are executed concurrently using a pool of threads, each of
+    which draws keep-alive connections from the same connection pool used
+    by the other convenience functions.
+
+    Parameters
+    ----------
+    queries : `list` of `tuple`
+        the list of queries to perform, each of which should be a tuple of
+        ``(site, frametype, gpsstart, gpsend)``
+
+    nthreads : `int`, optional
+        the maximum number of queries to execute at the same time;
+        if a ``connection`` is given the queries are executed one at a
+        time, since a connection can't be shared between threads
+
+    host : `str`, optional
+        the name of the datafind server to connect to
+
+    port : `int`, optional
+        the port on the server to use
+
+    **kwargs
+        other keyword arguments (e.g. ``urltype``, ``on_gaps``) are passed
+        to :meth:`HTTPConnection.find_urls` for every query
+
+    Returns
+    -------
+    results : `dict`
+        a `dict` of ``(query, urls)`` pairs for each successful query
+
+    errors : `dict`
+        a `dict` of ``(query, exception)`` pairs for each query that raised
+        an exception; a failure does not interrupt the other queries
+
+    Examples
+    --------
+    >>> from gwdatafind import find_urls_many
+    >>> results, errors = find_urls_many([
+    ...     ("H", "H1_GWOSC_O2_4KHZ_R1", 1187008880, 1187008884),
+    ...     ("L", "L1_GWOSC_O2_4KHZ_R1", 1187008880, 1187008884),
+    ... ], host="datafind.ligo.org:443")
+    """
+    queries = list(set(map(tuple, queries)))
+    if kwargs.get('connection'):  # can't share one connection between threads
+        nthreads = 1
+    else:
+        kwargs.update(host=host, port=port)
+
+    def _find(query):
+        try:
+            urls = find_urls(*query, **kwargs)
+        except Exception as exc:  # collect for the caller
+            return query, None, exc
+        return query, urls, None
+
+    results = {}
+    errors = {}
+    for query, urls, exc in _thread_map(_find, queries, nthreads):
+        if exc is None:
+            results[query] = urls
+        else:
+            errors[query] = exc
+    return results, errors
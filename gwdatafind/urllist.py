@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# Copyright Duncan Macleod 2018
+#
+# This file is part of GWDataFind.
+#
+# GWDataFind is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# GWDataFind is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with GWDataFind.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A compact container for lists of LIGO-T050017 file URLs.
+"""
+
+from array import array
+from bisect import bisect_right
+
+try:
+    from collections.abc import Sequence
+except ImportError:  # python < 3.3
+    from collections import Sequence
+
+from .utils import (_int64_array, _split_filename)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__all__ = ['URLList']
+
+
+class URLList(Sequence):
+    """A compact, read-only list of LIGO-T050017 file URLs.
+
+    URLs are not stored as strings.
+    Each URL is split into a directory prefix, observatory, tag, and file
+    extension, which are stored once in a table of 'formats', plus an
+    integer GPS start time and duration.
+    Consecutive URLs that share a format and duration, and are contiguous
+    in time, are stored as a single run (like the entries of an omega-style
+    frame cache), so a typical list of files needs only a handful of
+    integers per directory.
+
+    URL strings are rebuilt on demand when the list is indexed or iterated
+    over, so a `URLList` can be used in place of a `list` of `str`.
+
+    Parameters
+    ----------
+    urls : iterable of `str`, optional
+        the URLs with which to populate the list
+
+    Raises
+    ------
+    ValueError
+        if any of the URLs does not follow LIGO-T050017
+
+    Examples
+    --------
+    >>> from gwdatafind.urllist import URLList
+    >>> urls = URLList([
+    ...     'file:///data/H1/H-H1_R-1000000000-64.gwf',
+    ...     'file:///data/H1/H-H1_R-1000000064-64.gwf',
+    ...     'file:///data/H1/H-H1_R-1000000128-64.gwf',
+    ... ])
+    >>> len(urls), urls.nruns
+    (3, 1)
+    >>> urls[-1]
+    'file:///data/H1/H-H1_R-1000000128-64.gwf'
+
+    Results from :meth:`~gwdatafind.HTTPConnection.find_urls` can be
+    returned in this form by giving ``compact=True``.
+    """
+    def __init__(self, urls=()):
+        self._formats = []
+        self._format_index = {}
+        self._fmt = array('l')
+        self._start = _int64_array()
+        self._duration = _int64_array()
+        self._count = _int64_array()
+        self._offset = _int64_array()  # index of the first URL in each run
+        self._size = 0
+        self._raw = {}  # URLs that can't be rebuilt exactly, by index
+        self.extend(urls)
+
+    # -- building -------------------------------
+
+    def append(self, url):
+        """Append a URL to the end of this list
+        """
+        prefix, obs, tag, start, duration, ext, exact = _split_filename(url)
+        key = (prefix, obs, tag, ext)
+        try:
+            fmt = self._format_index[key]
+        except KeyError:
+            fmt = self._format_index[key] = len(self._formats)
+            self._formats.append(key)
+
+        # keep the exact string if it can't be rebuilt from its parts
+        if not exact:
+            self._raw[self._size] = url
+
+        # extend the last run, or start a new one
+        if (self._count and self._fmt[-1] == fmt and
+                self._duration[-1] == duration and
+                self._start[-1] + self._count[-1] * duration == start):
+            self._count[-1] += 1
+        else:
+            self._fmt.append(fmt)
+            self._start.append(start)
+            self._duration.append(duration)
+            self._count.append(1)
+            self._offset.append(self._size)
+        self._size += 1
+
+    def extend(self, urls):
+        """Append all URLs from an iterable to the end of this list
+        """
+        for url in urls:
+            self.append(url)
+
+    # -- sequence interface ---------------------
+
+    def _build(self, fmt, start, duration):
+        prefix, obs, tag, ext = self._formats[fmt]
+        return '{0}{1}-{2}-{3}-{4}{5}'.format(
+            prefix, obs, tag, start, duration, ext)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("URLList index out of range")
+        try:
+            return self._raw[index]
+        except KeyError:
+            pass
+        run = bisect_right(self._offset, index) - 1
+        duration = self._duration[run]
+        start = self._start[run] + (index - self._offset[run]) * duration
+        return self._build(self._fmt[run], start, duration)
+
+    def __iter__(self):
+        raw = self._raw
+        index = 0
+        for fmt, start, duration, count in zip(
+                self._fmt, self._start, self._duration, self._count):
+            prefix, obs, tag, ext = self._formats[fmt]
+            head = '{0}{1}-{2}-'.format(prefix, obs, tag)
+            tail = '-{0}{1}'.format(duration, ext)
+            for i in range(count):
+                if raw and index in raw:
+                    yield raw[index]
+                else:
+                    yield head + str(start + i * duration) + tail
+                index += 1
+
+    def __eq__(self, other):
+        if isinstance(other, (URLList, list, tuple)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(type(self).__name__, list(self))
+
+    # -- metadata -------------------------------
+
+    @property
+    def nruns(self):
+        """The number of contiguous runs of files in this list
+        """
+        return len(self._count)
+
+    def coverage(self):
+        """Return the GPS start time and length of each run of files
+
+        Returns
+        -------
+        starts : `array.array`
+            the GPS start time of each run
+
+        durations : `array.array`
+            the total duration of each run
+        """
+        return self._start, _int64_array([
+            count * duration for count, duration in
+            zip(self._count, self._duration)])
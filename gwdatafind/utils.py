@@ -21,11 +21,50 @@
 import calendar
 import os
 import time
-from operator import attrgetter
+from array import array
+from importlib import import_module
+from operator import (attrgetter, itemgetter, methodcaller)
 
-from OpenSSL import crypto
+from six import string_types
 
-from ligo.segments import segment
+
+class _LazyModule(object):
+    """A module that is only imported when one of its attributes is used
+
+    This keeps ``import gwdatafind`` (and the command-line interface)
+    fast for code paths that never need the module.
+    """
+    def __init__(self, name):
+        self._lazy_name = name
+
+    def __getattr__(self, attr):
+        module = import_module(self._lazy_name)
+        # copy the namespace, so that __getattr__ isn't called again
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+segments = _LazyModule('ligo.segments')
+
+# the `array.array` typecode of a signed 64-bit integer, or `None` if
+# there isn't one ('q' was added in python 3.3)
+try:
+    array('q')
+except ValueError:  # python < 3.3
+    _INT64 = 'l' if array('l').itemsize == 8 else None
+else:
+    _INT64 = 'q'
+
+
+def _int64_array(values=()):
+    """Return a sequence of signed 64-bit integers
+
+    This is an `array.array` wherever the platform has a 64-bit typecode,
+    otherwise a `list`.
+    """
+    if _INT64 is None:
+        return list(values)
+    return array(_INT64, values)
 
 
 def get_default_host():
@@ -49,6 +88,49 @@ def get_default_host():
                          "environment variable")
 
 
+def _local_root(host):
+    """Return the directory named by a ``file://`` host, or `None`
+    """
+    if not isinstance(host, string_types) or not host.startswith('file://'):
+        return None
+    netloc, _, path = host[7:].partition('/')
+    if netloc in ('', 'localhost'):  # file:///path or file://localhost/path
+        return '/' + path
+    return os.path.join(netloc, path)  # file://relative/path
+
+
+def _parse_host(host=None, port=None):
+    """Return the ``(host, port)`` to connect to for the given inputs
+    """
+    if host is None:
+        host = get_default_host()
+    if _local_root(host) is not None:
+        return host, None
+    if port is None:
+        try:
+            host, port = host.rsplit(':', 1)
+        except ValueError:
+            pass
+        else:
+            port = int(port)
+    return host, port
+
+
+def _split_hosts(host=None, port=None):
+    """Return the ``(host, port)`` of each replica for the given inputs
+
+    ``host`` may be a list of names, or a comma-separated string
+    """
+    if host is None:
+        host = get_default_host()
+    if isinstance(host, string_types):
+        host = host.split(',')
+    return [_parse_host(name.strip(), port) for name in host]
+
+
+_PROXY_EXPIRY = {}
+
+
 def validate_proxy(path):
     """Validate an X509 proxy certificate file.
 
@@ -70,7 +152,36 @@ def validate_proxy(path):
     ------
     RuntimeError
         if the certificate cannot be validated.
+
+    Notes
+    -----
+    The expiry time of a validated certificate is remembered until the
+    file is modified, so repeated calls for the same file only check
+    the time remaining.
     """
+    stat = os.stat(path)
+    version = (stat.st_mtime, stat.st_size)
+    try:
+        cached, expiryu = _PROXY_EXPIRY[path]
+    except KeyError:
+        cached = None
+    if cached != version:
+        expiryu = _proxy_expiry(path)
+        _PROXY_EXPIRY[path] = (version, expiryu)
+
+    # check time remaining
+    if expiryu < time.time():
+        raise RuntimeError('Required proxy credential has expired')
+
+    # return True to indicate validated proxy
+    return True
+
+
+def _proxy_expiry(path):
+    """Load an X509 proxy certificate file, and return its expiry time
+    """
+    from OpenSSL import crypto
+
     # load the proxy from path
     with open(path, 'rt') as f:
         cert = crypto.load_certificate(crypto.FILETYPE_PEM, f.read())
@@ -83,16 +194,10 @@ def validate_proxy(path):
         if cert.get_subject().CN.startswith('proxy'):
             raise RuntimeError('Could not find a valid proxy credential')
 
-    # check time remaining
     expiry = cert.get_notAfter()
     if isinstance(expiry, bytes):
         expiry = expiry.decode('utf-8')
-    expiryu = calendar.timegm(time.strptime(expiry, "%Y%m%d%H%M%SZ"))
-    if expiryu < time.time():
-        raise RuntimeError('Required proxy credential has expired')
-
-    # return True to indicate validated proxy
-    return True
+    return calendar.timegm(time.strptime(expiry, "%Y%m%d%H%M%SZ"))
 
 
 def find_credential():
@@ -167,7 +272,45 @@ def filename_metadata(filename):
     obs, desc, start, end = os.path.basename(filename).split('-')
     start = int(start)
     end = int(end.split('.')[0])
-    return obs, desc, segment(start, start+end)
+    return obs, desc, segments.segment(start, start+end)
+
+
+def _split_filename(url):
+    """Split a URL (or path) of a file named following LIGO-T050017
+
+    Returns
+    -------
+    prefix : `str`
+        everything up to (and including) the last ``/``
+
+    obs, tag : `str`
+        the observatory and description of the file
+
+    start, duration : `int`
+        the GPS start time and duration of the file
+
+    ext : `str`
+        the file extension, including the leading ``.``
+
+    exact : `bool`
+        `True` if ``url`` is rebuilt exactly by joining these parts,
+        i.e. the times are written as plain integers
+
+    Raises
+    ------
+    ValueError
+        if the file name does not follow LIGO-T050017
+    """
+    cut = url.rfind('/') + 1
+    try:
+        obs, tag, startstr, rest = url[cut:].split('-')
+        durstr, dot, ext = rest.partition('.')
+        start, duration = int(startstr), int(durstr)
+    except ValueError:
+        filename_metadata(url)  # raise the standard error
+        raise
+    exact = str(start) == startstr and str(duration) == durstr
+    return url[:cut], obs, tag, start, duration, dot + ext, exact
 
 
 def file_segment(filename):
@@ -184,3 +327,136 @@ def file_segment(filename):
         the ``[start, stop)`` GPS segment covered by the given file
     """
     return filename_metadata(filename)[2]
+
+
+def filename_metadata_array(filenames):
+    """Return metadata parsed from many filenames following LIGO-T050017
+
+    This is a columnar (batch) equivalent of :func:`filename_metadata`,
+    returning one array per metadata field, rather than one `tuple`
+    per file.
+
+    Parameters
+    ----------
+    filenames : `list` of `str`
+        the path names of the files
+
+    Returns
+    -------
+    obs : `list` of `str`
+        the observatory metadata for each file
+
+    tags : `list` of `str`
+        the unique file tags, in order of appearance
+
+    tagcodes : `array.array`
+        the index in ``tags`` of the tag for each file
+
+    start : `array.array`
+        the (signed 64-bit integer) GPS start time of each file
+
+    duration : `array.array`
+        the (signed 64-bit integer) duration of each file
+
+    Raises
+    ------
+    ValueError
+        if any of the filenames does not follow LIGO-T050017
+
+    Notes
+    -----
+    The arrays support the buffer protocol, so can be wrapped without
+    copying as `numpy` arrays, e.g. ``numpy.frombuffer(start, dtype='i8')``.
+    On python < 3.3, where a C ``long`` is only 32 bits, ``start`` and
+    ``duration`` are returned as `list` instead.
+
+    Examples
+    --------
+    >>> from gwdatafind.utils import filename_metadata_array
+    >>> obs, tags, codes, start, duration = filename_metadata_array([
+    ...     'file:///data/H-H1_R-1000000000-64.gwf',
+    ...     'file:///data/H-H1_R-1000000064-64.gwf',
+    ... ])
+    >>> start
+    array('q', [1000000000, 1000000064])
+    """
+    # strip the directory from each name
+    names = [name[name.rfind('/') + 1:] for name in filenames]
+
+    # check that every name has exactly four fields
+    counts = set(map(methodcaller('count', '-'), names))
+    if counts - {3}:
+        for name in names:  # find the first bad name and use it to error
+            filename_metadata(name)
+
+    # split all of the names at once, then slice out each column
+    fields = '-'.join(names).split('-') if names else []
+    obs = fields[0::4]
+    tag = fields[1::4]
+    start = _int64_array(list(map(int, fields[2::4])))
+    duration = _int64_array([
+        int(dur.partition('.')[0]) for dur in fields[3::4]])
+
+    # encode tags as integers
+    index = {}
+    codes = array('l', [index.setdefault(t, len(index)) for t in tag])
+    tags = sorted(index, key=index.__getitem__)
+
+    # share one copy of each observatory name
+    obsnames = {}
+    obs = [obsnames.setdefault(o, o) for o in obs]
+    return obs, tags, codes, start, duration
+
+
+# -- segment arithmetic -------------------------------------------------------
+
+def _missing_segments(starts, durations, gpsstart, gpsend):
+    """Return the parts of ``[gpsstart, gpsend)`` not covered by any file
+
+    This is equivalent to subtracting the coalesced list of file segments
+    from the query span with `ligo.segments`, but sorts and sweeps over
+    the (non-negative) durations without creating a `segment` per file.
+
+    Parameters
+    ----------
+    starts : `array.array`, `list` of `int`
+        the GPS start time of each file
+
+    durations : `array.array`, `list` of `int`
+        the duration of each file
+
+    gpsstart : `int`
+        the GPS start time of the span
+
+    gpsend : `int`
+        the GPS end time of the span
+
+    Returns
+    -------
+    missing : `ligo.segments.segmentlist`
+        the time-ordered list of gaps
+    """
+    if gpsend < gpsstart:  # like segment(), reorder the bounds
+        gpsstart, gpsend = gpsend, gpsstart
+
+    # only sort if we have to, results from the server are usually sorted
+    pairs = zip(starts, durations)
+    if list(starts) != sorted(starts):
+        pairs = sorted(pairs, key=itemgetter(0))
+
+    # sweep forwards, recording the gap before each file that starts
+    # beyond the end of everything seen so far
+    missing = segments.segmentlist()
+    cursor = gpsstart
+    for start, duration in pairs:
+        if start >= gpsend or cursor >= gpsend:
+            break
+        end = start + duration
+        if duration <= 0 or end <= cursor:
+            continue
+        if start > cursor:
+            missing.append(segments.segment(cursor, start))
+        cursor = end
+    if cursor < gpsend:
+        missing.append(segments.segment(cursor, gpsend))
+    return missing